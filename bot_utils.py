@@ -24,4 +24,10 @@ def owner_or_has_permissions(**perms):
         except Exception:
             return False
 
+    return app_commands.check(_predicate)
+
+def owner_only():
+    def _predicate(interaction: discord.Interaction):
+        return is_owner(interaction.user)
+
     return app_commands.check(_predicate)
\ No newline at end of file
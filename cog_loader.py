@@ -0,0 +1,292 @@
+"""Caricamento dei cogs a partire da `cogs_manifest.json`.
+
+Formato del manifest:
+    {
+      "cogs": [
+        {"name": "levels"},
+        {"name": "tts", "lazy": true},
+        {"name": "welcome", "enabled": false},
+        {"name": "boost", "after": ["levels"]}
+      ]
+    }
+
+- `name`: modulo dentro `cogs/`
+- `enabled`: false per non caricarlo (default true)
+- `lazy`: true per caricarlo solo dopo on_ready (default false)
+- `after`: cogs da caricare prima di questo; gli altri vengono caricati in
+  parallelo
+
+Per ogni cog vengono misurati il tempo di import delle sue dipendenze (gli
+import al primo livello del modulo, letti dal sorgente ed eseguiti in un thread,
+così le librerie pesanti non bloccano il loop e si importano in parallelo) e il
+tempo di `load_extension` (che esegue il modulo del cog una sola volta, poi
+setup + cog_load).
+Se il manifest manca o non è valido si torna alla vecchia scansione della
+cartella `cogs/`.
+"""
+
+import ast
+import asyncio
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_PATH = os.path.join(BASE_DIR, 'cogs_manifest.json')
+COGS_DIR = os.path.join(BASE_DIR, 'cogs')
+# Moduli helper che non sono cogs
+HELPER_MODULES = {'console_logger', 'metrics', '__init__'}
+
+
+def _top_level_imports(extension: str) -> List[str]:
+    """Moduli importati al primo livello del sorgente di `extension` (anche dentro try/if)."""
+    spec = importlib.util.find_spec(extension)
+    if spec is None or not spec.origin or not spec.origin.endswith('.py'):
+        return []
+    with open(spec.origin, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), spec.origin)
+    package = extension.rpartition('.')[0]
+    names: List[str] = []
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            try:
+                names.append(importlib.util.resolve_name('.' * node.level + (node.module or ''), package))
+            except (ImportError, ValueError):
+                continue
+        elif isinstance(node, (ast.Try, ast.If)):
+            nodes.extend(node.body)
+            nodes.extend(getattr(node, 'orelse', []))
+            for handler in getattr(node, 'handlers', []):
+                nodes.extend(handler.body)
+    return [n for n in names if n and n != extension]
+
+
+def _import_dependencies(extension: str):
+    """Importa le dipendenze del cog, non il cog: il modulo lo esegue solo load_extension."""
+    try:
+        names = _top_level_imports(extension)
+    except Exception:
+        # Sorgente illeggibile: l'errore vero lo riporta load_extension
+        return
+    for name in names:
+        if name in sys.modules:
+            continue
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+class CogSpec:
+    __slots__ = ('name', 'enabled', 'lazy', 'after')
+
+    def __init__(self, name: str, enabled: bool = True, lazy: bool = False, after: Optional[List[str]] = None):
+        self.name = name
+        self.enabled = enabled
+        self.lazy = lazy
+        self.after = list(after or [])
+
+    @property
+    def extension(self) -> str:
+        return f'cogs.{self.name}'
+
+
+class CogTiming:
+    __slots__ = ('name', 'lazy', 'status', 'import_ms', 'setup_ms', 'error')
+
+    def __init__(self, name: str, lazy: bool = False):
+        self.name = name
+        self.lazy = lazy
+        self.status = 'pending'
+        self.import_ms = 0.0
+        self.setup_ms = 0.0
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'status': self.status,
+            'lazy': self.lazy,
+            'import_ms': round(self.import_ms, 1),
+            'setup_ms': round(self.setup_ms, 1),
+            'error': self.error,
+        }
+
+
+def discover_extensions() -> List[CogSpec]:
+    """Vecchio comportamento: tutti i moduli in cogs/ che definiscono `setup`."""
+    specs = []
+    try:
+        for fname in sorted(os.listdir(COGS_DIR)):
+            if not fname.endswith('.py') or fname.startswith('_'):
+                continue
+            name = fname[:-3]
+            if name in HELPER_MODULES:
+                continue
+            try:
+                with open(os.path.join(COGS_DIR, fname), 'r', encoding='utf-8', errors='ignore') as f:
+                    src = f.read()
+                if 'async def setup' in src or 'def setup(' in src:
+                    specs.append(CogSpec(name))
+            except Exception:
+                continue
+    except Exception as e:
+        print(f"⚠️ Scansione cogs fallita: {e}")
+    return specs
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[List[CogSpec]]:
+    """Legge il manifest; None se manca o non è valido."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Manifest cogs non valido ({e}): uso la scansione della cartella")
+        return None
+    specs = []
+    seen = set()
+    for entry in raw.get('cogs', []) if isinstance(raw, dict) else []:
+        if isinstance(entry, str):
+            entry = {'name': entry}
+        if not isinstance(entry, dict) or not entry.get('name'):
+            continue
+        name = str(entry['name'])
+        if name in seen:
+            continue
+        seen.add(name)
+        specs.append(CogSpec(
+            name,
+            enabled=bool(entry.get('enabled', True)),
+            lazy=bool(entry.get('lazy', False)),
+            after=[str(a) for a in entry.get('after', [])],
+        ))
+    return specs
+
+
+def _waves(specs: List[CogSpec]) -> List[List[CogSpec]]:
+    """Raggruppa i cogs in ondate: ogni ondata dipende solo dalle precedenti."""
+    names = {s.name for s in specs}
+    done = set()
+    pending = list(specs)
+    waves = []
+    while pending:
+        wave = [s for s in pending if all(a in done or a not in names for a in s.after)]
+        if not wave:
+            # Dipendenze circolari: carica il resto in sequenza
+            print("⚠️ Dipendenze circolari nel manifest cogs: " + ", ".join(s.name for s in pending))
+            waves.extend([s] for s in pending)
+            break
+        waves.append(wave)
+        done.update(s.name for s in wave)
+        pending = [s for s in pending if s.name not in done]
+    return waves
+
+
+class CogLoader:
+    def __init__(self, bot, manifest_path: str = MANIFEST_PATH):
+        self.bot = bot
+        specs = load_manifest(manifest_path)
+        self.from_manifest = specs is not None
+        if specs is None:
+            specs = discover_extensions()
+        self.specs = specs
+        self.timings: Dict[str, CogTiming] = {}
+        self._lazy_done = False
+
+    @property
+    def eager(self) -> List[CogSpec]:
+        return [s for s in self.specs if s.enabled and not s.lazy]
+
+    @property
+    def lazy(self) -> List[CogSpec]:
+        return [s for s in self.specs if s.enabled and s.lazy]
+
+    async def _import(self, spec: CogSpec, timing: CogTiming):
+        start = time.perf_counter()
+        await asyncio.to_thread(_import_dependencies, spec.extension)
+        timing.import_ms = (time.perf_counter() - start) * 1000
+
+    async def _setup(self, spec: CogSpec, timing: CogTiming, failed: set):
+        missing = [a for a in spec.after if a in failed]
+        if missing:
+            timing.status = 'skipped'
+            timing.error = 'dipende da ' + ', '.join(missing)
+            failed.add(spec.name)
+            print(f"⏭️ Estensione saltata: {spec.extension} ({timing.error})")
+            return
+        start = time.perf_counter()
+        try:
+            await self.bot.load_extension(spec.extension)
+            timing.status = 'ok'
+            print(f"✅ Estensione caricata: {spec.extension}")
+        except Exception as e:
+            timing.status = 'error'
+            timing.error = str(e)
+            failed.add(spec.name)
+            print(f"❌ Errore nel caricare {spec.extension}: {e}")
+        timing.setup_ms = (time.perf_counter() - start) * 1000
+
+    async def _load(self, specs: List[CogSpec]) -> float:
+        start = time.perf_counter()
+        specs = [s for s in specs if s.extension not in self.bot.extensions]
+        for s in specs:
+            self.timings[s.name] = CogTiming(s.name, s.lazy)
+        # Import delle dipendenze in parallelo (thread), poi setup per ondate di dipendenze
+        await asyncio.gather(*(self._import(s, self.timings[s.name]) for s in specs))
+        # Include i cogs falliti in caricamenti precedenti (dipendenze dei lazy)
+        failed = {name for name, t in self.timings.items() if t.status in ('error', 'skipped')}
+        for wave in _waves(specs):
+            await asyncio.gather(*(self._setup(s, self.timings[s.name], failed) for s in wave))
+        return (time.perf_counter() - start) * 1000
+
+    async def load_initial(self):
+        """Carica i cogs non lazy (da setup_hook) e stampa il riepilogo."""
+        for s in self.specs:
+            if not s.enabled:
+                t = self.timings[s.name] = CogTiming(s.name, s.lazy)
+                t.status = 'disabled'
+        if not self.from_manifest:
+            print("ℹ️ Manifest cogs assente: carico tutti i cogs trovati in cogs/")
+        wall = await self._load(self.eager)
+        self.print_summary(wall, lazy=False)
+
+    async def load_lazy(self) -> bool:
+        """Carica i cogs lazy (una sola volta, dopo on_ready). True se ne ha caricati."""
+        if self._lazy_done:
+            return False
+        self._lazy_done = True
+        specs = self.lazy
+        if not specs:
+            return False
+        wall = await self._load(specs)
+        self.print_summary(wall, lazy=True)
+        return any(self.timings[s.name].status == 'ok' for s in specs)
+
+    def print_summary(self, wall_ms: float, lazy: bool):
+        try:
+            rows = [t for t in self.timings.values() if t.lazy == lazy and t.status != 'pending']
+            loaded = [t for t in rows if t.status == 'ok']
+            label = 'cogs lazy caricati' if lazy else 'Totale cogs caricati'
+            print(f"📦 {label}: {len(loaded)} in {wall_ms:.0f} ms")
+            for t in sorted(rows, key=lambda t: t.import_ms + t.setup_ms, reverse=True):
+                if t.status == 'disabled':
+                    print(f"   - {t.name:<16} disabilitato")
+                    continue
+                print(f"   - {t.name:<16} import {t.import_ms:7.1f} ms  setup {t.setup_ms:7.1f} ms  {t.status}")
+            pending_lazy = [s.name for s in self.lazy if s.name not in self.timings] if not lazy else []
+            if pending_lazy:
+                print("⏳ Caricati dopo on_ready: " + ", ".join(pending_lazy))
+        except Exception as e:
+            print(f"⚠️ Impossibile mostrare riepilogo cogs: {e}")
+
+    def describe(self) -> Dict[str, Dict[str, object]]:
+        return {name: t.as_dict() for name, t in self.timings.items()}
@@ -0,0 +1,211 @@
+"""Coda in background per gli annunci (level-up) con una coda per canale.
+
+Chi produce gli annunci chiama `Announcer.enqueue` e non aspetta nessuna
+chiamata a Discord: per ogni canale un task dedicato raccoglie gli avvisi
+arrivati entro una breve finestra, tiene per ogni utente solo l'ultimo
+livello e poi:
+
+- sotto `coalesce_threshold` avvisi li consegna uno per uno (`deliver_one`)
+- da `coalesce_threshold` in su li consegna in un unico messaggio (`deliver_many`)
+
+Tra due invii nello stesso canale passa almeno `min_interval_seconds`; se
+Discord risponde 429 il canale aspetta il `retry_after` indicato (o
+l'header Retry-After) e riprova. Oltre `max_queue` avvisi in attesa per canale
+i più vecchi vengono scartati.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+try:
+    import discord
+except Exception:  # pragma: no cover - solo per gli script senza discord.py
+    discord = None
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("announcer")
+
+DEFAULT_SETTINGS = {
+    'coalesce_threshold': 3,
+    'window_seconds': 2.0,
+    'min_interval_seconds': 1.0,
+    'max_queue': 200,
+    'max_retries': 3,
+}
+
+
+class Notice:
+    __slots__ = ('key', 'user_id', 'payload', 'queued_at')
+
+    def __init__(self, key: Hashable, user_id: int, payload: Any):
+        self.key = key
+        self.user_id = user_id
+        self.payload = payload
+        self.queued_at = time.monotonic()
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Secondi da aspettare se `exc` è un rate limit di Discord, altrimenti None."""
+    if discord is not None and isinstance(exc, getattr(discord, 'RateLimited', ())):
+        return float(exc.retry_after)
+    if getattr(exc, 'status', None) != 429:
+        return None
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    for name in ('Retry-After', 'X-RateLimit-Reset-After'):
+        try:
+            return float(headers[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 1.0
+
+
+def is_rate_limit(exc: BaseException) -> bool:
+    return _retry_after(exc) is not None
+
+
+class _ChannelQueue:
+    __slots__ = ('items', 'wakeup', 'task', 'next_send_at')
+
+    def __init__(self):
+        # user_id -> Notice: un utente con più level-up ravvicinati ha un solo annuncio
+        self.items: 'OrderedDict[int, Notice]' = OrderedDict()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.next_send_at = 0.0
+
+
+class Announcer:
+    def __init__(self, channel_for: Callable[[Hashable], Awaitable[Any]],
+                 deliver_one: Callable[[Any, Notice], Awaitable[None]],
+                 deliver_many: Callable[[Any, List[Notice]], Awaitable[None]],
+                 settings: Optional[Dict[str, Any]] = None):
+        self.channel_for = channel_for
+        self.deliver_one = deliver_one
+        self.deliver_many = deliver_many
+        self.configure(settings or {})
+        self._queues: Dict[Hashable, _ChannelQueue] = {}
+        self._closed = False
+        # Statistiche
+        self.queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    def configure(self, settings: Dict[str, Any]):
+        cfg = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.coalesce_threshold = max(2, int(cfg['coalesce_threshold']))
+        self.window = max(0.0, float(cfg['window_seconds']))
+        self.min_interval = max(0.0, float(cfg['min_interval_seconds']))
+        self.max_queue = max(1, int(cfg['max_queue']))
+        self.max_retries = max(0, int(cfg['max_retries']))
+
+    def enqueue(self, key: Hashable, user_id: int, payload: Any) -> bool:
+        """Accoda un avviso per il canale `key`; non blocca mai. False se l'announcer è chiuso."""
+        if self._closed:
+            return False
+        q = self._queues.get(key)
+        if q is None:
+            q = self._queues[key] = _ChannelQueue()
+        if user_id in q.items:
+            # Sostituisce l'avviso precedente dello stesso utente (livello più recente)
+            del q.items[user_id]
+            self.coalesced += 1
+        q.items[user_id] = Notice(key, user_id, payload)
+        self.queued += 1
+        while len(q.items) > self.max_queue:
+            q.items.popitem(last=False)
+            self.dropped += 1
+        q.wakeup.set()
+        if q.task is None or q.task.done():
+            q.task = asyncio.create_task(self._worker(key, q))
+        return True
+
+    async def _worker(self, key: Hashable, q: _ChannelQueue):
+        while not self._closed:
+            if not q.items:
+                q.wakeup.clear()
+                try:
+                    # Il task del canale si chiude dopo un minuto senza avvisi
+                    await asyncio.wait_for(q.wakeup.wait(), 60)
+                except asyncio.TimeoutError:
+                    if not q.items:
+                        break
+                    continue
+            # Finestra di raccolta: gli avvisi arrivati insieme finiscono nello stesso invio
+            if self.window:
+                await asyncio.sleep(self.window)
+            batch = list(q.items.values())
+            q.items.clear()
+            try:
+                channel = await self.channel_for(key)
+            except Exception:
+                channel = None
+            if channel is None:
+                self.dropped += len(batch)
+                continue
+            if len(batch) >= self.coalesce_threshold:
+                self.coalesced += len(batch) - 1
+                await self._send(q, self.deliver_many, channel, batch)
+            else:
+                for notice in batch:
+                    await self._send(q, self.deliver_one, channel, notice)
+        if self._queues.get(key) is q and not q.items:
+            del self._queues[key]
+
+    async def _send(self, q: _ChannelQueue, deliver, channel, arg):
+        for attempt in range(self.max_retries + 1):
+            wait = q.next_send_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await deliver(channel, arg)
+                self.sent += 1
+                q.next_send_at = time.monotonic() + self.min_interval
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                retry = _retry_after(e)
+                if retry is None or attempt == self.max_retries:
+                    self.failed += 1
+                    logger.debug(f'[Announcer] Invio non riuscito: {e}')
+                    return
+                self.rate_limited += 1
+                q.next_send_at = time.monotonic() + max(retry, self.min_interval)
+
+    def pending(self) -> int:
+        return sum(len(q.items) for q in self._queues.values())
+
+    async def close(self, drain_timeout: float = 0.0):
+        """Ferma i task dei canali; con `drain_timeout` lascia prima svuotare le code."""
+        if drain_timeout > 0 and self.pending():
+            deadline = time.monotonic() + drain_timeout
+            while self.pending() and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        self._closed = True
+        tasks = [q.task for q in self._queues.values() if q.task is not None and not q.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._queues.clear()
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'channels': len(self._queues),
+            'pending': self.pending(),
+            'queued': self.queued,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'rate_limited': self.rate_limited,
+            'failed': self.failed,
+        }
@@ -0,0 +1,213 @@
+"""Ricerca delle parole vietate dell'automod in un solo passaggio.
+
+Testo e parole passano dalla stessa `normalize`, che lavora per parole
+(separate da spazi):
+
+- casefold e NFKD (lettere a larghezza piena, legature, ecc.), poi
+  rimozione degli accenti e dei segni combinanti;
+- caratteri simili di altri alfabeti (cirillico, greco) → latino;
+- leetspeak (`0`→o, `4`/`@`→a, `$`→s, ...) solo nelle parole fatte in
+  prevalenza di lettere: `b4d` diventa `bad`, ma `455`, `8008` o `53x`
+  restano come sono;
+- punteggiatura e separatori dentro una parola si tolgono (`b.a.d` → `bad`);
+  tra parole diverse si uniscono solo le serie di caratteri singoli
+  (`b a d` → `bad`), mai parole intere (`ne grosso` resta di due parole).
+
+Il risultato è `" parola parola "`, con uno spazio attorno a ogni parola.
+Una parola vietata si cerca come sottostringa del testo normalizzato, come il
+vecchio `parola in testo`: `porco` trova anche `porcodio` e `stupido` anche
+`STUPIDOOO`, ma non può nascere dall'unione di due parole diverse. Con il
+prefisso `=` nel file (es. `"=ass"`) la parola conta solo se intera, per i
+termini corti che compaiono dentro parole innocue.
+
+`AutomodMatcher` compila le parole in un automa Aho-Corasick: una sola
+passata sul testo normalizzato trova tutte le occorrenze, con un costo che
+dipende dalla lunghezza del messaggio e non dal numero di parole. A parità di
+messaggio vince la regola che viene prima nel file, come nel vecchio ciclo.
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+LEET = {
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '6': 'g', '7': 't', '8': 'b', '9': 'g',
+    '@': 'a', '$': 's', '!': 'i', '|': 'i', '€': 'e', '£': 'l',
+}
+
+# Prefisso delle parole da trovare solo intere
+WHOLE_WORD_PREFIX = '='
+
+# Caratteri che sembrano lettere latine (dopo casefold)
+CONFUSABLES = {
+    # Cirillico
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p',
+    'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ї': 'i', 'ј': 'j', 'ѕ': 's', 'ԁ': 'd',
+    'ɡ': 'g', 'һ': 'h', 'ӏ': 'l', 'ԛ': 'q', 'ԝ': 'w',
+    # Greco
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p',
+    'τ': 't', 'υ': 'u', 'χ': 'x', 'ω': 'w', 'ς': 's',
+    # Altri
+    'ı': 'i', 'ł': 'l', 'ø': 'o', 'đ': 'd', 'ħ': 'h', 'ß': 'ss', 'æ': 'ae', 'œ': 'oe',
+}
+
+_LEET_TABLE = str.maketrans(LEET)
+_CONFUSABLES_TABLE = str.maketrans(CONFUSABLES)
+_LEET_CHARS = frozenset(LEET)
+# Dentro una parola: separatori (tutto tranne lettere, cifre e simboli leet)...
+_SEPARATORS = re.compile('[^\\w' + re.escape(''.join(ch for ch in LEET if not ch.isalnum())) + ']|_')
+# ...e, dopo il leetspeak, tutto ciò che non è lettera o cifra
+_NON_ALNUM = re.compile(r'[\W_]+')
+_EDGE_PUNCTUATION = '!|'
+
+
+def _word(core: str) -> str:
+    if core.isalpha():
+        return core
+    letters = sum(1 for ch in core if ch.isalpha())
+    if letters and letters >= sum(1 for ch in core if ch in _LEET_CHARS):
+        core = core.translate(_LEET_TABLE)
+    return _NON_ALNUM.sub('', core)
+
+
+def normalize(text: str) -> str:
+    """Forma canonica per il confronto con le parole vietate (`" parola parola "`)."""
+    text = text.casefold()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+        text = text.translate(_CONFUSABLES_TABLE)
+    words: List[str] = []
+    run: List[str] = []
+    for token in text.split():
+        # "!" e "|" ai bordi sono punteggiatura ("ciao!"), non una "i"
+        core = _SEPARATORS.sub('', token).strip(_EDGE_PUNCTUATION)
+        if not core:
+            # Solo punteggiatura (es. "b - a - d"): non interrompe una serie
+            continue
+        if len(core) == 1:
+            run.append(core)
+            continue
+        if run:
+            words.append(_word(''.join(run)))
+            run = []
+        words.append(_word(core))
+    if run:
+        words.append(_word(''.join(run)))
+    words = [w for w in words if w]
+    return ' ' + ' '.join(words) + ' ' if words else ''
+
+
+def split_term(term: str) -> Tuple[str, bool]:
+    """(parola senza prefisso, solo parola intera) per una voce del file."""
+    if term.startswith(WHOLE_WORD_PREFIX) and len(term) > len(WHOLE_WORD_PREFIX):
+        return term[len(WHOLE_WORD_PREFIX):], True
+    return term, False
+
+
+class Match(NamedTuple):
+    rule: int     # indice della regola (ordine del file)
+    term: str     # parola come scritta nel file
+    bucket: str   # durata come scritta nel file (es. "10m")
+    end: int      # posizione di fine nel testo normalizzato
+
+
+class AutomodMatcher:
+    """Automa Aho-Corasick su parole normalizzate.
+
+    `rules` è una sequenza di (parola, durata); l'indice della regola è la sua
+    posizione nella sequenza. Le parole con `WHOLE_WORD_PREFIX` diventano
+    pattern racchiusi tra spazi, quindi trovati solo come parola intera.
+    """
+
+    __slots__ = ('rules', 'patterns', '_goto', '_fail', '_out')
+
+    def __init__(self, rules: Sequence[Tuple[str, str]]):
+        self.rules: Tuple[Tuple[str, str], ...] = tuple(rules)
+        self.patterns: List[str] = []
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[int, ...]] = [()]
+        for index, (term, _bucket) in enumerate(self.rules):
+            bare, whole_word = split_term(term)
+            pattern = normalize(bare)
+            if not whole_word:
+                pattern = pattern.strip()
+            self.patterns.append(pattern)
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] += (index,)
+
+        # Link di fallimento in ampiezza; le uscite ereditano quelle del link
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] += out[fail[nxt]]
+                queue.append(nxt)
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+    def _scan(self, text: str) -> Iterable[Tuple[int, int]]:
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        state = 0
+        for pos, ch in enumerate(text):
+            edges = goto[state]
+            while ch not in edges and state:
+                state = fail[state]
+                edges = goto[state]
+            state = edges.get(ch, 0)
+            if out[state]:
+                for index in out[state]:
+                    yield index, pos + 1
+
+    def find_all(self, text: str, normalized: bool = False) -> List[Match]:
+        """Tutte le occorrenze (anche sovrapposte) nel testo."""
+        if not normalized:
+            text = normalize(text)
+        rules = self.rules
+        return [Match(i, rules[i][0], rules[i][1], end) for i, end in self._scan(text)]
+
+    def first(self, text: str, normalized: bool = False) -> Optional[Match]:
+        """La regola trovata che viene prima nel file, o None."""
+        if not self._goto[0]:
+            return None
+        if not normalized:
+            text = normalize(text)
+        best = None
+        for index, end in self._scan(text):
+            if best is None or index < best[0]:
+                best = (index, end)
+                if index == 0:
+                    break
+        if best is None:
+            return None
+        term, bucket = self.rules[best[0]]
+        return Match(best[0], term, bucket, best[1])
+
+    def describe(self) -> Dict[str, int]:
+        return {'terms': len(self.rules), 'states': len(self._goto)}
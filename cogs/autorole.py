@@ -1,24 +1,17 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import json
 import os
 
+from .json_store import store
+
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
 
 def _read_config():
-    try:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    return store.load(CONFIG_PATH, {})
 
 def _write_config(data: dict):
-    try:
-        with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
-    except Exception:
-        pass
+    store.put(CONFIG_PATH, data)
 
 class Autorole(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -1,25 +1,18 @@
 import discord
-import json
+import os
 from discord.ext import commands
 from discord import app_commands
 
+from .json_store import store
+
+# Stesso documento di autorole, verify, moderation e logs (un solo writer: lo store)
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
+
 def load_config():
-    try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-    except UnicodeDecodeError:
-        # Fallback: try reading as UTF-8 with errors replaced to avoid import crash
-        try:
-            with open("config.json", "r", encoding="utf-8", errors="replace") as f:
-                return json.load(f)
-        except Exception:
-            return {}
+    return store.load(CONFIG_PATH, {})
 
 def save_config(data):
-    with open("config.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    store.put(CONFIG_PATH, data)
 
 class Boost(commands.Cog):
     def __init__(self, bot):
@@ -0,0 +1,184 @@
+"""Snapshot compilati e immutabili della configurazione dei cog.
+
+I file JSON di configurazione contengono id come stringhe o liste miste,
+elenchi separati da virgole, durate come "10m"/"1h" e mappe ruolo→moltiplicatore.
+Invece di rileggerli e convertirli a ogni messaggio, ogni cog li compila una
+volta in uno snapshot (frozenset di int, moltiplicatori ordinati, durate già
+convertite); i percorsi caldi fanno solo intersezioni con gli id dei ruoli
+del membro.
+
+`CompiledConfig` tiene lo snapshot corrente: `refresh` compila la nuova
+config e solo se la compilazione riesce sostituisce il riferimento, così chi
+legge `current` vede sempre uno snapshot completo (il vecchio o il nuovo).
+"""
+
+import datetime
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, Generic, Optional, Tuple, TypeVar
+
+from .automod_matcher import AutomodMatcher, split_term
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("config_snapshots")
+
+T = TypeVar('T')
+
+DURATION_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+# ------------------ Conversioni ------------------
+def int_set(values: Any) -> FrozenSet[int]:
+    """Id da lista, stringa separata da virgole o valore singolo; ignora i valori non numerici."""
+    if values is None or values == '':
+        return frozenset()
+    if isinstance(values, str):
+        values = values.split(',')
+    elif not isinstance(values, (list, tuple, set, frozenset)):
+        values = (values,)
+    out = set()
+    for v in values:
+        try:
+            out.add(int(str(v).strip()))
+        except (TypeError, ValueError):
+            continue
+    return frozenset(out)
+
+
+def role_multipliers(mapping: Optional[Dict[Any, Any]]) -> Tuple[Tuple[int, float], ...]:
+    """(id ruolo, fattore) ordinati dal fattore più alto; scarta le voci non valide."""
+    out = []
+    for rid, factor in (mapping or {}).items():
+        try:
+            out.append((int(rid), float(factor)))
+        except (TypeError, ValueError):
+            continue
+    out.sort(key=lambda x: x[1], reverse=True)
+    return tuple(out)
+
+
+def best_multiplier(role_ids: FrozenSet[int], multipliers: Tuple[Tuple[int, float], ...]) -> float:
+    """Il fattore più alto tra i ruoli del membro (almeno 1.0)."""
+    for rid, factor in multipliers:
+        if factor <= 1.0:
+            break
+        if rid in role_ids:
+            return factor
+    return 1.0
+
+
+def parse_duration(text: Any) -> Optional[datetime.timedelta]:
+    """"30s", "10m", "2h", "7d" → timedelta; None se il formato non è valido."""
+    s = str(text or '').strip().lower()
+    unit = DURATION_UNITS.get(s[-1:])
+    if unit is None or not s[:-1].isdigit():
+        return None
+    return datetime.timedelta(**{unit: int(s[:-1])})
+
+
+# ------------------ Snapshot dei cog ------------------
+@dataclass(frozen=True)
+class LevelsSnapshot:
+    enabled: bool
+    text_excluded_channels: FrozenSet[int]
+    text_excluded_roles: FrozenSet[int]
+    text_multipliers: Tuple[Tuple[int, float], ...]
+    text_min: int
+    text_max: int
+    text_cooldown: int
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'LevelsSnapshot':
+        text = config.get('text_xp', {})
+        return cls(
+            enabled=bool(config.get('enabled', True)),
+            text_excluded_channels=int_set(text.get('excluded_channel_ids', [])),
+            text_excluded_roles=int_set(text.get('excluded_role_ids', [])),
+            text_multipliers=role_multipliers(text.get('multiplier_roles', {})),
+            text_min=int(text.get('min', 5)),
+            text_max=int(text.get('max', 15)),
+            text_cooldown=int(text.get('cooldown_seconds', 60)),
+        )
+
+    def text_multiplier(self, role_ids: FrozenSet[int]) -> float:
+        return best_multiplier(role_ids, self.text_multipliers)
+
+
+# Durata usata per le parole vietate con una chiave non valida (come prima)
+DEFAULT_WORD_DURATION = datetime.timedelta(days=20)
+
+
+@dataclass(frozen=True)
+class ModerationSnapshot:
+    staff_role_ids: FrozenSet[int]
+    exempt_role_ids: FrozenSet[int]
+    # (parola minuscola, parola originale senza prefisso "=", durata come scritta nel file, timedelta),
+    # nell'ordine del file
+    word_rules: Tuple[Tuple[str, str, str, datetime.timedelta], ...]
+    # Automa sulle stesse regole (indice = posizione in word_rules)
+    matcher: AutomodMatcher
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], words: Optional[Dict[str, Any]] = None) -> 'ModerationSnapshot':
+        mod = config.get('moderation', {})
+        rules = []
+        terms = []
+        for duration, entries in (words or {}).items():
+            if not isinstance(entries, list):
+                continue
+            delta = parse_duration(duration) or DEFAULT_WORD_DURATION
+            for word in entries:
+                if isinstance(word, str) and word:
+                    bare, _ = split_term(word)
+                    rules.append((bare.lower(), bare, duration, delta))
+                    terms.append((word, duration))
+        return cls(
+            staff_role_ids=int_set(mod.get('staff_role_id')),
+            exempt_role_ids=int_set(mod.get('no_automod')),
+            word_rules=tuple(rules),
+            matcher=AutomodMatcher(terms),
+        )
+
+    def is_staff(self, role_ids: FrozenSet[int]) -> bool:
+        return not self.staff_role_ids.isdisjoint(role_ids)
+
+    def is_exempt(self, role_ids: FrozenSet[int]) -> bool:
+        return not self.exempt_role_ids.isdisjoint(role_ids)
+
+
+@dataclass(frozen=True)
+class TicketsSnapshot:
+    staff_role_ids: FrozenSet[int]
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'TicketsSnapshot':
+        return cls(staff_role_ids=int_set(config.get('staff_role_id')))
+
+
+# ------------------ Contenitore ------------------
+class CompiledConfig(Generic[T]):
+    def __init__(self, compile_func: Callable[..., T], *sources: Any):
+        self._compile = compile_func
+        self.current: T = compile_func(*sources)
+        self.compiles = 1
+
+    def refresh(self, *sources: Any) -> T:
+        """Ricompila; se la nuova config non è valida resta lo snapshot precedente."""
+        try:
+            snapshot = self._compile(*sources)
+        except Exception as e:
+            logger.error(f'[Config] Compilazione non riuscita, resta la configurazione precedente: {e}')
+            return self.current
+        self.current = snapshot
+        self.compiles += 1
+        return snapshot
+
+
+def member_role_ids(member: Any) -> FrozenSet[int]:
+    """Id dei ruoli del membro senza risolvere gli oggetti Role (`_roles` contiene già gli id)."""
+    raw = getattr(member, '_roles', None)
+    if raw is not None:
+        return frozenset(raw)
+    return frozenset(r.id for r in getattr(member, 'roles', ()))
@@ -1,7 +1,15 @@
+import atexit
+import contextvars
+import json
 import logging
 import os
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
 import colorama
 from colorama import Fore, Style
 
@@ -37,33 +45,200 @@ def ds(self, message, *args, **kwargs):
 logging.Logger.ds = ds
 logging.DS = DS_LEVEL_NUM
 
+LEVEL_LABELS = {
+    logging.INFO: f"{Fore.GREEN}[INFO]{Style.RESET_ALL}",
+    logging.WARNING: f"{Fore.YELLOW}[WARNING]{Style.RESET_ALL}",
+    logging.ERROR: f"{Fore.RED}[ERROR]{Style.RESET_ALL}",
+    logging.DEBUG: f"{Fore.BLUE}[DEBUG]{Style.RESET_ALL}",
+    logging.CRITICAL: f"{Fore.RED}[FATAL]{Style.RESET_ALL}",
+    logging.TTS: f"{Fore.CYAN}[TTS]{Style.RESET_ALL}",
+    logging.EXCEPTION: f"{Fore.LIGHTYELLOW_EX}[EXCEPTION]{Style.RESET_ALL}",
+    logging.DS: f"{Fore.LIGHTCYAN_EX}[DS]{Style.RESET_ALL}",
+}
+
+# Cartella dei cogs: il nome del cog si ricava dal file che ha emesso il log
+COGS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Contesto dell'evento in corso (impostato per ogni listener, vedi bind_event_context)
+_log_context: contextvars.ContextVar[Optional[Dict[str, object]]] = contextvars.ContextVar('log_context', default=None)
+
+
 class ColoredFormatter(logging.Formatter):
     def format(self, record):
-        if record.levelno == logging.INFO:
-            record.levelname = f"{Fore.GREEN}[INFO]{Style.RESET_ALL}"
-        elif record.levelno == logging.WARNING:
-            record.levelname = f"{Fore.YELLOW}[WARNING]{Style.RESET_ALL}"
-        elif record.levelno == logging.ERROR:
-            record.levelname = f"{Fore.RED}[ERROR]{Style.RESET_ALL}"
-        elif record.levelno == logging.DEBUG:
-            record.levelname = f"{Fore.BLUE}[DEBUG]{Style.RESET_ALL}"
-        elif record.levelno == logging.CRITICAL:
-            record.levelname = f"{Fore.RED}[FATAL]{Style.RESET_ALL}"
-        elif record.levelno == logging.TTS:
-            record.levelname = f"{Fore.CYAN}[TTS]{Style.RESET_ALL}"
-        elif record.levelno == logging.EXCEPTION:
-            record.levelname = f"{Fore.LIGHTYELLOW_EX}[EXCEPTION]{Style.RESET_ALL}"
-        elif record.levelno == logging.DS:
-            record.levelname = f"{Fore.LIGHTCYAN_EX}[DS]{Style.RESET_ALL}"
-        else:
-            record.levelname = f"[{record.levelname}]"
+        # Il record è condiviso tra console e file: si lavora su una copia
+        record = logging.makeLogRecord(record.__dict__)
+        record.levelname = LEVEL_LABELS.get(record.levelno, f"[{record.levelname}]")
 
         if record.name == "valiance_bot":
             record.name = ""
 
         return super().format(record)
 
+
+class JsonLinesFormatter(logging.Formatter):
+    """Una riga JSON per record, con i campi strutturati guild/user/cog/event."""
+
+    FIELDS = ('cog', 'event', 'guild', 'user', 'channel', 'suppressed')
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def log_context(**fields):
+    """Aggiunge campi (guild, user, channel, event, ...) ai log del task corrente."""
+    current = _log_context.get()
+    merged = dict(current) if current else {}
+    merged.update({k: v for k, v in fields.items() if v is not None})
+    return _log_context.set(merged)
+
+
+def bind_event_context(event_name: str, args: tuple):
+    """Contesto di log per un listener: evento più guild/utente/canale del primo argomento."""
+    fields = {'event': event_name}
+    if args:
+        obj = args[0]
+        guild = getattr(obj, 'guild', None)
+        user = getattr(obj, 'author', None) or getattr(obj, 'user', None)
+        if user is None and guild is not None and hasattr(obj, 'joined_at'):
+            user = obj  # Member
+        channel = getattr(obj, 'channel', None)
+        # Payload raw: solo gli id
+        fields['guild'] = getattr(guild, 'id', None) or getattr(obj, 'guild_id', None)
+        fields['user'] = getattr(user, 'id', None) or getattr(obj, 'user_id', None)
+        fields['channel'] = getattr(channel, 'id', None) or getattr(obj, 'channel_id', None)
+    _log_context.set({k: v for k, v in fields.items() if v is not None})
+
+
+def _cog_name(pathname: str) -> Optional[str]:
+    if pathname and pathname.startswith(COGS_DIR):
+        return os.path.splitext(os.path.basename(pathname))[0]
+    return None
+
+
+class ContextFilter(logging.Filter):
+    """Copia sul record il contesto del task e il cog di origine (gira sul thread del loop)."""
+
+    def filter(self, record):
+        ctx = _log_context.get()
+        if ctx:
+            for key, value in ctx.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        if not hasattr(record, 'cog'):
+            record.cog = _cog_name(record.pathname)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per (logger, cog) e campionamento per i log rumorosi.
+
+    I record WARNING e superiori passano sempre. Quando un record passa dopo
+    alcuni scartati, il messaggio riporta quanti ne sono stati soppressi.
+    """
+
+    def __init__(self, rate: float, burst: int, sampling: Dict[str, float] = None):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.sampling = sampling or {}
+        self._buckets: Dict[Tuple[str, Optional[str]], list] = {}
+        # Si logga anche dai thread (asyncio.to_thread): i bucket sono condivisi
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            return self._take(record)
+
+    def _take(self, record):
+        cog = getattr(record, 'cog', None)
+        key = (record.name, cog)
+        bucket = self._buckets.get(key)
+        now = time.monotonic()
+        if bucket is None:
+            # [token disponibili, ultimo aggiornamento, scartati]
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+        ratio = self.sampling.get(cog) if cog else None
+        if ratio is None:
+            ratio = self.sampling.get(record.name)
+        if ratio is not None and random.random() >= ratio:
+            bucket[2] += 1
+            self.dropped += 1
+            return False
+        if self.rate > 0:
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                self.dropped += 1
+                return False
+            bucket[0] -= 1.0
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            record.msg = f"{record.getMessage()} [+{bucket[2]} messaggi soppressi]"
+            record.args = None
+            bucket[2] = 0
+        return True
+
+
+class LoopSafeQueueHandler(QueueHandler):
+    """Mette il record in coda senza formattarlo: la formattazione avviene nel listener."""
+
+    def prepare(self, record):
+        # Coda in-process: niente pickling, basta fissare il messaggio se ha argomenti
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def _parse_sampling(raw: str) -> Dict[str, float]:
+    """`LOG_SAMPLING="logs=0.1,discord.gateway=0.5"` -> {nome: frazione da tenere}."""
+    result = {}
+    for part in (raw or '').split(','):
+        name, _, value = part.partition('=')
+        try:
+            if name.strip():
+                result[name.strip()] = max(0.0, min(1.0, float(value)))
+        except ValueError:
+            continue
+    return result
+
+
+def _new_log_file(logs_dir: str, prefix: str, ext: str) -> str:
+    today = datetime.now().strftime('%Y-%m-%d')
+    log_file = os.path.join(logs_dir, f'{prefix}_{today}.{ext}')
+    counter = 1
+    while os.path.exists(log_file):
+        log_file = os.path.join(logs_dir, f'{prefix}_{today}_{counter}.{ext}')
+        counter += 1
+    return log_file
+
+
 def setup_logger():
+    """Configura il logger del bot.
+
+    I logger hanno un solo handler (`queue_handler`) che mette i record in coda;
+    console, file di testo e file JSON-lines (con LOG_JSON=1) sono gestiti dal
+    `QueueListener` in un thread separato, così i listener non fanno I/O sul loop.
+    """
+    global console_handler, file_handler, json_handler, queue_handler, queue_listener, rate_limit_filter
     logs_dir = 'logs'
     if not os.path.exists(logs_dir):
         os.makedirs(logs_dir)
@@ -78,38 +253,56 @@ def setup_logger():
     console_handler.setLevel(logging.DEBUG)
     console_handler.setFormatter(console_formatter)
 
-    today = datetime.now().strftime('%Y-%m-%d')
-    base_log_file = os.path.join(logs_dir, f'bot_{today}.log')
-    log_file = base_log_file
-    counter = 1
-    while os.path.exists(log_file):
-        log_file = os.path.join(logs_dir, f'bot_{today}_{counter}.log')
-        counter += 1
-    file_handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=5, encoding='utf-8')
+    file_handler = RotatingFileHandler(_new_log_file(logs_dir, 'bot', 'log'), maxBytes=5*1024*1024, backupCount=5, encoding='utf-8')
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(file_formatter)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    handlers = [console_handler, file_handler]
+    json_handler = None
+    if os.getenv('LOG_JSON', '').lower() in ('1', 'true', 'yes', 'on'):
+        json_handler = RotatingFileHandler(_new_log_file(logs_dir, 'bot', 'jsonl'), maxBytes=20*1024*1024, backupCount=5, encoding='utf-8')
+        json_handler.setLevel(logging.DEBUG)
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LoopSafeQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    rate_limit_filter = RateLimitFilter(
+        rate=float(os.getenv('LOG_RATE_LIMIT', '50')),
+        burst=int(os.getenv('LOG_RATE_BURST', '200')),
+        sampling=_parse_sampling(os.getenv('LOG_SAMPLING', '')),
+    )
+    queue_handler.addFilter(rate_limit_filter)
+
+    queue_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_listener.start()
+    atexit.register(stop_logging)
+
+    logger.addHandler(queue_handler)
 
     return logger
 
-logger = setup_logger()
 
-discord_logger = logging.getLogger("discord")
-discord_logger.setLevel(logging.INFO)
+def stop_logging():
+    """Svuota la coda e ferma il thread dei log (chiamata anche all'uscita)."""
+    listener = globals().get('queue_listener')
+    if listener is not None and getattr(listener, '_thread', None) is not None:
+        try:
+            listener.stop()
+        except Exception:
+            pass
 
-for handler in discord_logger.handlers[:]:
-    discord_logger.removeHandler(handler)
 
-console_formatter = ColoredFormatter('%(asctime)s %(levelname)s: %(name)s %(message)s', datefmt='[%H:%M:%S]')
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(console_formatter)
+console_handler: Optional[logging.Handler] = None
+file_handler: Optional[logging.Handler] = None
+json_handler: Optional[logging.Handler] = None
+queue_handler: Optional[QueueHandler] = None
+queue_listener: Optional[QueueListener] = None
+rate_limit_filter: Optional[RateLimitFilter] = None
 
-for h in logger.handlers:
-    discord_logger.addHandler(h)
+logger = setup_logger()
 
-discord_logger.addHandler(console_handler)
 
 class DiscordFilter(logging.Filter):
     """Converte i log INFO di qualsiasi logger Discord in DS."""
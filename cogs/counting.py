@@ -6,32 +6,24 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import copy
-import json
 import os
-import asyncio
 from datetime import timedelta
 from typing import Optional, Dict, Any
 
+from .json_store import store
+from .counting_actor import ERRORS, OK, ActorRegistry, Debouncer, EmojiCache, judge
+from .safe_eval import evaluate
+from .counting_stats import CountingStats, recent_users
+from .message_pipeline import MessageContext, get_pipeline
+from .member_resolver import resolver
+
 BASE_DIR = os.path.dirname(__file__)
 COUNTING_FILE = os.path.join(BASE_DIR, "..", "counting.json")
 LEADERBOARD_FILE = os.path.join(BASE_DIR, "..", "counting_leaderboard.json")
 CONFIG_FILE = os.path.join(BASE_DIR, "..", "counting_config.json")
-
-# Load/save helpers
-
-def load_json(path, default):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return default
-
-def save_json(path, data):
-    try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"[Counting] Error saving {path}: {e}")
+STATS_FILE = os.path.join(BASE_DIR, "..", "counting_stats.json")
+# Secondi tra un salvataggio e l'altro di stato e classifica
+PERSIST_SECONDS = float(os.getenv("COUNTING_PERSIST_SECONDS", "10"))
 
 DEFAULT_CONFIG = {
     "log_channel_id": None,
@@ -54,16 +46,23 @@ class Counting(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.data: Dict[str, Any] = load_json(COUNTING_FILE, {})
-        self.leaderboard = load_json(LEADERBOARD_FILE, {})
-        self.config = load_json(CONFIG_FILE, copy.deepcopy(DEFAULT_CONFIG))
+        self.data: Dict[str, Any] = store.load(COUNTING_FILE, {})
+        self.leaderboard = store.load(LEADERBOARD_FILE, {})
+        self.config = store.load(CONFIG_FILE, copy.deepcopy(DEFAULT_CONFIG))
+        # Un attore per canale esegue in ordine le azioni su Discord dopo il verdetto
+        self.actors = ActorRegistry()
+        self.emojis = EmojiCache()
+        self._dirty_files = set()
+        self._persist = Debouncer(PERSIST_SECONDS, self._persist_now)
+        self.stats = CountingStats(STATS_FILE)
+        self.stats.restore()
         removed = False
         for legacy_key in ("milestones", "milestone_emoji", "milestone_emojis"):
             if legacy_key in self.config:
                 self.config.pop(legacy_key, None)
                 removed = True
         if removed:
-            save_json(CONFIG_FILE, self.config)
+            store.put(CONFIG_FILE, self.config)
 
         cleaned_data = False
         for guild_conf in self.data.values():
@@ -73,15 +72,15 @@ class Counting(commands.Cog):
                     channel_conf.pop("milestones", None)
                     cleaned_data = True
         if cleaned_data:
-            save_json(COUNTING_FILE, self.data)
+            store.put(COUNTING_FILE, self.data)
 
     def _ensure_guild(self, guild_id: str):
         if guild_id not in self.data:
             self.data[guild_id] = {"channels": {}}
+            store.mark_dirty(COUNTING_FILE)
         if guild_id not in self.leaderboard:
             self.leaderboard[guild_id] = {}
-        save_json(COUNTING_FILE, self.data)
-        save_json(LEADERBOARD_FILE, self.leaderboard)
+            store.mark_dirty(LEADERBOARD_FILE)
 
     def get_channel_conf(self, guild_id: str, channel_id: str):
         return self.data.get(guild_id, {}).get("channels", {}).get(channel_id)
@@ -90,34 +89,30 @@ class Counting(commands.Cog):
         self._ensure_guild(guild_id)
         conf.pop("milestones", None)
         self.data[guild_id]["channels"][channel_id] = conf
-        save_json(COUNTING_FILE, self.data)
+        store.put(COUNTING_FILE, self.data)
 
     def inc_leaderboard(self, guild_id: str, user_id: str, amount: int = 1):
         self._ensure_guild(guild_id)
         self.leaderboard[guild_id][user_id] = self.leaderboard[guild_id].get(user_id, 0) + amount
-        save_json(LEADERBOARD_FILE, self.leaderboard)
+        self._schedule_persist(LEADERBOARD_FILE)
+
+    # Lo stato dei canali cambia in memoria a ogni numero; su disco va al più ogni PERSIST_SECONDS
+    def _schedule_persist(self, path: str):
+        self._dirty_files.add(path)
+        self._persist.touch()
+
+    def _persist_now(self):
+        dirty, self._dirty_files = self._dirty_files, set()
+        for path in dirty:
+            store.mark_dirty(path)
+        self.stats.save()
 
     def _get_emoji(self, guild: discord.Guild, key: str):
-        val = self.config.get(key)
-        if not val:
-            return None
-        # If stored as int ID or numeric string
-        try:
-            if isinstance(val, int) or (isinstance(val, str) and val.isdigit()):
-                e = guild.get_emoji(int(val))
-                return e or None
-        except Exception:
-            pass
-        # If stored as markup like <a:name:id> or <:name:id>
-        if isinstance(val, str) and val.startswith("<") and ":" in val:
-            try:
-                parts = val.split(":")
-                _id = int(parts[-1].rstrip(">"))
-                e = guild.get_emoji(_id)
-                return e or None
-            except Exception:
-                return val  # fallback to raw string
-        return val
+        return self.emojis.get(guild, self.config, key)
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild: discord.Guild, before, after):
+        self.emojis.invalidate(guild.id)
 
     # --- CONFIG EMOJI COMMAND ---
     @counting_group.command(name="emoji")
@@ -142,12 +137,14 @@ class Counting(commands.Cog):
             # Configura un'emoji personalizzata per il numero speciale indicato
             special = self.config.setdefault("special_numbers", {})
             special[type] = emoji_id
-            save_json(CONFIG_FILE, self.config)
+            store.put(CONFIG_FILE, self.config)
+            self.emojis.invalidate()
             return await interaction.response.send_message(f"Emoji per il numero speciale {type} impostata!", ephemeral=True)
 
         key = f"{type}_emoji"
         self.config[key] = emoji_id
-        save_json(CONFIG_FILE, self.config)
+        store.put(CONFIG_FILE, self.config)
+        self.emojis.invalidate()
         await interaction.response.send_message(f"Emoji {type} impostata!")
 
     # --- MAIN SET COMMAND ---
@@ -215,7 +212,7 @@ class Counting(commands.Cog):
             minutes = 10080
 
         self.config["timeout_minutes"] = int(minutes)
-        save_json(CONFIG_FILE, self.config)
+        store.put(CONFIG_FILE, self.config)
 
         text = "disabilitato" if minutes == 0 else f"{minutes} minuti"
         try:
@@ -226,51 +223,67 @@ class Counting(commands.Cog):
             except Exception:
                 pass
 
-    # MAIN COUNTING HANDLER
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot or message.guild is None:
+    async def cog_load(self):
+        get_pipeline(self.bot).register("counting", self._message_stage, order=20)
+
+    async def cog_unload(self):
+        get_pipeline(self.bot).unregister("counting")
+        await self.actors.close()
+        self._persist.flush()
+        self.stats.save()
+
+    # MAIN COUNTING HANDLER (stadio della pipeline messaggi)
+    async def _message_stage(self, ctx: MessageContext):
+        # I messaggi eliminati per errore fermano la pipeline (niente XP)
+        if ctx.guild_id is None:
             return
+        message = ctx.message
 
-        guild_id = str(message.guild.id)
+        guild_id = ctx.guild_key
         confs = self.data.get(guild_id, {}).get("channels", {})
         if not confs:
             return
 
-        chan_conf = confs.get(str(message.channel.id))
+        chan_conf = confs.get(ctx.channel_key)
         if not chan_conf:
             return
 
         raw = message.content.strip()
-
         try:
             num = int(raw)
         except:
-            try:
-                num = int(eval(raw, {"__builtins__": None}, {}))
-            except:
-                # Se il canale permette chat, ignora i messaggi non numerici
-                if chan_conf.get("allow_chat", True):
-                    return
-                # Altrimenti, considera errore come prima
-                await self._delete_and_error(message, chan_conf, guild_id, "invalid")
-                return
-
-        expected = chan_conf["last"] + 1
-
-        if message.author.id == chan_conf.get("last_user"):
-            await self._delete_and_error(message, chan_conf, guild_id, "same_user")
+            # Espressioni aritmetiche (es. "2*5"), con limiti su cifre ed esponenti
+            num = evaluate(raw)
+
+        # Verdetto e aggiornamento dello stato senza await in mezzo: i messaggi di una
+        # raffica vengono giudicati nell'ordine di arrivo, ognuno sullo stato lasciato
+        # dal precedente. Le chiamate a Discord vanno poi in coda all'attore del canale.
+        actor = self.actors.get((guild_id, ctx.channel_key))
+        actor.judged += 1
+        verdict = judge(chan_conf, message.author.id, num)
+
+        if verdict in ERRORS:
+            ctx.stop("counting")
+            expected = chan_conf["last"] + 1
+            chan_conf["last"] = 0
+            chan_conf["last_user"] = None
+            self.stats.record_reset((guild_id, ctx.channel_key), message.author.id)
+            self._schedule_persist(COUNTING_FILE)
+            actor.tell(lambda: self._delete_and_error(message, chan_conf, guild_id, verdict, expected))
             return
-
-        if num != expected:
-            await self._delete_and_error(message, chan_conf, guild_id, "wrong_number")
+        if verdict != OK:
             return
 
         chan_conf["last"] = num
         chan_conf["last_user"] = message.author.id
+        self.stats.record_count((guild_id, ctx.channel_key), num, message.author.id)
+        self._schedule_persist(COUNTING_FILE)
+        self.inc_leaderboard(guild_id, ctx.author_key)
+        actor.tell(lambda: self._confirm(message, chan_conf, num))
+
+    async def _confirm(self, message: discord.Message, chan_conf: dict, num: int):
+        # Un numero corretto lascia nel canale l'ultimo messaggio d'errore
         chan_conf.pop("last_error_message_id", None)
-        self.set_channel_conf(guild_id, str(message.channel.id), chan_conf)
-        self.inc_leaderboard(guild_id, str(message.author.id))
 
         emoji = self._get_emoji(message.guild, "success_emoji") or "✅"
         try:
@@ -278,25 +291,23 @@ class Counting(commands.Cog):
         except:
             pass
 
-        special = self.config.get("special_numbers", {})
-        if str(num) in special and special[str(num)]:
-            sp = message.guild.get_emoji(special[str(num)])
-            if sp:
-                try:
-                    await message.channel.send(f"{sp} Numero speciale **{num}** raggiunto da {message.author.mention}!")
-                except:
-                    pass
+        sp = self.emojis.special(message.guild, self.config, num)
+        if sp:
+            try:
+                await message.channel.send(f"{sp} Numero speciale **{num}** raggiunto da {message.author.mention}!")
+            except:
+                pass
 
-    async def _delete_and_error(self, message: discord.Message, chan_conf: dict, guild_id: str, reason: str):
+    async def _delete_and_error(self, message: discord.Message, chan_conf: dict, guild_id: str, reason: str,
+                                expected: int):
+        # Lo stato del canale è già stato resettato dal verdetto; qui solo le azioni su Discord
         try:
             await message.delete()
         except Exception:
             pass
 
-        expected = chan_conf.get("last", 0) + 1
-
         # Remove previous bot error message if it exists to avoid duplicates
-        previous_error_id = chan_conf.get("last_error_message_id")
+        previous_error_id = chan_conf.pop("last_error_message_id", None)
         if previous_error_id:
             try:
                 prev_msg = await message.channel.fetch_message(previous_error_id)
@@ -304,11 +315,6 @@ class Counting(commands.Cog):
             except Exception:
                 pass
 
-        # Reset counter state (will be persisted after sending feedback)
-        chan_conf["last"] = 0
-        chan_conf["last_user"] = None
-        chan_conf.pop("last_error_message_id", None)
-
         # Build feedback message
         emoji = self._get_emoji(message.guild, "error_emoji") or "❌"
         base_messages = {
@@ -330,9 +336,7 @@ class Counting(commands.Cog):
 
         if sent_message:
             chan_conf["last_error_message_id"] = sent_message.id
-
-        # Persist updated configuration
-        self.set_channel_conf(guild_id, str(message.channel.id), chan_conf)
+            self._schedule_persist(COUNTING_FILE)
 
         # Apply timeout to offender (requires Moderate Members permission)
         try:
@@ -348,6 +352,37 @@ class Counting(commands.Cog):
                 # Ignore if lacking permissions or API failure
                 pass
 
+    @counting_group.command(name="stats", description="Statistiche del counting di un canale")
+    @app_commands.describe(channel="Canale (default: questo)")
+    async def counting_stats(self, interaction: discord.Interaction, channel: Optional[discord.TextChannel] = None):
+        if channel is None:
+            channel = interaction.channel
+        stats = self.stats.get((str(interaction.guild.id), str(channel.id)))
+        if stats is None or not (stats.total or stats.resets):
+            return await interaction.response.send_message("Nessuna statistica per questo canale.", ephemeral=True)
+
+        await interaction.response.defer()
+        names = await resolver.names(interaction.guild, recent_users(stats))
+        e = discord.Embed(title=f"📈 Counting Stats — #{channel.name}", color=0x14ff72)
+        record = f"**{stats.high_score}**"
+        if stats.high_score_at:
+            record += f" (<t:{int(stats.high_score_at)}:R>)"
+        e.add_field(name="Record", value=record)
+        e.add_field(name="Conteggi totali", value=stats.total)
+        e.add_field(name="Ultima ora / 24h", value=f"{stats.last_hours(1)} / {stats.last_hours(24)}")
+        resets = str(stats.resets)
+        if stats.top_resetter:
+            uid, n = stats.top_resetter
+            resets += f"\nPiù reset: {names[uid]} ({n})"
+        e.add_field(name="Reset", value=resets)
+        if stats.best_streak:
+            uid, n = stats.best_streak
+            e.add_field(name="Serie più lunga", value=f"{names[uid]} — {n} di fila")
+        if stats.history:
+            lines = [f"**{num}** {names[uid]} <t:{int(ts)}:R>" for num, uid, ts in reversed(stats.history)]
+            e.add_field(name="Ultimi conteggi", value="\n".join(lines), inline=False)
+        await interaction.followup.send(embed=e)
+
     @counting_group.command(name="leaderboard", description="Mostra la classifica del counting")
     @app_commands.describe(page="Numero pagina (da 1)")
     async def counting_leaderboard(self, interaction: discord.Interaction, page: int = 1):
@@ -366,15 +401,9 @@ class Counting(commands.Cog):
             return
         lines = []
         rank_start = offset + 1
+        names = await resolver.names(interaction.guild, (uid for uid, _ in slice_items))
         for i, (uid, count) in enumerate(slice_items, start=rank_start):
-            member = interaction.guild.get_member(uid)
-            if not member:
-                try:
-                    member = await interaction.guild.fetch_member(uid)
-                except Exception:
-                    member = None
-            mention = member.mention if member else uid
-            lines.append(f"**#{i}** {mention} — {count} messaggi corretti")
+            lines.append(f"**#{i}** {names[uid]} — {count} messaggi corretti")
         embed = discord.Embed(title="Counting Leaderboard", description="\n".join(lines), color=0x14ff72)
         embed.set_footer(text=f"Pagina {page}")
         await interaction.followup.send(embed=embed)
@@ -0,0 +1,219 @@
+"""Attori per i canali di counting.
+
+Ogni canale ha il suo `ChannelActor`:
+
+- il verdetto di un messaggio (numero giusto, stesso utente, numero sbagliato,
+  non valido) si calcola in modo sincrono sullo stato in memoria, senza await
+  tra lettura e aggiornamento: i messaggi vengono giudicati esattamente
+  nell'ordine di arrivo anche durante le raffiche;
+- le azioni su Discord conseguenti (reazione, messaggio d'errore, timeout)
+  finiscono nella coda ordinata dell'attore e vengono eseguite una alla volta
+  dal suo task, così il giudizio dei messaggi successivi non le aspetta;
+- lo stato e la classifica si salvano con `Debouncer`: al più un salvataggio
+  ogni `delay` secondi, più uno finale allo spegnimento.
+
+`EmojiCache` risolve le emoji configurate una volta per guild e le ricalcola
+solo quando la configurazione (o l'elenco delle emoji del server) cambia.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+try:
+    import discord
+except Exception:  # pragma: no cover - solo per gli script senza discord.py
+    discord = None
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("counting_actor")
+
+Effect = Callable[[], Awaitable[Any]]
+
+# Verdetti
+OK = 'ok'
+IGNORED = 'ignored'
+SAME_USER = 'same_user'
+WRONG_NUMBER = 'wrong_number'
+INVALID = 'invalid'
+ERRORS = frozenset((SAME_USER, WRONG_NUMBER, INVALID))
+
+
+def judge(conf: Dict[str, Any], author_id: int, number: Optional[int]) -> str:
+    """Verdetto per `number` (None se il messaggio non è un numero) sullo stato `conf`."""
+    if number is None:
+        return IGNORED if conf.get('allow_chat', True) else INVALID
+    if author_id == conf.get('last_user'):
+        return SAME_USER
+    if number != conf['last'] + 1:
+        return WRONG_NUMBER
+    return OK
+
+
+class ChannelActor:
+    def __init__(self, key: Hashable, idle_timeout: float = 60.0):
+        self.key = key
+        self.idle_timeout = idle_timeout
+        self._effects: Deque[Effect] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.judged = 0
+        self.effects_run = 0
+
+    def tell(self, effect: Effect):
+        """Accoda un'azione; le azioni dello stesso canale girano una alla volta, in ordine."""
+        self._effects.append(effect)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    @property
+    def pending(self) -> int:
+        return len(self._effects)
+
+    async def _run(self):
+        while True:
+            if not self._effects:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if not self._effects:
+                        return
+                continue
+            effect = self._effects.popleft()
+            try:
+                await effect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f'[Counting] Azione fallita nel canale {self.key}: {e}')
+            self.effects_run += 1
+
+    async def drain(self, timeout: float):
+        """Aspetta (al più `timeout` secondi) che la coda si svuoti, poi ferma il task."""
+        if self._task is not None and not self._task.done():
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while self._effects and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._effects.clear()
+
+
+class ActorRegistry:
+    def __init__(self, idle_timeout: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self.actors: Dict[Hashable, ChannelActor] = {}
+
+    def get(self, key: Hashable) -> ChannelActor:
+        actor = self.actors.get(key)
+        if actor is None:
+            actor = self.actors[key] = ChannelActor(key, self.idle_timeout)
+        return actor
+
+    async def close(self, timeout: float = 5.0):
+        actors = list(self.actors.values())
+        self.actors.clear()
+        await asyncio.gather(*(a.drain(timeout) for a in actors), return_exceptions=True)
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'actors': len(self.actors),
+            'pending_effects': sum(a.pending for a in self.actors.values()),
+            'judged': sum(a.judged for a in self.actors.values()),
+            'effects_run': sum(a.effects_run for a in self.actors.values()),
+        }
+
+
+class Debouncer:
+    """Chiama `callback` al più una volta ogni `delay` secondi dopo un `touch`."""
+
+    def __init__(self, delay: float, callback: Callable[[], Any]):
+        self.delay = delay
+        self.callback = callback
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self.fired = 0
+
+    def touch(self):
+        if self._handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.callback()
+            return
+        self._handle = loop.call_later(self.delay, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        self.fired += 1
+        try:
+            self.callback()
+        except Exception as e:
+            logger.error(f'[Counting] Salvataggio fallito: {e}')
+
+    def flush(self):
+        """Esegue subito il salvataggio in attesa (se c'è)."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._fire()
+
+
+def resolve_emoji(guild, val: Any):
+    """Emoji del server per un id o un markup <a:nome:id>; altrimenti il valore così com'è."""
+    if not val:
+        return None
+    # Id intero o stringa numerica
+    try:
+        if isinstance(val, int) or (isinstance(val, str) and val.isdigit()):
+            return guild.get_emoji(int(val)) or None
+    except Exception:
+        pass
+    # Markup come <a:name:id> o <:name:id>
+    if isinstance(val, str) and val.startswith("<") and ":" in val:
+        try:
+            return guild.get_emoji(int(val.split(":")[-1].rstrip(">"))) or None
+        except Exception:
+            return val
+    return val
+
+
+class EmojiCache:
+    def __init__(self):
+        self._cache: Dict[Tuple[int, str], Any] = {}
+        self.resolved = 0
+
+    def invalidate(self, guild_id: Optional[int] = None):
+        if guild_id is None:
+            self._cache.clear()
+        else:
+            for key in [k for k in self._cache if k[0] == guild_id]:
+                del self._cache[key]
+
+    def get(self, guild, config: Dict[str, Any], key: str):
+        """Emoji per la chiave di config `key` (es. "success_emoji")."""
+        cache_key = (guild.id, key)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = resolve_emoji(guild, config.get(key))
+            self.resolved += 1
+        return self._cache[cache_key]
+
+    def special(self, guild, config: Dict[str, Any], number: int):
+        """Emoji del numero speciale `number`, solo se è un'emoji del server."""
+        cache_key = (guild.id, f'special:{number}')
+        if cache_key not in self._cache:
+            val = config.get('special_numbers', {}).get(str(number))
+            emoji = resolve_emoji(guild, val) if val else None
+            if discord is not None and not isinstance(emoji, discord.Emoji):
+                emoji = None
+            self._cache[cache_key] = emoji
+            self.resolved += 1
+        return self._cache[cache_key]
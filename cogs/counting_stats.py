@@ -0,0 +1,194 @@
+"""Statistiche per canale del counting, aggiornate a ogni conteggio.
+
+Per ogni canale `ChannelStats` tiene:
+
+- record (numero più alto raggiunto) e conteggi totali;
+- numero di reset, reset per utente e chi ne ha causati di più;
+- serie personale: conteggi corretti di fila di un utente senza suoi errori,
+  con la serie più lunga di sempre;
+- conteggi per ora in un anello di `HOURS` contatori (`array` compatto),
+  azzerato pigramente come le finestre XP;
+- gli ultimi `HISTORY` conteggi in una `deque` limitata.
+
+Ogni aggiornamento è O(1) e i massimi (record, serie, peggior resetter) si
+aggiornano al momento, così `/counting stats` legge solo valori già pronti.
+"""
+
+import time
+from array import array
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+from .json_store import store
+
+HOURS = 24
+HISTORY = 10
+
+ChannelKey = Tuple[str, str]
+
+
+def hour_of(ts: Optional[float] = None) -> int:
+    return int((time.time() if ts is None else ts) // 3600)
+
+
+class ChannelStats:
+    __slots__ = ('high_score', 'high_score_at', 'total', 'resets', 'reset_by', 'top_resetter',
+                 'streaks', 'best_streak', 'hourly', 'last_hour', 'history')
+
+    def __init__(self):
+        self.high_score = 0
+        self.high_score_at = 0.0
+        self.total = 0
+        self.resets = 0
+        self.reset_by: Dict[int, int] = {}
+        # (user_id, reset causati)
+        self.top_resetter: Optional[Tuple[int, int]] = None
+        # Serie in corso per utente e la migliore di sempre (user_id, lunghezza)
+        self.streaks: Dict[int, int] = {}
+        self.best_streak: Optional[Tuple[int, int]] = None
+        self.hourly = array('L', [0]) * HOURS
+        self.last_hour = 0
+        # (numero, user_id, timestamp)
+        self.history: Deque[Tuple[int, int, float]] = deque(maxlen=HISTORY)
+
+    def _advance(self, hour: int):
+        if hour > self.last_hour:
+            for h in range(max(self.last_hour + 1, hour - HOURS + 1), hour + 1):
+                self.hourly[h % HOURS] = 0
+            self.last_hour = hour
+
+    def count(self, number: int, user_id: int, ts: float):
+        self.total += 1
+        if number > self.high_score:
+            self.high_score = number
+            self.high_score_at = ts
+        streak = self.streaks.get(user_id, 0) + 1
+        self.streaks[user_id] = streak
+        if self.best_streak is None or streak > self.best_streak[1]:
+            self.best_streak = (user_id, streak)
+        hour = hour_of(ts)
+        self._advance(hour)
+        if hour > self.last_hour - HOURS:
+            self.hourly[hour % HOURS] += 1
+        self.history.append((number, user_id, ts))
+
+    def reset(self, user_id: int):
+        self.resets += 1
+        n = self.reset_by.get(user_id, 0) + 1
+        self.reset_by[user_id] = n
+        if self.top_resetter is None or n > self.top_resetter[1]:
+            self.top_resetter = (user_id, n)
+        self.streaks.pop(user_id, None)
+
+    def last_hours(self, hours: int, now: Optional[float] = None) -> int:
+        """Conteggi nelle ultime `hours` ore (ora corrente compresa), al più HOURS."""
+        current = hour_of(now)
+        first = max(current - min(hours, HOURS) + 1, self.last_hour - HOURS + 1)
+        return sum(self.hourly[h % HOURS] for h in range(first, min(current, self.last_hour) + 1))
+
+    # ------------------ Snapshot ------------------
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'high_score': self.high_score,
+            'high_score_at': self.high_score_at,
+            'total': self.total,
+            'resets': self.resets,
+            'reset_by': {str(k): v for k, v in self.reset_by.items()},
+            'streaks': {str(k): v for k, v in self.streaks.items()},
+            'best_streak': list(self.best_streak) if self.best_streak else None,
+            'hourly': self.hourly.tolist(),
+            'last_hour': self.last_hour,
+            'history': [list(h) for h in self.history],
+        }
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> 'ChannelStats':
+        stats = cls()
+        stats.high_score = int(raw.get('high_score', 0))
+        stats.high_score_at = float(raw.get('high_score_at', 0.0))
+        stats.total = int(raw.get('total', 0))
+        stats.resets = int(raw.get('resets', 0))
+        stats.reset_by = {int(k): int(v) for k, v in raw.get('reset_by', {}).items()}
+        if stats.reset_by:
+            stats.top_resetter = max(stats.reset_by.items(), key=lambda kv: kv[1])
+        stats.streaks = {int(k): int(v) for k, v in raw.get('streaks', {}).items()}
+        best = raw.get('best_streak')
+        stats.best_streak = (int(best[0]), int(best[1])) if best else None
+        hourly = raw.get('hourly') or []
+        if len(hourly) == HOURS:
+            stats.hourly = array('L', hourly)
+            stats.last_hour = int(raw.get('last_hour', 0))
+        for number, user_id, ts in raw.get('history', [])[-HISTORY:]:
+            stats.history.append((int(number), int(user_id), float(ts)))
+        return stats
+
+
+class CountingStats:
+    def __init__(self, snapshot_path: Optional[str] = None):
+        self.snapshot_path = snapshot_path
+        self.channels: Dict[Hashable, ChannelStats] = {}
+        self.dirty = False
+
+    def channel(self, key: ChannelKey) -> ChannelStats:
+        stats = self.channels.get(key)
+        if stats is None:
+            stats = self.channels[key] = ChannelStats()
+        return stats
+
+    def get(self, key: ChannelKey) -> Optional[ChannelStats]:
+        return self.channels.get(key)
+
+    def record_count(self, key: ChannelKey, number: int, user_id: int, ts: Optional[float] = None):
+        self.channel(key).count(number, user_id, time.time() if ts is None else ts)
+        self.dirty = True
+
+    def record_reset(self, key: ChannelKey, user_id: int):
+        self.channel(key).reset(user_id)
+        self.dirty = True
+
+    def forget(self, key: ChannelKey):
+        if self.channels.pop(key, None) is not None:
+            self.dirty = True
+
+    # ------------------ Snapshot ------------------
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for (gid, cid), stats in self.channels.items():
+            out.setdefault(gid, {})[cid] = stats.to_dict()
+        return out
+
+    def save(self, force: bool = False):
+        if self.snapshot_path and (self.dirty or force):
+            store.put(self.snapshot_path, self.snapshot(), indent=None)
+            self.dirty = False
+
+    def restore(self) -> int:
+        if not self.snapshot_path:
+            return 0
+        restored = 0
+        for gid, channels in store.load(self.snapshot_path, {}).items():
+            for cid, raw in channels.items():
+                try:
+                    self.channels[(gid, cid)] = ChannelStats.from_dict(raw)
+                    restored += 1
+                except Exception:
+                    continue
+        self.dirty = False
+        return restored
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'channels': len(self.channels),
+            'counts': sum(s.total for s in self.channels.values()),
+            'resets': sum(s.resets for s in self.channels.values()),
+        }
+
+
+def recent_users(stats: ChannelStats) -> List[int]:
+    """Utenti da risolvere per mostrare le statistiche (pochi e limitati)."""
+    ids = {uid for _, uid, _ in stats.history}
+    if stats.top_resetter:
+        ids.add(stats.top_resetter[0])
+    if stats.best_streak:
+        ids.add(stats.best_streak[0])
+    return list(ids)
@@ -0,0 +1,137 @@
+"""Comandi admin per esportare e importare i dati del bot: /data export, /data import.
+
+Usano i dati in memoria dei cog caricati (per i livelli anche l'indice delle
+classifiche resta coerente); lettura, validazione e scrittura dei file
+avvengono a blocchi come in `data_transfer`.
+"""
+
+import asyncio
+import os
+import tempfile
+from typing import Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from bot_utils import owner_or_has_permissions
+from .console_logger import logger
+from .json_store import store
+from .levels_store import MERGE_MODES
+from .data_transfer import CountingDataset, Dataset, LevelsDataset, WarnsDataset, export_file, import_file
+
+DATASET_CHOICES = [
+    app_commands.Choice(name='Livelli (XP)', value='levels'),
+    app_commands.Choice(name='Warn', value='warns'),
+    app_commands.Choice(name='Counting', value='counting'),
+]
+
+
+class DataAdminCog(commands.Cog):
+    data_group = app_commands.Group(name='data', description='Esporta e importa i dati del bot (admin)')
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        # Un solo import alla volta
+        self._import_lock = asyncio.Lock()
+
+    def _dataset(self, name: str) -> Dataset:
+        if name == 'levels':
+            cog = self.bot.get_cog('LevelsCog')
+            if cog is None:
+                raise RuntimeError('Il cog dei livelli non è caricato')
+            return LevelsDataset(cog.xp_store)
+        if name == 'counting':
+            from .counting import LEADERBOARD_FILE
+            cog = self.bot.get_cog('Counting')
+            data = cog.leaderboard if cog is not None else store.load(LEADERBOARD_FILE, {})
+            return CountingDataset(data, LEADERBOARD_FILE)
+        if name == 'warns':
+            from .moderation import WARNS_JSON
+            cog = self.bot.get_cog('ModerationCog')
+            data = cog.warns_data if cog is not None else store.load(WARNS_JSON, {'next_id': 1, 'warns': {}})
+            return WarnsDataset(data, WARNS_JSON)
+        raise ValueError(f'Dataset sconosciuto: {name}')
+
+    async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            msg = '⛔ Serve il permesso di amministratore.'
+        else:
+            original = getattr(error, 'original', error)
+            logger.error(f'[Data] Errore comando: {original}')
+            msg = f'❌ Errore: {original}'
+        try:
+            if interaction.response.is_done():
+                await interaction.followup.send(msg, ephemeral=True)
+            else:
+                await interaction.response.send_message(msg, ephemeral=True)
+        except Exception:
+            pass
+
+    @data_group.command(name='export', description='Esporta un dataset in CSV o JSON lines')
+    @owner_or_has_permissions(administrator=True)
+    @app_commands.describe(dataset='Dati da esportare', formato='Formato del file')
+    @app_commands.choices(dataset=DATASET_CHOICES, formato=[
+        app_commands.Choice(name='CSV', value='csv'),
+        app_commands.Choice(name='JSON lines', value='jsonl'),
+    ])
+    async def export_cmd(self, interaction: discord.Interaction, dataset: app_commands.Choice[str],
+                         formato: Optional[app_commands.Choice[str]] = None):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        fmt = formato.value if formato else 'csv'
+        fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+        os.close(fd)
+        try:
+            count = await export_file(self._dataset(dataset.value), path, fmt)
+            size = os.path.getsize(path)
+            limit = interaction.guild.filesize_limit if interaction.guild else 8 * 1024 * 1024
+            if size > limit:
+                await interaction.followup.send(
+                    f'❌ Il file ({size // 1024} KB) supera il limite di upload; usa `python -m cogs.data_transfer`.',
+                    ephemeral=True)
+                return
+            await interaction.followup.send(
+                f'📦 {count} righe di {dataset.name}.',
+                file=discord.File(path, filename=f'{dataset.value}.{fmt}'), ephemeral=True)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @data_group.command(name='import', description='Importa un dataset da CSV, JSON lines o dal file JSON del bot')
+    @owner_or_has_permissions(administrator=True)
+    @app_commands.describe(dataset='Dati da importare', file='File .csv, .jsonl o il .json del bot (levels, warns, counting)',
+                           mode='add: somma, overwrite: sostituisce, max: tiene il più alto',
+                           dry_run='Solo validazione, nessuna modifica')
+    @app_commands.choices(dataset=DATASET_CHOICES,
+                          mode=[app_commands.Choice(name=m, value=m) for m in MERGE_MODES])
+    async def import_cmd(self, interaction: discord.Interaction, dataset: app_commands.Choice[str],
+                         file: discord.Attachment, mode: Optional[app_commands.Choice[str]] = None,
+                         dry_run: Optional[bool] = False):
+        if self._import_lock.locked():
+            await interaction.response.send_message('⏳ C\'è già un import in corso.', ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        async with self._import_lock:
+            ext = os.path.splitext(file.filename)[1].lower() or '.csv'
+            fd, path = tempfile.mkstemp(suffix=ext)
+            os.close(fd)
+            try:
+                await file.save(path)
+                report = await import_file(self._dataset(dataset.value), path, mode.value if mode else 'add',
+                                           dry_run=bool(dry_run))
+            finally:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        logger.info(f'[Data] {interaction.user} ha importato {file.filename}: {report.applied} righe in {dataset.value}')
+        text = report.summary()
+        if len(text) > 1900:
+            text = text[:1900] + '\n…'
+        await interaction.followup.send(f'```\n{text}\n```', ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(DataAdminCog(bot))
@@ -0,0 +1,402 @@
+"""Esportazione e importazione in streaming di livelli, warn e counting.
+
+Formati: CSV con intestazione oppure JSON lines (un oggetto per riga), scelti
+dall'estensione del file (.csv, .jsonl/.ndjson) o indicati esplicitamente. In
+import si accettano anche i documenti .json del bot stesso (levels.json,
+warns.json, counting_leaderboard.json), letti per intero e scomposti in righe;
+l'export in .json non esiste, perché quei file li scrive solo il bot.
+
+Le righe si leggono e si validano a blocchi di `BATCH_SIZE` in un thread, e
+ogni blocco valido si applica subito: in memoria c'è un solo blocco alla volta
+e l'event loop del bot resta libero tra un blocco e l'altro. Le righe non
+valide vengono saltate e riportate (numero di riga e motivo).
+
+Modalità di unione: `add` somma ai valori esistenti, `overwrite` li
+sostituisce, `max` tiene il più alto. Per i warn valgono solo `add` (nuovi id)
+e `overwrite` (sostituisce il warn con lo stesso id).
+
+Uso da riga di comando (a bot spento per i dataset JSON):
+
+    python -m cogs.data_transfer export levels livelli.csv
+    python -m cogs.data_transfer import levels vecchio_bot.jsonl --mode max --dry-run
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .json_store import store
+from .levels_store import MERGE_MODES, merge_xp
+
+BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 50
+FORMATS = ('csv', 'jsonl', 'json')
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+Row = Dict[str, Any]
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    if fmt:
+        fmt = fmt.lower()
+        if fmt not in FORMATS:
+            raise ValueError(f'Formato sconosciuto: {fmt}')
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if ext == '.json':
+        return 'json'
+    raise ValueError(f'Impossibile dedurre il formato da {path!r}: usa .csv, .jsonl o .json')
+
+
+def _int(row: Row, field: str, minimum: Optional[int] = None) -> int:
+    value = row.get(field)
+    if value is None or value == '':
+        raise ValueError(f'{field} mancante')
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f'{field} non è un intero: {value!r}') from None
+    if minimum is not None and number < minimum:
+        raise ValueError(f'{field} deve essere almeno {minimum}')
+    return number
+
+
+# ------------------ Dataset ------------------
+class Dataset:
+    """Un insieme di dati esportabile e importabile (colonne, validazione, lettura e scrittura)."""
+
+    name = ''
+    fields: Tuple[str, ...] = ()
+    modes: Tuple[str, ...] = MERGE_MODES
+
+    def validate(self, row: Row, mode: str) -> Any:
+        raise NotImplementedError
+
+    def rows(self) -> AsyncIterator[Row]:
+        raise NotImplementedError
+
+    def document_rows(self, data: Any) -> Iterator[Row]:
+        """Righe dal documento JSON del bot per questo dataset."""
+        raise NotImplementedError
+
+    async def apply(self, batch: List[Any], mode: str) -> int:
+        raise NotImplementedError
+
+
+class LevelsDataset(Dataset):
+    name = 'levels'
+    fields = ('guild_id', 'user_id', 'xp')
+
+    def __init__(self, xp_store):
+        self.xp_store = xp_store
+
+    def validate(self, row: Row, mode: str) -> Tuple[int, int, int]:
+        # Con `add` si accettano anche correzioni negative
+        return (_int(row, 'guild_id', 1), _int(row, 'user_id', 1),
+                _int(row, 'xp', None if mode == 'add' else 0))
+
+    async def rows(self) -> AsyncIterator[Row]:
+        for gid in await self.xp_store.guild_ids():
+            for uid, xp in await self.xp_store.guild_rows(gid):
+                yield {'guild_id': gid, 'user_id': uid, 'xp': xp}
+
+    def document_rows(self, data: Any) -> Iterator[Row]:
+        # {guild: {"users": {utente: {"xp": ...}}}}; i file vecchi hanno text_xp + voice_xp
+        for gid, guild in data.items():
+            users = guild.get('users') if isinstance(guild, dict) else None
+            if not isinstance(users, dict):
+                yield {'guild_id': gid}
+                continue
+            for uid, user in users.items():
+                if not isinstance(user, dict):
+                    yield {'guild_id': gid, 'user_id': uid}
+                    continue
+                xp = user.get('xp')
+                if xp is None:
+                    try:
+                        xp = int(user.get('text_xp') or 0) + int(user.get('voice_xp') or 0)
+                    except (TypeError, ValueError):
+                        # Lo segnala la validazione
+                        xp = user.get('text_xp')
+                yield {'guild_id': gid, 'user_id': uid, 'xp': xp}
+
+    async def apply(self, batch: List[Tuple[int, int, int]], mode: str) -> int:
+        return len(await self.xp_store.set_many(batch, mode))
+
+
+class CountingDataset(Dataset):
+    name = 'counting'
+    fields = ('guild_id', 'user_id', 'count')
+
+    def __init__(self, leaderboard: Dict[str, Dict[str, int]], path: str):
+        self.leaderboard = leaderboard
+        self.path = path
+
+    def validate(self, row: Row, mode: str) -> Tuple[str, str, int]:
+        return (str(_int(row, 'guild_id', 1)), str(_int(row, 'user_id', 1)),
+                _int(row, 'count', None if mode == 'add' else 0))
+
+    async def rows(self) -> AsyncIterator[Row]:
+        for gid, users in list(self.leaderboard.items()):
+            for uid, count in list(users.items()):
+                yield {'guild_id': gid, 'user_id': uid, 'count': count}
+            await asyncio.sleep(0)
+
+    def document_rows(self, data: Any) -> Iterator[Row]:
+        # {guild: {utente: conteggio}}
+        for gid, users in data.items():
+            if not isinstance(users, dict):
+                yield {'guild_id': gid}
+                continue
+            for uid, count in users.items():
+                yield {'guild_id': gid, 'user_id': uid, 'count': count}
+
+    async def apply(self, batch: List[Tuple[str, str, int]], mode: str) -> int:
+        for gid, uid, value in batch:
+            users = self.leaderboard.setdefault(gid, {})
+            users[uid] = merge_xp(int(users.get(uid, 0)), value, mode)
+        store.mark_dirty(self.path)
+        return len(batch)
+
+
+class WarnsDataset(Dataset):
+    name = 'warns'
+    fields = ('id', 'user_id', 'moderator_id', 'reason', 'time')
+    modes = ('add', 'overwrite')
+
+    def __init__(self, warns_data: Dict[str, Any], path: str):
+        self.warns_data = warns_data
+        self.path = path
+
+    def validate(self, row: Row, mode: str) -> Tuple[Optional[int], Dict[str, str]]:
+        warn_id = _int(row, 'id', 1) if mode == 'overwrite' else None
+        warn = {
+            'user_id': str(_int(row, 'user_id', 1)),
+            'moderator_id': str(row.get('moderator_id') or ''),
+            'reason': str(row.get('reason') or ''),
+            'time': str(row.get('time') or ''),
+        }
+        return warn_id, warn
+
+    async def rows(self) -> AsyncIterator[Row]:
+        for wid, warn in list(self.warns_data.get('warns', {}).items()):
+            yield {'id': wid, **{f: warn.get(f, '') for f in self.fields[1:]}}
+
+    def document_rows(self, data: Any) -> Iterator[Row]:
+        # {"next_id": n, "warns": {id: {...}}}
+        for wid, warn in (data.get('warns') or {}).items():
+            yield {**warn, 'id': wid} if isinstance(warn, dict) else {'id': wid}
+
+    async def apply(self, batch: List[Tuple[Optional[int], Dict[str, str]]], mode: str) -> int:
+        warns = self.warns_data.setdefault('warns', {})
+        next_id = int(self.warns_data.get('next_id', 1))
+        for warn_id, warn in batch:
+            if warn_id is None:
+                warn_id = next_id
+            warns[str(warn_id)] = warn
+            next_id = max(next_id, warn_id + 1)
+        self.warns_data['next_id'] = next_id
+        store.mark_dirty(self.path)
+        return len(batch)
+
+
+# ------------------ Lettura ------------------
+def iter_file(path: str, fmt: str, dataset: Optional[Dataset] = None) -> Iterator[Tuple[int, Any]]:
+    """(numero di riga, riga) dal file; per JSON lines una riga non valida diventa un'eccezione.
+
+    Per i documenti .json del bot il "numero di riga" è la posizione della voce
+    nel documento.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == 'json':
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                yield 1, ValueError(f'JSON non valido: {e}')
+                return
+            if not isinstance(data, dict):
+                yield 1, ValueError(f'non è un documento {dataset.name if dataset else ""} del bot')
+                return
+            yield from enumerate(dataset.document_rows(data), start=1)
+        elif fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = ValueError(f'JSON non valido: {e}')
+                yield line_no, row
+
+
+class ImportReport:
+    def __init__(self, dataset: str, mode: str, dry_run: bool):
+        self.dataset = dataset
+        self.mode = mode
+        self.dry_run = dry_run
+        self.read = 0
+        self.applied = 0
+        self.invalid = 0
+        self.batches = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def error(self, line_no: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, message))
+
+    def summary(self) -> str:
+        head = 'Prova (nessuna modifica)' if self.dry_run else 'Import completato'
+        lines = [f'{head}: {self.dataset}, modalità {self.mode}',
+                 f'Righe lette: {self.read} • valide: {self.read - self.invalid} • '
+                 f'applicate: {self.applied} • scartate: {self.invalid} • blocchi: {self.batches}']
+        for line_no, message in self.errors:
+            lines.append(f'  riga {line_no}: {message}')
+        if self.invalid > len(self.errors):
+            lines.append(f'  … e altri {self.invalid - len(self.errors)} errori')
+        return '\n'.join(lines)
+
+
+def _next_batch(source: Iterator[Tuple[int, Any]], dataset: Dataset, mode: str, size: int,
+                report: ImportReport) -> Tuple[List[Any], bool]:
+    """Legge e valida fino a `size` righe (nel thread); ritorna (blocco, fine file)."""
+    batch = []
+    for line_no, row in source:
+        report.read += 1
+        try:
+            if isinstance(row, Exception):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError('la riga non è un oggetto')
+            batch.append(dataset.validate(row, mode))
+        except ValueError as e:
+            report.error(line_no, str(e))
+        if len(batch) >= size:
+            return batch, False
+    return batch, True
+
+
+async def import_file(dataset: Dataset, path: str, mode: str, fmt: Optional[str] = None, *,
+                      dry_run: bool = False, batch_size: int = BATCH_SIZE,
+                      progress: Optional[Callable[[ImportReport], Any]] = None) -> ImportReport:
+    if mode not in dataset.modes:
+        raise ValueError(f"Modalità {mode!r} non valida per {dataset.name}: {', '.join(dataset.modes)}")
+    report = ImportReport(dataset.name, mode, dry_run)
+    source = iter_file(path, detect_format(path, fmt), dataset)
+    try:
+        done = False
+        while not done:
+            batch, done = await asyncio.to_thread(_next_batch, source, dataset, mode, batch_size, report)
+            if batch:
+                report.batches += 1
+                if not dry_run:
+                    report.applied += await dataset.apply(batch, mode)
+                if progress is not None:
+                    progress(report)
+    finally:
+        source.close()
+    return report
+
+
+# ------------------ Scrittura ------------------
+def _write_chunk(f, rows: List[Row], writer=None):
+    if writer is not None:
+        writer.writerows(rows)
+    else:
+        f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in rows))
+
+
+async def export_file(dataset: Dataset, path: str, fmt: Optional[str] = None, *, batch_size: int = BATCH_SIZE) -> int:
+    """Scrive il dataset a blocchi (scrittura nel thread); ritorna il numero di righe."""
+    fmt = detect_format(path, fmt)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"L'export in .{fmt} non è disponibile (i documenti .json li scrive solo il bot): "
+                         f"usa .csv o .jsonl")
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = None
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=dataset.fields, extrasaction='ignore')
+            writer.writeheader()
+        chunk: List[Row] = []
+        async for row in dataset.rows():
+            chunk.append(row)
+            if len(chunk) >= batch_size:
+                await asyncio.to_thread(_write_chunk, f, chunk, writer)
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            await asyncio.to_thread(_write_chunk, f, chunk, writer)
+            written += len(chunk)
+    return written
+
+
+# ------------------ Riga di comando ------------------
+DATASETS = {cls.name: cls for cls in (LevelsDataset, WarnsDataset, CountingDataset)}
+
+
+def _cli_dataset(name: str) -> Tuple[Dataset, Callable[[], Any]]:
+    """Dataset sui file del bot, con la funzione di chiusura da chiamare alla fine."""
+    if name == 'levels':
+        from .levels import DATA_PATH, load_config
+        from .levels_store import create_levels_store
+        xp_store = create_levels_store(load_config(), DATA_PATH)
+        return LevelsDataset(xp_store), xp_store.close
+    if name == 'counting':
+        from .counting import LEADERBOARD_FILE
+        return CountingDataset(store.load(LEADERBOARD_FILE, {}), LEADERBOARD_FILE), None
+    if name == 'warns':
+        from .moderation import WARNS_JSON
+        return WarnsDataset(store.load(WARNS_JSON, {'next_id': 1, 'warns': {}}), WARNS_JSON), None
+    raise ValueError(f'Dataset sconosciuto: {name}')
+
+
+async def _cli(args) -> int:
+    dataset, close = _cli_dataset(args.dataset)
+    try:
+        if args.action == 'export':
+            count = await export_file(dataset, args.path, args.format, batch_size=args.batch_size)
+            print(f'Esportate {count} righe di {dataset.name} in {args.path}')
+            return 0
+        report = await import_file(
+            dataset, args.path, args.mode, args.format, dry_run=args.dry_run, batch_size=args.batch_size,
+            progress=lambda r: print(f'  … {r.read} righe lette', end='\r'),
+        )
+        print(report.summary())
+        return 1 if report.invalid and not report.applied else 0
+    finally:
+        if close is not None:
+            await close()
+        await store.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m cogs.data_transfer', description=__doc__.split('\n')[0])
+    parser.add_argument('action', choices=('export', 'import'))
+    parser.add_argument('dataset', choices=tuple(DATASETS))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('--mode', choices=MERGE_MODES, default='add', help='unione in import (default: add)')
+    parser.add_argument('--dry-run', action='store_true', help='valida senza modificare i dati')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    modes = DATASETS[args.dataset].modes
+    if args.action == 'import' and args.mode not in modes:
+        parser.error(f"--mode {args.mode} non valida per {args.dataset} (ammesse: {', '.join(modes)})")
+    return asyncio.run(_cli(args))
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
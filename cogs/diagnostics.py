@@ -0,0 +1,378 @@
+"""Diagnostica sul processo in esecuzione (solo owner): /debug ...
+
+- profile: finestra di cProfile o di campionamento, risultato come file
+- memory: snapshot tracemalloc e differenza rispetto al precedente
+- tasks: task asyncio attivi con la loro età
+- caches: dimensioni delle strutture in memoria di ogni cog (anche dentro i suoi
+  componenti, es. client e indici, con il loro `describe()`) e dello store JSON
+"""
+
+import asyncio
+import collections
+import cProfile
+import io
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from bot_utils import is_owner
+from .console_logger import logger
+from .json_store import store
+
+MAX_PROFILE_SECONDS = 120
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 10
+CONTAINER_TYPES = (dict, list, set, frozenset, tuple, collections.deque)
+MAX_INLINE_CHARS = 1800
+# Oggetti di libreria (bot, loop, lock, sessioni HTTP) non sono componenti da esplorare
+FOREIGN_MODULES = ('builtins', 'discord', 'asyncio', 'aiohttp', 'concurrent', 'threading', 'logging')
+
+# Istante di creazione dei task (registrato dalla task factory del cog)
+_task_started: 'weakref.WeakKeyDictionary[asyncio.Task, float]' = weakref.WeakKeyDictionary()
+
+
+def _text_file(text: str, filename: str) -> discord.File:
+    return discord.File(io.BytesIO(text.encode('utf-8')), filename=filename)
+
+
+def _deep_size(obj, limit: int = 20000) -> int:
+    """Stima in byte di un contenitore e del suo contenuto (visita al più `limit` oggetti)."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < limit:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, CONTAINER_TYPES):
+            stack.extend(o)
+    return total
+
+
+def _attributes(obj) -> List[Tuple[str, object]]:
+    """Attributi d'istanza, da `__dict__` o da `__slots__`."""
+    try:
+        return list(vars(obj).items())
+    except TypeError:
+        pass
+    names = []
+    for cls in type(obj).__mro__:
+        slots = getattr(cls, '__slots__', ())
+        names.extend([slots] if isinstance(slots, str) else slots)
+    return [(n, getattr(obj, n)) for n in names if hasattr(obj, n)]
+
+
+def _is_component(value) -> bool:
+    if isinstance(value, (type, CONTAINER_TYPES)) or callable(value):
+        return False
+    module = type(value).__module__ or ''
+    return module.split('.')[0] not in FOREIGN_MODULES
+
+
+def _cache_lines(obj, prefix: str = '', depth: int = 1, seen: Optional[set] = None) -> List[str]:
+    """Contenitori di `obj` e, fino a `depth` livelli, dei suoi componenti."""
+    seen = {id(obj)} if seen is None else seen
+    lines = []
+    for attr, value in _attributes(obj):
+        if attr.startswith('__') or id(value) in seen:
+            continue
+        seen.add(id(value))
+        name = prefix + attr
+        if isinstance(value, CONTAINER_TYPES):
+            lines.append(f'  {name:<28} {len(value):>8} voci  ~{_fmt_bytes(_deep_size(value))}')
+        elif depth > 0 and _is_component(value):
+            describe = getattr(value, 'describe', None)
+            if callable(describe):
+                try:
+                    stats = describe()
+                    lines.append(f'  {name:<28} ' + ', '.join(f'{k}={v}' for k, v in stats.items()))
+                except Exception:
+                    pass
+            lines.extend(_cache_lines(value, name + '.', depth - 1, seen))
+    return lines
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(n) < 1024:
+            return f'{n:.0f} {unit}' if unit == 'B' else f'{n:.1f} {unit}'
+        n /= 1024
+    return f'{n:.1f} GiB'
+
+
+class _StackSampler:
+    """Conta quante volte ogni funzione è in cima allo stack (self) o presente (cumulativo)."""
+
+    def __init__(self):
+        self.samples = 0
+        self.own: collections.Counter = collections.Counter()
+        self.cumulative: collections.Counter = collections.Counter()
+
+    def record(self, frame):
+        if frame is None:
+            return
+        self.samples += 1
+        seen = set()
+        top = True
+        while frame is not None:
+            code = frame.f_code
+            key = f'{code.co_filename}:{code.co_firstlineno}({code.co_name})'
+            if top:
+                self.own[key] += 1
+                top = False
+            if key not in seen:
+                self.cumulative[key] += 1
+                seen.add(key)
+            frame = frame.f_back
+
+    def sample_thread(self, thread_id: int, duration: float, interval: float, stop: threading.Event):
+        deadline = time.monotonic() + duration
+        while not stop.is_set() and time.monotonic() < deadline:
+            self.record(sys._current_frames().get(thread_id))
+            time.sleep(interval)
+
+
+class DiagnosticsCog(commands.Cog):
+    debug_group = app_commands.Group(name='debug', description='Diagnostica del bot (solo owner)')
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._profiling = False
+        self._mem_baseline: Optional[tracemalloc.Snapshot] = None
+        self._factory_installed = False
+        self._tracking_since = time.monotonic()
+
+    async def cog_load(self):
+        loop = asyncio.get_running_loop()
+        # Senza altre factory registra l'istante di creazione di ogni task
+        if loop.get_task_factory() is None:
+            def factory(loop, coro, **kwargs):
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+                _task_started[task] = time.monotonic()
+                return task
+            loop.set_task_factory(factory)
+            self._factory_installed = True
+        self._tracking_since = time.monotonic()
+
+    async def cog_unload(self):
+        if self._factory_installed:
+            try:
+                asyncio.get_running_loop().set_task_factory(None)
+            except Exception:
+                pass
+            self._factory_installed = False
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return is_owner(interaction.user)
+
+    async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            msg = '⛔ Solo il proprietario del bot può usare questo comando.'
+        else:
+            logger.error(f'[Debug] Errore comando: {error}')
+            msg = f'❌ Errore: {error}'
+        try:
+            if interaction.response.is_done():
+                await interaction.followup.send(msg, ephemeral=True)
+            else:
+                await interaction.response.send_message(msg, ephemeral=True)
+        except Exception:
+            pass
+
+    # ------------------ Profilazione ------------------
+    @debug_group.command(name='profile', description='Profila il bot per alcuni secondi e invia le funzioni più costose')
+    @app_commands.describe(seconds='Durata della finestra (1-120)', mode='cProfile (preciso, più lento) o campionamento',
+                           top='Quante righe includere')
+    @app_commands.choices(mode=[
+        app_commands.Choice(name='cProfile', value='cprofile'),
+        app_commands.Choice(name='Campionamento', value='sampling'),
+    ])
+    async def profile_cmd(self, interaction: discord.Interaction, seconds: app_commands.Range[int, 1, MAX_PROFILE_SECONDS] = 10,
+                          mode: Optional[app_commands.Choice[str]] = None, top: app_commands.Range[int, 5, 200] = 40):
+        if self._profiling:
+            await interaction.response.send_message('⏳ Una profilazione è già in corso.', ephemeral=True)
+            return
+        value = mode.value if mode else 'cprofile'
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        self._profiling = True
+        try:
+            if value == 'sampling':
+                text = await self._run_sampling(seconds, top)
+            else:
+                text = await self._run_cprofile(seconds, top)
+        finally:
+            self._profiling = False
+        await interaction.followup.send(f'📊 Profilo {value} di {seconds}s', file=_text_file(text, f'profile-{value}.txt'), ephemeral=True)
+
+    async def _run_cprofile(self, seconds: int, top: int) -> str:
+        # Il profiler segue solo il thread dell'event loop, cioè tutto il codice dei cogs
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(top)
+        out.write('\n' + '=' * 80 + '\n')
+        stats.sort_stats('tottime').print_stats(top)
+        return out.getvalue()
+
+    async def _run_sampling(self, seconds: int, top: int) -> str:
+        sampler = _StackSampler()
+        if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
+            # SIGPROF scatta ogni SAMPLE_INTERVAL di CPU e il gestore gira nel thread
+            # del loop: si vede dove va la CPU, senza contare l'attesa in select()
+            kind = 'CPU (SIGPROF)'
+            previous = signal.signal(signal.SIGPROF, lambda signum, frame: sampler.record(frame))
+            signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, previous)
+        else:
+            # Campionatore in un thread: ottiene il GIL soprattutto quando il loop lo
+            # rilascia, quindi sovrastima select(); si riduce lo switch interval
+            kind = 'tempo reale (thread)'
+            stop = threading.Event()
+            switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(switch_interval, SAMPLE_INTERVAL / 50))
+            try:
+                await asyncio.to_thread(sampler.sample_thread, threading.get_ident(), seconds, SAMPLE_INTERVAL, stop)
+            finally:
+                stop.set()
+                sys.setswitchinterval(switch_interval)
+        samples = sampler.samples
+        lines = [f'Campioni: {samples} • {kind} • ogni {SAMPLE_INTERVAL * 1000:.0f} ms', '']
+        if samples:
+            lines.append('--- Tempo proprio (funzione in cima allo stack) ---')
+            for key, n in sampler.own.most_common(top):
+                lines.append(f'{n / samples * 100:6.2f}%  {n:7d}  {key}')
+            lines.append('')
+            lines.append('--- Tempo cumulativo (funzione presente nello stack) ---')
+            for key, n in sampler.cumulative.most_common(top):
+                lines.append(f'{n / samples * 100:6.2f}%  {n:7d}  {key}')
+        return '\n'.join(lines) + '\n'
+
+    # ------------------ Memoria ------------------
+    @debug_group.command(name='memory', description='Snapshot tracemalloc e differenza con il precedente')
+    @app_commands.describe(action='snapshot: nuova base e differenza • stop: ferma tracemalloc', top='Quante righe includere')
+    @app_commands.choices(action=[
+        app_commands.Choice(name='Snapshot e differenza', value='snapshot'),
+        app_commands.Choice(name='Stop', value='stop'),
+    ])
+    async def memory_cmd(self, interaction: discord.Interaction, action: Optional[app_commands.Choice[str]] = None,
+                         top: app_commands.Range[int, 5, 200] = 30):
+        value = action.value if action else 'snapshot'
+        if value == 'stop':
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._mem_baseline = None
+            await interaction.response.send_message('🛑 tracemalloc fermato.', ephemeral=True)
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._mem_baseline = tracemalloc.take_snapshot()
+            await interaction.response.send_message(
+                '▶️ tracemalloc avviato e prima snapshot salvata: ripeti il comando più tardi per la differenza.',
+                ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # Snapshot e confronto in un thread: su heap grandi richiedono secondi
+        previous = self._mem_baseline
+        current = await asyncio.to_thread(tracemalloc.take_snapshot)
+        self._mem_baseline = current
+        text = await asyncio.to_thread(self._memory_report, previous, current, top)
+        traced, peak = tracemalloc.get_traced_memory()
+        await interaction.followup.send(
+            f'🧠 Memoria tracciata: {_fmt_bytes(traced)} (picco {_fmt_bytes(peak)})',
+            file=_text_file(text, 'memory.txt'), ephemeral=True)
+
+    @staticmethod
+    def _memory_report(previous: Optional[tracemalloc.Snapshot], current: tracemalloc.Snapshot, top: int) -> str:
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ]
+        current = current.filter_traces(filters)
+        lines = []
+        if previous is not None:
+            previous = previous.filter_traces(filters)
+            lines.append('--- Differenza rispetto alla snapshot precedente ---')
+            for stat in current.compare_to(previous, 'lineno')[:top]:
+                lines.append(str(stat))
+            lines.append('')
+        lines.append('--- Allocazioni attuali per riga ---')
+        for stat in current.statistics('lineno')[:top]:
+            lines.append(str(stat))
+        return '\n'.join(lines) + '\n'
+
+    # ------------------ Task ------------------
+    @debug_group.command(name='tasks', description='Task asyncio attivi con la loro età')
+    async def tasks_cmd(self, interaction: discord.Interaction):
+        now = time.monotonic()
+        rows: List[Tuple[float, bool, str]] = []
+        for task in asyncio.all_tasks():
+            started = _task_started.get(task)
+            # Task creati prima del cog: età minima nota
+            exact = started is not None
+            age = now - (started if exact else self._tracking_since)
+            coro = task.get_coro()
+            name = getattr(coro, '__qualname__', None) or repr(coro)
+            rows.append((age, exact, f'{task.get_name()} • {name}'))
+        rows.sort(key=lambda r: r[0], reverse=True)
+        lines = [f'Task attivi: {len(rows)}']
+        for age, exact, label in rows:
+            prefix = '' if exact else '≥'
+            lines.append(f'{prefix}{age:10.1f}s  {label}')
+        await self._send_text(interaction, '\n'.join(lines), 'tasks.txt')
+
+    # ------------------ Cache ------------------
+    @debug_group.command(name='caches', description='Dimensione delle strutture in memoria dei cogs')
+    async def caches_cmd(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        lines = []
+        for cog_name, cog in sorted(self.bot.cogs.items()):
+            entries = _cache_lines(cog)
+            if entries:
+                lines.append(cog_name)
+                lines.extend(entries)
+        sizes: Dict[str, int] = store.document_sizes()
+        if sizes:
+            lines.append('')
+            lines.append(f'Store JSON ({len(sizes)} documenti)')
+            for path, n in sorted(sizes.items(), key=lambda kv: kv[1], reverse=True):
+                lines.append(f'  {n:>8} voci  {path}')
+        await self._send_text(interaction, '\n'.join(lines) or 'Nessuna struttura trovata.', 'caches.txt')
+
+    async def _send_text(self, interaction: discord.Interaction, text: str, filename: str):
+        """Testo breve in un blocco di codice, altrimenti come file allegato."""
+        send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+        if len(text) <= MAX_INLINE_CHARS:
+            await send(f'```\n{text}\n```', ephemeral=True)
+        else:
+            await send(file=_text_file(text + '\n', filename), ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(DiagnosticsCog(bot))
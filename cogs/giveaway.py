@@ -15,6 +15,14 @@ except ImportError:
     except ImportError:
         import logging
         logger = logging.getLogger("giveaway_fallback")
+try:
+    from .json_store import store
+    from .keyed_locks import get_locks
+    from .metrics import loop_timer
+except ImportError:
+    from cogs.json_store import store
+    from cogs.keyed_locks import get_locks
+    from cogs.metrics import loop_timer
 
 DATA_DIR = os.path.join('cogs', 'giveaway', 'data')
 BLACKLIST_PATH = os.path.join('cogs', 'giveaway', 'blacklist.json')
@@ -182,37 +190,40 @@ class GiveawayView(discord.ui.View):
     @discord.ui.button(label='🎉 Partecipa', style=discord.ButtonStyle.green, custom_id='gw_join')
     async def join_leave(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
-            data = self.cog.load_giveaway(self.message_id)
-            if data is None:
-                await interaction.response.send_message('❌ Giveaway non trovato o non inizializzato.', ephemeral=True)
-                return
-
-            if data.get('status', 'active') != 'active':
-                await interaction.response.send_message('⛔ Questo giveaway è terminato.', ephemeral=True)
-                return
+            # Lock per giveaway: i click concorrenti non si sovrascrivono la lista iscritti
+            async with self.cog.locks(self.message_id):
+                data = self.cog.load_giveaway(self.message_id)
+                if data is None:
+                    await interaction.response.send_message('❌ Giveaway non trovato o non inizializzato.', ephemeral=True)
+                    return
 
-            # Blacklist check
-            bl = _load_blacklist()
-            guild_key = str(interaction.guild_id)
-            if str(interaction.user.id) in set(map(str, bl.get(guild_key, []))):
-                await interaction.response.send_message('🚫 Sei in blacklist e non puoi partecipare ai giveaway.', ephemeral=True)
-                return
-
-            user_id = interaction.user.id
-            entrants = data.get('entrants', [])
-
-            if user_id in entrants:
-                entrants.remove(user_id)
-                action = 'uscito dal'
-                color = discord.Color.red()
-            else:
-                entrants.append(user_id)
-                action = 'entrato nel'
-                color = discord.Color.green()
-
-            data['entrants'] = entrants
-            data['updated_at'] = _utcnow_iso()
-            self.cog.save_giveaway(self.message_id, data)
+                if data.get('status', 'active') != 'active':
+                    await interaction.response.send_message('⛔ Questo giveaway è terminato.', ephemeral=True)
+                    return
+
+                # Blacklist check
+                bl = _load_blacklist()
+                guild_key = str(interaction.guild_id)
+                if str(interaction.user.id) in set(map(str, bl.get(guild_key, []))):
+                    await interaction.response.send_message('🚫 Sei in blacklist e non puoi partecipare ai giveaway.', ephemeral=True)
+                    return
+
+                user_id = interaction.user.id
+                entrants = data.get('entrants', [])
+
+                if user_id in entrants:
+                    entrants.remove(user_id)
+                    action = 'uscito dal'
+                    color = discord.Color.red()
+                else:
+                    entrants.append(user_id)
+                    action = 'entrato nel'
+                    color = discord.Color.green()
+
+                data['entrants'] = entrants
+                data['updated_at'] = _utcnow_iso()
+                self.cog.save_giveaway(self.message_id, data)
+                entrants_count = len(entrants)
 
             # Update main message embed counter if possible
             try:
@@ -234,7 +245,7 @@ class GiveawayView(discord.ui.View):
                         if f.name.startswith('Partecipanti'):
                             continue
                         new_emb.add_field(name=f.name, value=f.value, inline=f.inline)
-                    new_emb.add_field(name=f'Partecipanti ({len(entrants)})', value='Premi "Mostra iscritti" per vedere la lista', inline=False)
+                    new_emb.add_field(name=f'Partecipanti ({entrants_count})', value='Premi "Mostra iscritti" per vedere la lista', inline=False)
                     await msg.edit(embed=new_emb, view=self)
             except Exception:
                 pass
@@ -242,7 +253,7 @@ class GiveawayView(discord.ui.View):
             # Reply to user
             await interaction.response.send_message(
                 embed=discord.Embed(
-                    description=f"Sei {action} giveaway. Attuali partecipanti: {len(entrants)}",
+                    description=f"Sei {action} giveaway. Attuali partecipanti: {entrants_count}",
                     color=color
                 ),
                 ephemeral=True
@@ -292,6 +303,7 @@ class GiveawayCog(commands.Cog):
         _ensure_data_dir()
         self._temp_files = []
         self._end_loop_started = False
+        self.locks = get_locks('giveaway')
         # Do NOT start the loop here: at cog setup time the client is not logged in yet.
         # The loop will be started safely in on_ready.
         logger.info('[Giveaway] Cog initialised; end checker will start on_ready')
@@ -314,18 +326,12 @@ class GiveawayCog(commands.Cog):
 
     def load_giveaway(self, message_id: int):
         path = _file_path(message_id)
-        if not os.path.exists(path):
-            return None
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
+        if not store.exists(path):
             return None
+        return store.load(path, None)
 
     def save_giveaway(self, message_id: int, data: dict):
-        path = _file_path(message_id)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        store.put(_file_path(message_id), data)
 
     def _build_embed(self, guild: Optional[discord.Guild], data: dict) -> discord.Embed:
         # Build embed from global config merged with per-giveaway overrides
@@ -484,6 +490,7 @@ class GiveawayCog(commands.Cog):
         return winners, msg
 
     @tasks.loop(seconds=30)
+    @loop_timer('giveaway_end_checker')
     async def _end_checker(self):
         try:
             now = _utcnow_epoch()
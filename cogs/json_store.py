@@ -0,0 +1,349 @@
+"""Archivio JSON condiviso con scrittura differita (write-behind).
+
+Ogni file JSON del bot viene letto una sola volta e tenuto in memoria come
+`Document`. I cog modificano i dati in place e segnano il documento come
+"sporco"; un unico flush periodico serializza i documenti modificati e li
+scrive con temp-file + rename atomico. Tutte le scritture passano da qui, quindi
+c'è un solo writer per file.
+
+Variabili d'ambiente:
+- STATE_FLUSH_SECONDS: intervallo del flush differito (default 5)
+- STATE_FSYNC: 'never' (default) oppure 'always' per fsync di file e cartella
+"""
+
+import asyncio
+import copy
+import json
+import marshal
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("json_store")
+
+FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_SECONDS', '5'))
+FSYNC_POLICY = os.getenv('STATE_FSYNC', 'never').strip().lower()
+# Oltre questa dimensione (snapshot marshal) la codifica usa l'encoder a pezzi
+LARGE_SNAPSHOT = 256 * 1024
+CHUNK_ITEMS = 5000
+FREEZE_DEPTH = 3
+
+
+def _normpath(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def _read_file(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _freeze(obj: Any, depth: int = 0):
+    """Copia immutabile (marshal) presa sul loop.
+
+    I dict grandi vengono copiati a blocchi di CHUNK_ITEMS voci, cercandoli nei
+    primi livelli del documento (es. levels.json → guild → users): nel thread
+    ogni blocco si ricarica con una breve presa del GIL invece di un'unica
+    `marshal.loads` da centinaia di millisecondi.
+    """
+    if type(obj) is dict:
+        if len(obj) > CHUNK_ITEMS:
+            keys = list(obj)
+            values = list(obj.values())
+            return ('chunks', [marshal.dumps((keys[i:i + CHUNK_ITEMS], values[i:i + CHUNK_ITEMS]))
+                               for i in range(0, len(keys), CHUNK_ITEMS)])
+        if depth < FREEZE_DEPTH:
+            return ('dict', [(k, _freeze(v, depth + 1)) for k, v in obj.items()])
+    return ('raw', marshal.dumps(obj))
+
+
+def _thaw(frozen) -> Any:
+    kind, value = frozen
+    if kind == 'raw':
+        return marshal.loads(value)
+    if kind == 'chunks':
+        out = {}
+        for chunk in value:
+            keys, values = marshal.loads(chunk)
+            out.update(zip(keys, values))
+        return out
+    return {k: _thaw(v) for k, v in value}
+
+
+def _encode(frozen, indent: Optional[int]) -> str:
+    """JSON dalla copia immutabile (nel thread di scrittura).
+
+    L'encoder C di `json.dumps` tiene il GIL per tutta la codifica e con i
+    documenti grandi fermerebbe il loop; `iterencode` lavora a pezzi e lo rilascia.
+    """
+    data = _thaw(frozen)
+    if frozen[0] == 'raw' and len(frozen[1]) < LARGE_SNAPSHOT:
+        return json.dumps(data, indent=indent, ensure_ascii=False)
+    return ''.join(json.JSONEncoder(indent=indent, ensure_ascii=False).iterencode(data))
+
+
+class Document:
+    """Un file JSON tenuto in memoria."""
+
+    __slots__ = ('path', 'data', 'indent', 'dirty', '_store')
+
+    def __init__(self, store: 'JsonStore', path: str, data: Any, indent: Optional[int] = 2):
+        self._store = store
+        self.path = path
+        self.data = data
+        self.indent = indent
+        self.dirty = False
+
+    def mark_dirty(self):
+        self._store._mark(self)
+
+    def view(self, *keys: str) -> Dict[str, Any]:
+        """Restituisce il dict annidato indicato da `keys`, creandolo se manca."""
+        node = self.data
+        for key in keys:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = {}
+                node[key] = child
+            node = child
+        return node
+
+
+class JsonStore:
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, fsync: str = FSYNC_POLICY):
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.fsync = fsync
+        self._docs: Dict[str, Document] = {}
+        self._dirty: Dict[str, Document] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._write_lock = threading.Lock()
+        self._closed = False
+        # Statistiche
+        self.flushes = 0
+        self.files_written = 0
+        self.bytes_written = 0
+        self.write_errors = 0
+        self.last_flush_ms = 0.0
+
+    # ------------------ Lettura ------------------
+    def document(self, path: str, default: Any = None, *, indent: Optional[int] = 2) -> Document:
+        """Documento per `path`; al primo accesso legge il file (sincrono)."""
+        key = _normpath(path)
+        doc = self._docs.get(key)
+        if doc is None:
+            doc = Document(self, key, self._read_or_default(key, default), indent)
+            self._docs[key] = doc
+        return doc
+
+    async def open(self, path: str, default: Any = None, *, indent: Optional[int] = 2) -> Document:
+        """Come `document`, ma il primo caricamento avviene in un thread."""
+        key = _normpath(path)
+        doc = self._docs.get(key)
+        if doc is not None:
+            return doc
+        data = await asyncio.to_thread(self._read_or_default, key, default)
+        # Un altro handler potrebbe averlo caricato nel frattempo
+        doc = self._docs.get(key)
+        if doc is None:
+            doc = Document(self, key, data, indent)
+            self._docs[key] = doc
+        return doc
+
+    def load(self, path: str, default: Any = None) -> Any:
+        return self.document(path, default).data
+
+    def exists(self, path: str) -> bool:
+        key = _normpath(path)
+        return key in self._docs or os.path.exists(key)
+
+    def _read_or_default(self, path: str, default: Any):
+        try:
+            return _read_file(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f'[Store] Lettura di {path} fallita: {e}')
+        return copy.deepcopy(default)
+
+    # ------------------ Scrittura ------------------
+    def put(self, path: str, data: Any, *, indent: Optional[int] = 2):
+        """Sostituisce il contenuto del documento e lo segna come da salvare."""
+        key = _normpath(path)
+        doc = self._docs.get(key)
+        if doc is None:
+            doc = Document(self, key, data, indent)
+            self._docs[key] = doc
+        else:
+            doc.data = data
+        self._mark(doc)
+
+    def mark_dirty(self, path: str):
+        doc = self._docs.get(_normpath(path))
+        if doc is not None:
+            self._mark(doc)
+
+    def reload(self, path: str, default: Any = None) -> Any:
+        """Rilegge il file (es. modificato a mano) aggiornando in place i dati condivisi.
+
+        Se ci sono modifiche non ancora salvate vince la copia in memoria, che
+        sarà scritta al prossimo flush.
+        """
+        doc = self.document(path, default)
+        if doc.dirty:
+            return doc.data
+        fresh = self._read_or_default(doc.path, default)
+        if isinstance(doc.data, dict) and isinstance(fresh, dict):
+            # Chi tiene già un riferimento al dict vede i nuovi valori
+            doc.data.clear()
+            doc.data.update(fresh)
+        else:
+            doc.data = fresh
+        return doc.data
+
+    def discard(self, path: str):
+        """Dimentica il documento in memoria (la prossima lettura rilegge il file)."""
+        key = _normpath(path)
+        self._dirty.pop(key, None)
+        self._docs.pop(key, None)
+
+    def _mark(self, doc: Document):
+        doc.dirty = True
+        self._dirty[doc.path] = doc
+        if self._closed:
+            self.flush_sync()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Nessun event loop (CLI, script): scrittura immediata
+            self.flush_sync()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            return
+        await self.flush()
+        # Documenti segnati mentre il batch era in scrittura: _mark ha visto questo
+        # task ancora attivo e non ne ha programmato un altro
+        if self._dirty and not self._closed:
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    def _take_dirty(self):
+        """Copia immutabile dei documenti sporchi, presa sul thread del loop.
+
+        `marshal` copia i tipi JSON in C molto più velocemente di `json.dumps`
+        (soprattutto con indent); la codifica JSON vera avviene poi nel thread
+        di scrittura, senza bloccare il loop né vedere mutazioni concorrenti
+        (vedi `_freeze`).
+        """
+        batch = []
+        for doc in list(self._dirty.values()):
+            try:
+                batch.append((doc.path, doc.indent, _freeze(doc.data), None))
+            except ValueError:
+                # Tipi non supportati da marshal: serializza subito, come prima
+                try:
+                    batch.append((doc.path, doc.indent, None,
+                                  json.dumps(doc.data, indent=doc.indent, ensure_ascii=False)))
+                except Exception as e:
+                    self.write_errors += 1
+                    logger.error(f'[Store] Serializzazione di {doc.path} fallita: {e}')
+                    continue
+            doc.dirty = False
+        self._dirty.clear()
+        return batch
+
+    def _write_batch(self, batch):
+        with self._write_lock:
+            for path, indent, snapshot, payload in batch:
+                try:
+                    if payload is None:
+                        payload = _encode(snapshot, indent)
+                    self._atomic_write(path, payload)
+                except Exception as e:
+                    self.write_errors += 1
+                    logger.error(f'[Store] Scrittura di {path} fallita: {e}')
+
+    def _atomic_write(self, path: str, payload: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f'{path}.tmp'
+        data = payload.encode('utf-8')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            if self.fsync == 'always':
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if self.fsync == 'always' and hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(directory or '.', os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.files_written += 1
+        self.bytes_written += len(data)
+
+    async def flush(self):
+        """Scrive tutti i documenti sporchi in un unico batch."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            start = time.perf_counter()
+            batch = self._take_dirty()
+            await asyncio.to_thread(self._write_batch, batch)
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+    def flush_sync(self):
+        if not self._dirty:
+            return
+        start = time.perf_counter()
+        self._write_batch(self._take_dirty())
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+    async def close(self):
+        """Ferma il flush differito e salva quanto rimasto (da chiamare allo shutdown)."""
+        self._closed = True
+        task = self._flush_task
+        if task is not None and not task.done():
+            task.cancel()
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'documents': len(self._docs),
+            'dirty': len(self._dirty),
+            'flushes': self.flushes,
+            'files_written': self.files_written,
+            'bytes_written': self.bytes_written,
+            'write_errors': self.write_errors,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+        }
+
+    def document_sizes(self) -> Dict[str, int]:
+        """Numero di voci al primo livello di ogni documento in memoria."""
+        sizes = {}
+        for key, doc in self._docs.items():
+            try:
+                sizes[key] = len(doc.data)
+            except TypeError:
+                sizes[key] = 1
+        return sizes
+
+
+store = JsonStore()
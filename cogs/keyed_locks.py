@@ -0,0 +1,125 @@
+"""Lock asincroni per chiave (guild, utente, canale, giveaway...).
+
+`KeyedLocks` crea un `asyncio.Lock` per ogni chiave in uso e lo elimina quando
+nessuno lo tiene più, quindi la memoria resta proporzionale alle chiavi attive.
+Registra metriche di contesa consultabili con `lock_stats()`.
+
+Uso:
+    locks = get_locks('levels')
+    async with locks((guild_id, user_id)):
+        ...
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Hashable
+
+
+class LockStats:
+    __slots__ = ('acquisitions', 'contended', 'wait_total', 'wait_max')
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, contended: bool):
+        self.acquisitions += 1
+        if contended:
+            self.contended += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'wait_total_ms': round(self.wait_total * 1000, 2),
+            'wait_max_ms': round(self.wait_max * 1000, 2),
+        }
+
+
+class _Held:
+    """Context manager restituito da `KeyedLocks.__call__`."""
+
+    __slots__ = ('_owner', '_key', '_lock')
+
+    def __init__(self, owner, key):
+        self._owner = owner
+        self._key = key
+        self._lock = None
+
+    async def __aenter__(self):
+        self._lock = await self._owner._acquire(self._key)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._owner._release(self._key, self._lock)
+        return False
+
+
+class KeyedLocks:
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = LockStats()
+        # chiave -> [lock, numero di task che lo tengono o lo attendono]
+        self._entries: Dict[Hashable, list] = {}
+
+    def __call__(self, key: Hashable) -> _Held:
+        return _Held(self, key)
+
+    def locked(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return bool(entry and entry[0].locked())
+
+    async def _acquire(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [asyncio.Lock(), 0]
+            self._entries[key] = entry
+        entry[1] += 1
+        lock = entry[0]
+        contended = lock.locked()
+        start = time.perf_counter()
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._drop(key, entry)
+            raise
+        self.stats.record(time.perf_counter() - start, contended)
+        return lock
+
+    def _release(self, key, lock):
+        lock.release()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._drop(key, entry)
+
+    def _drop(self, key, entry):
+        entry[1] -= 1
+        if entry[1] <= 0:
+            self._entries.pop(key, None)
+
+    def describe(self) -> Dict[str, Any]:
+        info = self.stats.as_dict()
+        info['kind'] = 'keyed'
+        info['active_keys'] = len(self._entries)
+        return info
+
+
+_registry: Dict[str, KeyedLocks] = {}
+
+
+def get_locks(name: str) -> KeyedLocks:
+    """Gestore di lock per chiave condiviso, identificato da `name`."""
+    locks = _registry.get(name)
+    if locks is None:
+        locks = KeyedLocks(name)
+        _registry[name] = locks
+    return locks
+
+
+def lock_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: locks.describe() for name, locks in _registry.items()}
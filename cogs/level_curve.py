@@ -0,0 +1,186 @@
+"""Curve dei livelli con tabella cumulativa precalcolata.
+
+`LevelCurve` tiene la lista `thresholds`, dove `thresholds[l]` è l'XP totale
+necessario per raggiungere il livello `l`. Il livello di un totale si trova con
+una bisezione (O(log L)) invece di sottrarre un livello alla volta; la tabella
+si estende da sola se qualcuno supera l'ultimo livello calcolato.
+
+Le curve sono descritte da un dict di configurazione e si possono scegliere per
+guild in levels.json:
+
+    "curve": {"type": "quadratic", "a": 5, "b": 50, "c": 100},
+    "guild_curves": {"123456789": {"type": "linear", "base": 100, "step": 50}}
+
+Tipi disponibili: quadratic (a*l^2 + b*l + c), linear (base + step*l),
+exponential (base * factor^l), table (lista "xp" di XP per livello, poi
+l'ultimo valore si ripete).
+
+Il costo di un livello è limitato a `MAX_LEVEL_XP`: una curva esponenziale
+supera presto il range dei float, e oltre quel valore si resta allo stesso
+costo invece di andare in OverflowError.
+"""
+
+import bisect
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_CURVE = {'type': 'quadratic', 'a': 5, 'b': 50, 'c': 100}
+INITIAL_LEVELS = 200
+MAX_LEVELS = 1_000_000
+MAX_LEVEL_XP = 10 ** 12
+
+
+def _quadratic(spec: Dict[str, Any]) -> Callable[[int], int]:
+    a, b, c = float(spec.get('a', 5)), float(spec.get('b', 50)), float(spec.get('c', 100))
+    return lambda level: int(a * level * level + b * level + c)
+
+
+def _linear(spec: Dict[str, Any]) -> Callable[[int], int]:
+    base, step = float(spec.get('base', 100)), float(spec.get('step', 50))
+    return lambda level: int(base + step * level)
+
+
+def _exponential(spec: Dict[str, Any]) -> Callable[[int], int]:
+    base, factor = float(spec.get('base', 100)), float(spec.get('factor', 1.1))
+    return lambda level: int(base * factor ** level)
+
+
+def _table(spec: Dict[str, Any]) -> Callable[[int], int]:
+    steps = [int(x) for x in spec.get('xp', [])] or [100]
+    return lambda level: steps[level] if level < len(steps) else steps[-1]
+
+
+CURVE_TYPES: Dict[str, Callable[[Dict[str, Any]], Callable[[int], int]]] = {
+    'quadratic': _quadratic,
+    'linear': _linear,
+    'exponential': _exponential,
+    'table': _table,
+}
+
+
+class LevelCurve:
+    def __init__(self, per_level: Callable[[int], int], spec: Optional[Dict[str, Any]] = None):
+        self.per_level = per_level
+        self.spec = dict(spec or {})
+        self.thresholds: List[int] = [0]
+        self._extend(INITIAL_LEVELS)
+
+    @classmethod
+    def from_spec(cls, spec: Optional[Dict[str, Any]]) -> 'LevelCurve':
+        spec = dict(spec or DEFAULT_CURVE)
+        factory = CURVE_TYPES.get(str(spec.get('type', 'quadratic')))
+        if factory is None:
+            raise ValueError(f"Tipo di curva sconosciuto: {spec.get('type')}")
+        return cls(factory(spec), spec)
+
+    def _cost(self, level: int) -> int:
+        """XP richiesti dal livello `level`, tra 1 (serve alla bisezione) e MAX_LEVEL_XP."""
+        try:
+            return min(MAX_LEVEL_XP, max(1, self.per_level(level)))
+        except OverflowError:
+            return MAX_LEVEL_XP
+
+    def _extend(self, levels: int):
+        t = self.thresholds
+        level = len(t) - 1
+        total = t[-1]
+        target = min(MAX_LEVELS, level + levels)
+        cost = self._cost
+        while level < target:
+            total += cost(level)
+            t.append(total)
+            level += 1
+
+    def _ensure(self, total_xp: int):
+        t = self.thresholds
+        while total_xp >= t[-1] and len(t) <= MAX_LEVELS:
+            self._extend(len(t))
+
+    def xp_for_level(self, level: int) -> int:
+        """XP totale per raggiungere `level`."""
+        level = max(0, int(level))
+        if level >= len(self.thresholds):
+            self._extend(level - len(self.thresholds) + 1)
+        return self.thresholds[min(level, len(self.thresholds) - 1)]
+
+    def level_of(self, total_xp: int) -> int:
+        total_xp = max(0, int(total_xp))
+        self._ensure(total_xp)
+        return bisect.bisect_right(self.thresholds, total_xp) - 1
+
+    def level_from_xp(self, total_xp: int) -> Tuple[int, int, int]:
+        """(livello, XP nel livello, XP richiesti dal livello), come il vecchio level_from_xp."""
+        total_xp = max(0, int(total_xp))
+        level = self.level_of(total_xp)
+        t = self.thresholds
+        start = t[level]
+        needed = t[level + 1] - start if level + 1 < len(t) else self._cost(level)
+        return level, total_xp - start, needed
+
+    def levels_for(self, totals: Iterable[int]) -> List[int]:
+        """Livelli di molti totali in un colpo solo (classifiche, ricalcoli)."""
+        totals = [max(0, int(x)) for x in totals]
+        if not totals:
+            return []
+        self._ensure(max(totals))
+        t = self.thresholds
+        find = bisect.bisect_right
+        return [find(t, x) - 1 for x in totals]
+
+
+_curve_cache: Dict[Tuple, LevelCurve] = {}
+
+
+def _spec_key(spec: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in spec.items()))
+
+
+def get_curve(spec: Optional[Dict[str, Any]] = None) -> LevelCurve:
+    """Curva per `spec` (condivisa: la tabella si calcola una volta sola per spec)."""
+    spec = dict(spec or DEFAULT_CURVE)
+    key = _spec_key(spec)
+    curve = _curve_cache.get(key)
+    if curve is None:
+        curve = LevelCurve.from_spec(spec)
+        _curve_cache[key] = curve
+    return curve
+
+
+default_curve = get_curve(DEFAULT_CURVE)
+
+
+class GuildCurves:
+    """Sceglie la curva di ogni guild a partire dalla configurazione dei livelli."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+
+    def spec_for(self, guild_id: Optional[int]) -> Dict[str, Any]:
+        if guild_id is not None:
+            spec = self.config.get('guild_curves', {}).get(str(guild_id))
+            if spec:
+                return spec
+        return self.config.get('curve') or DEFAULT_CURVE
+
+    def for_guild(self, guild_id: Optional[int]) -> LevelCurve:
+        return get_curve(self.spec_for(guild_id))
+
+    def set_guild_curve(self, guild_id: int, spec: Optional[Dict[str, Any]]) -> LevelCurve:
+        """Imposta (o con None rimuove) la curva della guild; valida la spec prima di salvarla."""
+        curves = self.config.setdefault('guild_curves', {})
+        if spec is None:
+            curves.pop(str(guild_id), None)
+        else:
+            get_curve(spec)
+            curves[str(guild_id)] = dict(spec)
+        return self.for_guild(guild_id)
+
+
+def recompute_levels(old: LevelCurve, new: LevelCurve, rows: Sequence[Tuple[int, int]]) -> Dict[int, Tuple[int, int]]:
+    """Confronta in un solo passaggio i livelli di (user_id, xp) con due curve.
+
+    Ritorna {user_id: (livello_vecchio, livello_nuovo)} solo per chi cambia livello.
+    """
+    xps = [xp for _, xp in rows]
+    before = old.levels_for(xps)
+    after = new.levels_for(xps)
+    return {uid: (b, a) for (uid, _), b, a in zip(rows, before, after) if b != a}
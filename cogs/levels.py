@@ -4,44 +4,35 @@ from discord import app_commands
 import json
 import os
 import random
+import asyncio
 import time
 from typing import Optional, Tuple
 from io import BytesIO
 
 from bot_utils import owner_or_has_permissions
-import asyncio
-
-# Local async JSON helpers (fallback when json_store is unavailable)
-async def load_json(path: str, default):
-    try:
-        return await asyncio.to_thread(_read_json_file, path, default)
-    except Exception:
-        return default
-
-def _read_json_file(path: str, default):
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return default
-    except Exception:
-        return default
-
-async def save_json(path: str, data):
-    try:
-        await asyncio.to_thread(_write_json_file, path, data)
-    except Exception:
-        pass
-
-def _write_json_file(path: str, data):
-    try:
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception:
-        pass
+from .console_logger import logger
+from .json_store import store
+from .levels_store import create_levels_store
+from .keyed_locks import get_locks
+from .message_pipeline import MessageContext, get_pipeline
+from .metrics import loop_timer
+from .level_curve import CURVE_TYPES, GuildCurves, default_curve, recompute_levels
+from .xp_accrual import XpAccrual
+from .voice_sessions import VoiceSessionTracker
+from .rank_index import IndexedLevelsStore
+from .member_resolver import resolver
+from .announcer import Announcer, Notice, is_rate_limit
+from .config_snapshots import CompiledConfig, LevelsSnapshot
+from .xp_windows import WindowedLevelsStore, XpWindows
+from . import rank_card
+
+DEFAULT_FLUSH_SECONDS = 5
+ANNOUNCE_DRAIN_SECONDS = 5.0
 
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'levels.json')
+VOICE_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'voice_sessions.json')
+XP_WINDOWS_PATH = os.path.join(os.path.dirname(__file__), 'xp_windows.json')
+LEADERBOARD_PERIODS = {'all': 'Totale', 'day': 'Giornaliera', 'week': 'Settimanale', 'month': 'Mensile'}
 DATA_PATH = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')), 'data', 'levels.json')
 
 
@@ -56,19 +47,16 @@ def load_config():
             "voice_xp": {"enabled": True, "per_min_min": 2, "per_min_max": 5, "exclude_muted": True, "exclude_deaf": True, "exclude_afk_channel_ids": [], "excluded_role_ids": [], "multiplier_roles": {}},
             "announce_channel_id": "1381590680518000670",
             "leaderboard": {"page_size": 10},
+            "storage": {"backend": "json", "sqlite_path": "levels.db"},
             "rank_card": {"width": 934, "height": 282, "background": "assets/rankcard/rank_black.png", "bar_color": "#14ff72", "bar_bg": "#1f1f1f", "text_color": "#ffffff", "font_path": "assets/rankcard/Roboto-Bold.ttf"}
         }
 
 
-def user_has_excluded_role(member: discord.Member, role_ids):
-    return any(str(r.id) in set(map(str, role_ids)) for r in member.roles)
-
-
-def get_multiplier(member: discord.Member, mapping: dict) -> float:
+def multiplier_for_roles(role_ids, mapping: dict) -> float:
     mult = 1.0
     for rid, factor in mapping.items():
         try:
-            if any(str(r.id) == str(rid) for r in member.roles):
+            if int(rid) in role_ids:
                 mult = max(mult, float(factor))
         except Exception:
             continue
@@ -76,177 +64,239 @@ def get_multiplier(member: discord.Member, mapping: dict) -> float:
 
 
 def level_from_xp(total_xp: int) -> Tuple[int, int, int]:
-    # Simple curve: next = 5*lvl^2 + 50*lvl + 100
-    level = 0
-    xp = total_xp
-    while True:
-        needed = 5 * level * level + 50 * level + 100
-        if xp < needed:
-            return level, xp, needed
-        xp -= needed
-        level += 1
+    # Curva predefinita: next = 5*lvl^2 + 50*lvl + 100 (tabella cumulativa + bisezione)
+    return default_curve.level_from_xp(total_xp)
+
+
+def parse_curve_params(raw: str) -> dict:
+    """`"a=5, b=50, c=100"` -> {'a': 5.0, 'b': 50.0, 'c': 100.0}; `"xp=100 150 200"` per le tabelle."""
+    params = {}
+    for part in (raw or '').split(','):
+        key, _, value = part.partition('=')
+        key, value = key.strip(), value.strip()
+        if not key:
+            continue
+        if key == 'xp':
+            params[key] = [int(x) for x in value.split()]
+        else:
+            params[key] = float(value)
+    return params
 
 
 class LevelsCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.config = load_config()
+        # Config già convertita per lo stadio messaggi (id int, moltiplicatori ordinati)
+        self.settings = CompiledConfig(LevelsSnapshot.from_config, self.config)
+        # Posizioni e classifiche servite da un indice ordinato in memoria,
+        # e XP guadagnati per giorno (classifiche giornaliere/settimanali/mensili)
+        self.windows = XpWindows(XP_WINDOWS_PATH)
+        self.windows.restore()
+        self.xp_store = WindowedLevelsStore(IndexedLevelsStore(create_levels_store(self.config, DATA_PATH)), self.windows)
+        self.curves = GuildCurves(self.config)
+        # XP dei messaggi: cooldown in memoria, accredito in blocco a ogni tick
+        self.accrual = XpAccrual(self.xp_store, self.curves.for_guild)
+        self._flush_lock = asyncio.Lock()
+        # Sessioni vocali aggiornate dagli eventi; il voice_loop accredita i minuti accumulati
+        self.voice = VoiceSessionTracker(self.config.get('voice_xp', {}), multiplier_for_roles, VOICE_SNAPSHOT_PATH)
+        self._voice_started = False
+        # Rank card disegnate in un pool di thread, con avatar e asset in cache
+        self.card_renderer = rank_card.RankCardRenderer(self.config.get('rank_card', {}).get('max_concurrent', 2))
+        # Annunci di level-up in coda per canale, raggruppati se arrivano in tanti
+        self.announcer = Announcer(self._announce_channel, self._send_level_up, self._send_level_ups,
+                                   self.config.get('announce', {}))
+        # Lock per (guild, utente) per i comandi admin che modificano gli XP
+        self._user_locks = get_locks('levels.user')
+
+    def _apply_config(self):
+        self.settings.refresh(self.config)
+        self.voice.configure(self.config.get('voice_xp', {}))
+        self.curves.config = self.config
 
     def save_config(self):
-        try:
-            with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-        except Exception:
-            pass
+        self._apply_config()
+        store.put(CONFIG_PATH, self.config)
 
-    async def _announce_level_up(self, guild: discord.Guild, member: discord.Member, level: int):
-        """Annuncia il level-up mostrando una rank card con XP totali e XP mancanti."""
+    def reload_config(self):
+        """Rilegge levels.json dal disco (modificato a mano) senza ricaricare il cog."""
+        store.discard(CONFIG_PATH)
+        self.config = store.load(CONFIG_PATH, self.config)
+        self._apply_config()
+
+    def _announce_level_up(self, guild: discord.Guild, member: discord.Member, level: int):
+        """Accoda l'annuncio del level-up: l'invio avviene nel task del canale, senza bloccare gli XP."""
         channel_id = self.config.get('announce_channel_id')
         if not channel_id:
             return
         try:
-            ch = guild.get_channel(int(channel_id)) or await guild.fetch_channel(int(channel_id))
+            self.announcer.enqueue(int(channel_id), member.id, (member, level))
         except Exception:
-            return
-        if not ch:
-            return
+            pass
+
+    async def _announce_channel(self, channel_id: int):
+        return self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+
+    async def _send_level_up(self, ch, notice: Notice):
+        """Annuncia il level-up mostrando una rank card con XP totali e XP mancanti."""
+        member, level = notice.payload
+        guild = member.guild
         # Costruisci embed rank (riusa campi configurati)
         try:
             embed = await self.generate_rank_embed(member)
             embed.title = "🎉 Level Up!"
             embed.description = f"{member.mention} ha raggiunto il livello {level}!"
-            data = await load_json(DATA_PATH, {})
-            u = data.get(str(guild.id), {}).get('users', {}).get(str(member.id), {"xp": 0})
-            total = int(u.get('xp', 0))
-            lvl, cur_xp, needed = level_from_xp(total)
+            total = (await self.xp_store.get_user(guild.id, member.id))['xp']
+            lvl, cur_xp, needed = self.curves.for_guild(guild.id).level_from_xp(total)
             remaining = max(0, needed - cur_xp)
             embed.add_field(name="XP Totale", value=str(total), inline=True)
             embed.add_field(name="XP nel livello", value=f"{cur_xp}/{needed}", inline=True)
             embed.add_field(name="XP al prossimo", value=str(remaining), inline=True)
             file = await self.generate_rank_card_file(member)
             if file:
-                embed.set_image(url='attachment://rankcard.png')
+                embed.set_image(url=f'attachment://{file.filename}')
                 await ch.send(embed=embed, file=file)
             else:
                 await ch.send(embed=embed)
-        except Exception:
+        except Exception as e:
+            if is_rate_limit(e):
+                raise
             # Fallback testo semplice
+            await ch.send(f"🎉 {member.mention} ha raggiunto il livello {level}!")
+
+    async def _send_level_ups(self, ch, notices):
+        """Un solo embed per molti level-up arrivati insieme nello stesso canale."""
+        lines = []
+        size = 0
+        for i, notice in enumerate(notices):
+            member, level = notice.payload
+            line = f"{member.mention} → livello **{level}**"
+            if size + len(line) > 3800:
+                lines.append(f"…e altri {len(notices) - i}")
+                break
+            lines.append(line)
+            size += len(line) + 1
+        embed = discord.Embed(title=f"🎉 Level Up! ({len(notices)})", description='\n'.join(lines), color=0x14ff72)
+        await ch.send(embed=embed)
+
+    async def cog_unload(self):
+        get_pipeline(self.bot).unregister('levels')
+        for loop in (self.voice_loop, self.accrual_tick):
             try:
-                await ch.send(f"🎉 {member.mention} ha raggiunto il livello {level}!")
+                loop.cancel()
             except Exception:
                 pass
-
-    def cog_unload(self):
+        # Salva gli XP ancora nel buffer (e le sessioni vocali) prima di chiudere il backend
         try:
-            self.voice_loop.cancel()
+            await self._flush_accrual(announce=False)
         except Exception:
             pass
+        self.voice.save()
+        self.windows.save()
+        # Qualche secondo per inviare gli annunci già in coda prima di fermare i task dei canali
+        await self.announcer.close(drain_timeout=ANNOUNCE_DRAIN_SECONDS)
+        self.card_renderer.close()
+        await self.xp_store.close()
 
     @commands.Cog.listener()
     async def on_ready(self):
         # Migrazione schema: combina text_xp + voice_xp in un unico campo xp se non presente
         try:
-            data = await load_json(DATA_PATH, {})
-            changed = False
-            for gid, g in list(data.items()):
-                users = g.get('users', {})
-                for uid, u in list(users.items()):
-                    if 'xp' not in u:
-                        total = int(u.get('text_xp', 0)) + int(u.get('voice_xp', 0)) + int(u.get('xp', 0))
-                        users[uid] = {
-                            'xp': total,
-                            'last_msg_xp_at': int(u.get('last_msg_xp_at', 0))
-                        }
-                        changed = True
-                g['users'] = users
-                data[gid] = g
-            if changed:
-                await save_json(DATA_PATH, data)
+            await self.xp_store.migrate_legacy()
         except Exception:
             pass
-        self.voice_loop.start()
-
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot or not message.guild:
+        try:
+            await self.xp_store.warm()
+        except Exception as e:
+            logger.error(f'[Levels] Costruzione indice classifiche fallita: {e}')
+        if not self.voice_loop.is_running():
+            self.voice_loop.start()
+
+    async def cog_load(self):
+        get_pipeline(self.bot).register('levels', self._message_stage, order=30)
+        seconds = float(self.config.get('text_xp', {}).get('flush_seconds', DEFAULT_FLUSH_SECONDS))
+        self.accrual_tick.change_interval(seconds=max(0.5, seconds))
+        self.accrual_tick.start()
+
+    async def _message_stage(self, ctx: MessageContext):
+        """Stadio XP testuale della pipeline messaggi."""
+        if ctx.guild_id is None:
             return
-        if not self.config.get('enabled', True):
+        snap = self.settings.current
+        if not snap.enabled:
             return
-        text_cfg = self.config.get('text_xp', {})
-        if str(message.channel.id) in set(map(str, text_cfg.get('excluded_channel_ids', []))):
+        if ctx.channel_id in snap.text_excluded_channels:
             return
-        if isinstance(message.author, discord.Member) and user_has_excluded_role(message.author, text_cfg.get('excluded_role_ids', [])):
+        if not snap.text_excluded_roles.isdisjoint(ctx.role_ids):
             return
 
         now = int(time.time())
-        cooldown = int(text_cfg.get('cooldown_seconds', 60))
-        data = await load_json(DATA_PATH, {})
-        gid = str(message.guild.id)
-        uid = str(message.author.id)
-        g = data.get(gid, {})
-        users = g.get('users', {})
-        u = users.get(uid, {"xp": 0, "last_msg_xp_at": 0})
-        last = int(u.get('last_msg_xp_at', 0) or 0)
-        if last and now - last < cooldown:
+        mult = snap.text_multiplier(ctx.role_ids)
+        lo, hi = snap.text_min, snap.text_max
+        await self.accrual.offer(ctx.guild_id, ctx.author_id, now, snap.text_cooldown,
+                                 lambda: int(random.randint(lo, hi) * mult),
+                                 ctx.author if ctx.is_member else None)
+
+    @tasks.loop(seconds=DEFAULT_FLUSH_SECONDS)
+    @loop_timer('levels_accrual_tick')
+    async def accrual_tick(self):
+        try:
+            await self._flush_accrual()
+        except Exception as e:
+            logger.error(f'[Levels] Accredito XP in blocco fallito: {e}')
+
+    async def _flush_accrual(self, announce: bool = True):
+        """Applica gli XP accumulati e annuncia i level-up dell'intero blocco."""
+        cooldown = self.settings.current.text_cooldown
+        async with self._flush_lock:
+            ups = await self.accrual.flush(int(time.time()), cooldown)
+        if not announce:
             return
+        for gid, uid, level, member in ups:
+            if member is None:
+                continue
+            self._announce_level_up(member.guild, member, level)
 
-        amount = random.randint(int(text_cfg.get('min', 5)), int(text_cfg.get('max', 15)))
-        mult = get_multiplier(message.author, text_cfg.get('multiplier_roles', {}))
-        amount = int(amount * mult)
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        # Chi rientra non deve restare nella cache negativa delle classifiche
+        resolver.forget(member.guild.id, member.id)
 
-        prev_total = int(u.get('xp', 0))
-        prev_level, _, _ = level_from_xp(prev_total)
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        self._start_voice_tracking()
+        self.voice.update(member, after)
 
-        u['xp'] = prev_total + amount
-        u['last_msg_xp_at'] = now
-        users[uid] = u
-        g['users'] = users
-        data[gid] = g
-        await save_json(DATA_PATH, data)
-        new_level, _, _ = level_from_xp(u['xp'])
-        if new_level > prev_level and isinstance(message.author, discord.Member):
-            await self._announce_level_up(message.guild, message.author, new_level)
+    def _start_voice_tracking(self):
+        """Alla prima occasione: riprende lo snapshot e apre le sessioni di chi è già in vocale."""
+        if self._voice_started:
+            return
+        self._voice_started = True
+        try:
+            self.voice.restore(self.bot.guilds)
+            self.voice.bootstrap(self.bot.guilds)
+        except Exception as e:
+            logger.error(f'[Levels] Avvio sessioni vocali fallito: {e}')
 
     @tasks.loop(minutes=1)
+    @loop_timer('levels_voice_loop')
     async def voice_loop(self):
         await self.bot.wait_until_ready()
-        # Simple per-minute scan across voice channels for connected members
+        self._start_voice_tracking()
+        # Voci scadute della cache membri delle classifiche (condivisa con counting)
+        resolver.prune()
+        # Accredita i minuti idonei di tutte le sessioni in un unico batch:
+        # l'accredito è additivo e atomico nel backend, non serve il lock per utente
         try:
-            if not self.config.get('voice_xp', {}).get('enabled', True):
+            grants, by_key = self.voice.collect()
+            self.voice.save()
+            self.windows.save()
+            if not grants:
                 return
-            vcfg = self.config.get('voice_xp', {})
-            per_min = random.randint(int(vcfg.get('per_min_min', 2)), int(vcfg.get('per_min_max', 5)))
-            for guild in self.bot.guilds:
-                for vc in guild.voice_channels:
-                    if str(vc.id) in set(map(str, vcfg.get('exclude_afk_channel_ids', []))):
-                        continue
-                    members = [m for m in vc.members if not m.bot]
-                    for m in members:
-                        if isinstance(m, discord.Member):
-                            if vcfg.get('exclude_muted', True) and (m.voice.self_mute or m.voice.mute):
-                                continue
-                            if vcfg.get('exclude_deaf', True) and (m.voice.self_deaf or m.voice.deaf):
-                                continue
-                            if user_has_excluded_role(m, vcfg.get('excluded_role_ids', [])):
-                                continue
-                            mult = get_multiplier(m, vcfg.get('multiplier_roles', {}))
-                            amount = int(per_min * mult)
-                            data = await load_json(DATA_PATH, {})
-                            gid = str(guild.id)
-                            uid = str(m.id)
-                            g = data.get(gid, {})
-                            users = g.get('users', {})
-                            u = users.get(uid, {"xp": 0, "last_msg_xp_at": 0})
-                            prev_total = int(u.get('xp', 0))
-                            prev_level_prev, _, _ = level_from_xp(prev_total)
-                            u['xp'] = prev_total + amount
-                            users[uid] = u
-                            g['users'] = users
-                            data[gid] = g
-                            await save_json(DATA_PATH, data)
-                            new_level_after, _, _ = level_from_xp(u['xp'])
-                            if new_level_after > prev_level_prev:
-                                await self._announce_level_up(guild, m, new_level_after)
+            results = await self.xp_store.apply_grants(grants)
+            for gid, uid, new_level, m in self.accrual.level_ups(results, by_key):
+                if m is not None:
+                    self._announce_level_up(m.guild, m, new_level)
         except Exception:
             pass
 
@@ -256,21 +306,18 @@ class LevelsCog(commands.Cog):
 
     async def generate_rank_embed(self, member: discord.Member) -> discord.Embed:
         cfg = self.config.get('rank_embed', {})
-        # Fetch XP from JSON
-        data = await load_json(DATA_PATH, {})
-        gid = str(member.guild.id)
-        uid = str(member.id)
-        users = data.get(gid, {}).get('users', {})
-        u = users.get(uid, {"xp": 0})
-        xp = int(u.get('xp', 0))
-        level, cur_xp, needed = level_from_xp(xp)
+        xp = (await self.xp_store.get_user(member.guild.id, member.id))['xp']
+        level, cur_xp, needed = self.curves.for_guild(member.guild.id).level_from_xp(xp)
         progress = int((cur_xp / needed) * 100) if needed > 0 else 100
+        position = await self.xp_store.rank_of(member.guild.id, member.id)
+        rank = f"#{position}" if position else 'N/D'
 
         embed = discord.Embed(
             title=cfg.get('title', 'Rank Card'),
             description=cfg.get('description', '{user} - Livello {level}').format(
                 user=member.display_name,
-                level=level
+                level=level,
+                rank=rank
             ),
             color=int(cfg.get('color', '#14ff72').lstrip('#'), 16)
         )
@@ -281,11 +328,14 @@ class LevelsCog(commands.Cog):
         elif thumbnail:
             embed.set_thumbnail(url=thumbnail)
 
-        for field in cfg.get('fields', []):
-            name = field.get('name', '').format(xp=xp, remaining=needed - cur_xp, progress=progress)
-            value = field.get('value', '').format(xp=xp, remaining=needed - cur_xp, progress=progress)
+        fields = cfg.get('fields', [])
+        for field in fields:
+            name = field.get('name', '').format(xp=xp, remaining=needed - cur_xp, progress=progress, rank=rank)
+            value = field.get('value', '').format(xp=xp, remaining=needed - cur_xp, progress=progress, rank=rank)
             inline = field.get('inline', True)
             embed.add_field(name=name, value=value, inline=inline)
+        if not any('{rank}' in f.get('name', '') + f.get('value', '') for f in fields):
+            embed.add_field(name='Posizione', value=rank, inline=True)
 
         footer = cfg.get('footer', '')
         if footer:
@@ -296,77 +346,18 @@ class LevelsCog(commands.Cog):
     async def generate_rank_card_file(self, member: discord.Member) -> Optional[discord.File]:
         """Genera un'immagine della rank card da allegare (se Pillow disponibile)."""
         card_cfg = self.config.get('rank_card', {})
-        bg_path = card_cfg.get('background')
-        if not bg_path:
+        if not card_cfg.get('background') or not rank_card.available():
             return None
-        # Determina XP
-        data = await load_json(DATA_PATH, {})
-        u = data.get(str(member.guild.id), {}).get('users', {}).get(str(member.id), {"xp": 0})
-        total = int(u.get('xp', 0))
-        level, cur_xp, needed = level_from_xp(total)
-        remaining = max(0, needed - cur_xp)
+        total = (await self.xp_store.get_user(member.guild.id, member.id))['xp']
+        level, cur_xp, needed = self.curves.for_guild(member.guild.id).level_from_xp(total)
+        data = rank_card.CardData(member.display_name, level, cur_xp, needed)
         try:
-            from PIL import Image, ImageDraw, ImageFont
-        except Exception:
-            return None
-        try:
-            width = int(card_cfg.get('width', 934))
-            height = int(card_cfg.get('height', 282))
-            bar_color = card_cfg.get('bar_color', '#14ff72')
-            bar_bg = card_cfg.get('bar_bg', '#1f1f1f')
-            text_color = card_cfg.get('text_color', '#ffffff')
-            font_path = card_cfg.get('font_path')
-            # Carica sfondo
-            if os.path.isfile(bg_path):
-                base = Image.open(bg_path).convert('RGBA').resize((width, height))
-            else:
-                base = Image.new('RGBA', (width, height), (30, 30, 30, 255))
-            draw = ImageDraw.Draw(base)
-            # Font fallback
-            try:
-                font_large = ImageFont.truetype(font_path, 46) if font_path and os.path.isfile(font_path) else ImageFont.load_default()
-                font_small = ImageFont.truetype(font_path, 28) if font_path and os.path.isfile(font_path) else ImageFont.load_default()
-            except Exception:
-                font_large = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            # Testo utente e livello
-            name_text = f"{member.display_name}"[:25]
-            level_text = f"Level {level}"  
-            draw.text((30, 30), name_text, fill=text_color, font=font_large)
-            draw.text((30, 90), level_text, fill=text_color, font=font_small)
-            # Progress bar
-            bar_x, bar_y = 30, height - 90
-            bar_w, bar_h = width - 60, 40
-            # sfondo barra
-            draw.rounded_rectangle((bar_x, bar_y, bar_x + bar_w, bar_y + bar_h), radius=20, fill=bar_bg)
-            pct = 0 if needed == 0 else cur_xp / needed
-            fill_w = int(bar_w * pct)
-            if fill_w > 0:
-                draw.rounded_rectangle((bar_x, bar_y, bar_x + fill_w, bar_y + bar_h), radius=20, fill=bar_color)
-            prog_text = f"{cur_xp}/{needed} XP • Mancano {remaining}"  
-            tw, th = draw.textsize(prog_text, font=font_small)
-            draw.text((bar_x + (bar_w - tw)//2, bar_y + (bar_h - th)//2), prog_text, fill=text_color, font=font_small)
-            # Avatar cerchio
-            try:
-                avatar_asset = member.display_avatar.url
-                # Scarica avatar
-                import requests
-                resp = requests.get(avatar_asset, timeout=5)
-                if resp.status_code == 200:
-                    avatar_img = Image.open(BytesIO(resp.content)).convert('RGBA').resize((180, 180))
-                    mask = Image.new('L', (180, 180), 0)
-                    mask_draw = ImageDraw.Draw(mask)
-                    mask_draw.ellipse((0,0,180,180), fill=255)
-                    base.paste(avatar_img, (width - 210, 30), mask)
-            except Exception:
-                pass
-            bio = BytesIO()
-            base.save(bio, format='PNG')
-            bio.seek(0)
-            return discord.File(bio, filename='rankcard.png')
-        except Exception:
+            payload, ext = await self.card_renderer.render(card_cfg, data, member.display_avatar)
+        except Exception as e:
+            logger.error(f'[Levels] Rendering rank card fallito: {e}')
             return None
-    
+        return discord.File(BytesIO(payload), filename=f'rankcard.{ext}')
+
     level = app_commands.Group(name='level', description='Comandi relativi ai livelli e XP')
 
     @level.command(name='rank', description='Mostra la tua rank card (totale)')
@@ -376,38 +367,65 @@ class LevelsCog(commands.Cog):
         embed = await self.generate_rank_embed(member)
         file = await self.generate_rank_card_file(member)
         if file:
-            embed.set_image(url='attachment://rankcard.png')
+            embed.set_image(url=f'attachment://{file.filename}')
             await interaction.response.send_message(embed=embed, file=file, ephemeral=False)
         else:
             await interaction.response.send_message(embed=embed, ephemeral=False)
 
-    @level.command(name='leaderboard', description='Mostra la classifica XP totale')
-    @app_commands.describe(page='Pagina (da 1)')
-    async def slash_leaderboard(self, interaction: discord.Interaction, page: Optional[int] = 1):
+    @level.command(name='leaderboard', description='Mostra la classifica XP (totale o del periodo)')
+    @app_commands.describe(page='Pagina (da 1)', period='Periodo (default: totale)')
+    @app_commands.choices(period=[app_commands.Choice(name=label, value=value) for value, label in LEADERBOARD_PERIODS.items()])
+    async def slash_leaderboard(self, interaction: discord.Interaction, page: Optional[int] = 1,
+                                period: Optional[app_commands.Choice[str]] = None):
         await interaction.response.defer()
         page = max(1, int(page or 1))
+        period_key = period.value if period else 'all'
         page_size = int(self.config.get('leaderboard', {}).get('page_size', 10))
         offset = (page - 1) * page_size
-        data = await load_json(DATA_PATH, {})
-        gid = str(interaction.guild.id)
-        users = data.get(gid, {}).get('users', {})
-        items = []
-        for uid, u in users.items():
-            total = int(u.get('xp', 0))
-            items.append((int(uid), total))
-        items.sort(key=lambda x: x[1], reverse=True)
-        slice_items = items[offset:offset + page_size]
+        gid = interaction.guild.id
+        if period_key == 'all':
+            slice_items = await self.xp_store.top(gid, page_size, offset)
+            total = await self.xp_store.count(gid) if slice_items else 0
+        else:
+            slice_items = self.windows.top(gid, period_key, page_size, offset)
+            total = self.windows.count(gid, period_key)
         if not slice_items:
             await interaction.followup.send('Nessun dato in classifica.')
             return
+        pages = max(1, (total + page_size - 1) // page_size)
         desc = []
         rank_start = offset + 1
-        for i, (uid, xp) in enumerate(slice_items, start=rank_start):
-            user = interaction.guild.get_member(uid) or await interaction.guild.fetch_member(uid)
-            desc.append(f"**#{i}** {user.mention if user else uid} — {xp} XP")
-        embed = discord.Embed(title="Classifica Globale", description='\n'.join(desc), color=0x14ff72)
+        names = await resolver.names(interaction.guild, (uid for uid, _ in slice_items))
+        if period_key == 'all':
+            levels = self.curves.for_guild(gid).levels_for(xp for _, xp in slice_items)
+            for i, ((uid, xp), lvl) in enumerate(zip(slice_items, levels), start=rank_start):
+                desc.append(f"**#{i}** {names[uid]} — Lv {lvl} • {xp} XP")
+            title = "Classifica Globale"
+        else:
+            for i, (uid, xp) in enumerate(slice_items, start=rank_start):
+                desc.append(f"**#{i}** {names[uid]} — +{xp} XP")
+            title = f"Classifica {LEADERBOARD_PERIODS[period_key]}"
+        embed = discord.Embed(title=title, description='\n'.join(desc), color=0x14ff72)
+        embed.set_footer(text=f"Pagina {page}/{pages}")
         await interaction.followup.send(embed=embed)
 
+    @level.command(name='around', description='Mostra la classifica attorno a un utente')
+    @app_commands.describe(user='Utente (default: tu)')
+    async def slash_around(self, interaction: discord.Interaction, user: Optional[discord.Member] = None):
+        member = user or interaction.user
+        start, rows = await self.xp_store.around(interaction.guild.id, member.id, 5)
+        if not rows:
+            await interaction.response.send_message(f'{member.mention} non è ancora in classifica.', ephemeral=True)
+            return
+        levels = self.curves.for_guild(interaction.guild.id).levels_for(xp for _, xp in rows)
+        names = await resolver.names(interaction.guild, (uid for uid, _ in rows))
+        desc = []
+        for i, ((uid, xp), lvl) in enumerate(zip(rows, levels), start=start):
+            line = f"**#{i}** {names[uid]} — Lv {lvl} • {xp} XP"
+            desc.append(f"➡️ {line}" if uid == member.id else line)
+        embed = discord.Embed(title=f"Classifica attorno a {member.display_name}", description='\n'.join(desc), color=0x14ff72)
+        await interaction.response.send_message(embed=embed)
+
     @level.command(name='setchannel', description='Imposta il canale per gli annunci di level-up (admin o manage_guild)')
     @owner_or_has_permissions(administrator=True)
     @app_commands.describe(channel='Canale dove annunciare i level-up')
@@ -416,23 +434,55 @@ class LevelsCog(commands.Cog):
         self.save_config()
         await interaction.response.send_message(f'✅ Canale di annunci impostato su {channel.mention}.', ephemeral=True)
 
+    @level.command(name='reload', description='Ricarica la configurazione dei livelli (admin)')
+    @owner_or_has_permissions(administrator=True)
+    async def slash_reload(self, interaction: discord.Interaction):
+        try:
+            self.reload_config()
+            await interaction.response.send_message('✅ Configurazione dei livelli ricaricata.', ephemeral=True)
+        except Exception as e:
+            await interaction.response.send_message(f'❌ Errore nel ricaricare la configurazione: {e}', ephemeral=True)
+
+    @level.command(name='curve', description='Cambia la curva dei livelli della guild (admin)')
+    @owner_or_has_permissions(administrator=True)
+    @app_commands.describe(tipo='Tipo di curva (reset = curva predefinita)',
+                           parametri='Es. "a=5, b=50, c=100" (quadratic), "base=100, step=50" (linear), "xp=100 200 400" (table)')
+    @app_commands.choices(tipo=[app_commands.Choice(name=name, value=name) for name in CURVE_TYPES] + [
+        app_commands.Choice(name='reset', value='reset')])
+    async def slash_curve(self, interaction: discord.Interaction, tipo: app_commands.Choice[str], parametri: Optional[str] = None):
+        guild_id = interaction.guild.id
+        old = self.curves.for_guild(guild_id)
+        try:
+            spec = None if tipo.value == 'reset' else {'type': tipo.value, **parse_curve_params(parametri)}
+            new = self.curves.set_guild_curve(guild_id, spec)
+        except Exception as e:
+            await interaction.response.send_message(f'❌ Curva non valida: {e}', ephemeral=True)
+            return
+        self.save_config()
+        # Ricalcolo in un solo passaggio di tutti i membri della guild
+        rows = await self.xp_store.guild_rows(guild_id)
+        changed = recompute_levels(old, new, rows)
+        up = sum(1 for before, after in changed.values() if after > before)
+        preview = ' / '.join(str(new.xp_for_level(lv)) for lv in (1, 10, 50))
+        await interaction.response.send_message(
+            f'✅ Curva aggiornata ({tipo.value}). Utenti con livello cambiato: {len(changed)}/{len(rows)} '
+            f'(⬆️ {up} • ⬇️ {len(changed) - up}).\nXP per livello 1/10/50: {preview}',
+            ephemeral=True)
+
     @level.command(name='stats', description='Mostra le statistiche di livello totale')
     @app_commands.describe(user='Utente da mostrare')
     async def slash_stats(self, interaction: discord.Interaction, user: Optional[discord.Member] = None):
         member = user or interaction.user
-        data = await load_json(DATA_PATH, {})
-        gid = str(interaction.guild.id)
-        uid = str(member.id)
-        users = data.get(gid, {}).get('users', {})
-        u = users.get(uid, {"xp": 0})
-        total_xp = int(u.get('xp', 0))
-        level, cur_xp, needed = level_from_xp(total_xp)
+        total_xp = (await self.xp_store.get_user(interaction.guild.id, member.id))['xp']
+        position = await self.xp_store.rank_of(interaction.guild.id, member.id)
+        level, cur_xp, needed = self.curves.for_guild(interaction.guild.id).level_from_xp(total_xp)
         remaining = max(0, needed - cur_xp)
         embed = discord.Embed(title="Statistiche Totali", color=0x14ff72)
         embed.set_author(name=member.display_name, icon_url=member.display_avatar.url)
         embed.add_field(name='Livello', value=str(level))
         embed.add_field(name='XP totale', value=str(total_xp))
         embed.add_field(name='XP nel livello', value=f"{cur_xp}/{needed}")
+        embed.add_field(name='Posizione', value=f"#{position}" if position else 'N/D')
         embed.add_field(name='XP mancanti al prossimo', value=str(remaining), inline=False)
         await interaction.response.send_message(embed=embed)
 
@@ -440,34 +490,19 @@ class LevelsCog(commands.Cog):
     @owner_or_has_permissions(administrator=True)
     @app_commands.describe(user='Utente', amount='Quantità da aggiungere')
     async def slash_givexp(self, interaction: discord.Interaction, user: discord.Member, amount: int):
-        data = await load_json(DATA_PATH, {})
-        gid = str(interaction.guild.id)
-        uid = str(user.id)
-        g = data.get(gid, {})
-        users = g.get('users', {})
-        u = users.get(uid, {"xp": 0, "last_msg_xp_at": 0})
-        u['xp'] = int(u.get('xp', 0)) + int(amount)
-        users[uid] = u
-        g['users'] = users
-        data[gid] = g
-        await save_json(DATA_PATH, data)
+        async with self._user_locks((interaction.guild.id, user.id)):
+            await self.xp_store.apply_grants([(interaction.guild.id, user.id, int(amount), None)])
         await interaction.response.send_message(f'Aggiunti {amount} XP totali a {user.mention}.', ephemeral=True)
 
     @level.command(name='setxp', description='Imposta gli XP totali di un utente (solo admin)')
     @owner_or_has_permissions(administrator=True)
     @app_commands.describe(user='Utente', amount='Nuovo totale XP')
     async def slash_setxp(self, interaction: discord.Interaction, user: discord.Member, amount: int):
-        data = await load_json(DATA_PATH, {})
-        gid = str(interaction.guild.id)
-        uid = str(user.id)
-        g = data.get(gid, {})
-        users = g.get('users', {})
-        u = users.get(uid, {"xp": 0, "last_msg_xp_at": 0})
-        u['xp'] = int(amount)
-        users[uid] = u
-        g['users'] = users
-        data[gid] = g
-        await save_json(DATA_PATH, data)
+        # Anche il lock del flush: un blocco in corso non deve sommare i vecchi XP al nuovo totale
+        async with self._user_locks((interaction.guild.id, user.id)), self._flush_lock:
+            # Il totale impostato sostituisce anche gli XP non ancora accreditati
+            self.accrual.discard(interaction.guild.id, user.id)
+            await self.xp_store.set_xp(interaction.guild.id, user.id, int(amount))
         await interaction.response.send_message(f'Settati {amount} XP totali per {user.mention}.', ephemeral=True)
 
 
@@ -0,0 +1,370 @@
+"""Backend di persistenza per gli XP dei livelli.
+
+Due implementazioni con la stessa interfaccia asincrona:
+- `JsonLevelsStore`: il classico levels.json, tenuto in memoria da json_store;
+- `SqliteLevelsStore`: tabella SQLite in modalità WAL con indice
+  (guild_id, xp DESC) per classifiche e posizioni senza ordinare tutto.
+
+Gli ID sono sempre interi nell'interfaccia; il backend JSON li converte in
+stringa per restare compatibile con il formato esistente.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .json_store import store
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("levels_store")
+
+# (guild_id, user_id, xp_da_aggiungere, last_msg_xp_at oppure None)
+Grant = Tuple[int, int, int, Optional[int]]
+# (guild_id, user_id, xp_prima, xp_dopo)
+GrantResult = Tuple[int, int, int, int]
+# (guild_id, user_id, xp) da fondere con quanto salvato (import di dati)
+XpRow = Tuple[int, int, int]
+
+MERGE_MODES = ('add', 'overwrite', 'max')
+
+
+def merge_xp(before: int, value: int, mode: str) -> int:
+    """XP risultante fondendo `value` con `before` secondo `mode` (mai negativo)."""
+    if mode == 'add':
+        return max(0, before + value)
+    if mode == 'max':
+        return max(before, value)
+    if mode == 'overwrite':
+        return max(0, value)
+    raise ValueError(f'Modalità di unione sconosciuta: {mode}')
+
+
+class JsonLevelsStore:
+    backend = 'json'
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def _data(self) -> dict:
+        # Compatto: con centinaia di migliaia di utenti l'indentazione triplica il costo del flush
+        return (await store.open(self.path, {}, indent=None)).data
+
+    @staticmethod
+    def _users(data: dict, guild_id: int) -> dict:
+        g = data.setdefault(str(guild_id), {})
+        return g.setdefault('users', {})
+
+    async def get_user(self, guild_id: int, user_id: int) -> Dict[str, int]:
+        data = await self._data()
+        u = data.get(str(guild_id), {}).get('users', {}).get(str(user_id), {})
+        return {'xp': int(u.get('xp', 0)), 'last_msg_xp_at': int(u.get('last_msg_xp_at', 0) or 0)}
+
+    async def apply_grants(self, grants: Iterable[Grant]) -> List[GrantResult]:
+        data = await self._data()
+        results = []
+        for gid, uid, amount, last_at in grants:
+            users = self._users(data, gid)
+            u = users.setdefault(str(uid), {'xp': 0, 'last_msg_xp_at': 0})
+            before = int(u.get('xp', 0))
+            u['xp'] = before + int(amount)
+            if last_at is not None:
+                u['last_msg_xp_at'] = int(last_at)
+            results.append((gid, uid, before, u['xp']))
+        if results:
+            store.mark_dirty(self.path)
+        return results
+
+    async def set_xp(self, guild_id: int, user_id: int, xp: int) -> int:
+        data = await self._data()
+        u = self._users(data, guild_id).setdefault(str(user_id), {'xp': 0, 'last_msg_xp_at': 0})
+        before = int(u.get('xp', 0))
+        u['xp'] = int(xp)
+        store.mark_dirty(self.path)
+        return before
+
+    async def set_many(self, rows: Iterable[XpRow], mode: str = 'overwrite') -> List[GrantResult]:
+        data = await self._data()
+        results = []
+        for gid, uid, value in rows:
+            u = self._users(data, gid).setdefault(str(uid), {'xp': 0, 'last_msg_xp_at': 0})
+            before = int(u.get('xp', 0))
+            u['xp'] = merge_xp(before, int(value), mode)
+            results.append((gid, uid, before, u['xp']))
+        if results:
+            store.mark_dirty(self.path)
+        return results
+
+    async def guild_rows(self, guild_id: int) -> List[Tuple[int, int]]:
+        data = await self._data()
+        users = data.get(str(guild_id), {}).get('users', {})
+        return [(int(uid), int(u.get('xp', 0))) for uid, u in users.items()]
+
+    async def guild_ids(self) -> List[int]:
+        data = await self._data()
+        return [int(gid) for gid in data.keys()]
+
+    async def top(self, guild_id: int, limit: int, offset: int = 0) -> List[Tuple[int, int]]:
+        items = await self.guild_rows(guild_id)
+        items.sort(key=lambda x: x[1], reverse=True)
+        return items[offset:offset + limit]
+
+    async def rank_of(self, guild_id: int, user_id: int) -> Optional[int]:
+        data = await self._data()
+        users = data.get(str(guild_id), {}).get('users', {})
+        u = users.get(str(user_id))
+        if u is None:
+            return None
+        xp = int(u.get('xp', 0))
+        return 1 + sum(1 for other in users.values() if int(other.get('xp', 0)) > xp)
+
+    async def count(self, guild_id: int) -> int:
+        data = await self._data()
+        return len(data.get(str(guild_id), {}).get('users', {}))
+
+    async def migrate_legacy(self) -> bool:
+        """Combina text_xp + voice_xp in un unico campo xp se non presente."""
+        data = await self._data()
+        changed = False
+        for gid, g in list(data.items()):
+            users = g.get('users', {})
+            for uid, u in list(users.items()):
+                if 'xp' not in u:
+                    total = int(u.get('text_xp', 0)) + int(u.get('voice_xp', 0)) + int(u.get('xp', 0))
+                    users[uid] = {
+                        'xp': total,
+                        'last_msg_xp_at': int(u.get('last_msg_xp_at', 0))
+                    }
+                    changed = True
+            g['users'] = users
+            data[gid] = g
+        if changed:
+            store.mark_dirty(self.path)
+        return changed
+
+    async def close(self):
+        pass
+
+
+class SqliteLevelsStore:
+    backend = 'sqlite'
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS levels ("
+        " guild_id INTEGER NOT NULL,"
+        " user_id INTEGER NOT NULL,"
+        " xp INTEGER NOT NULL DEFAULT 0,"
+        " last_msg_xp_at INTEGER NOT NULL DEFAULT 0,"
+        " PRIMARY KEY (guild_id, user_id)"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS idx_levels_guild_xp ON levels (guild_id, xp DESC)",
+    )
+
+    def __init__(self, path: str, import_json_path: Optional[str] = None):
+        self.path = path
+        self.import_json_path = import_json_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for stmt in self.SCHEMA:
+                conn.execute(stmt)
+            self._conn = conn
+            self._import_json(conn)
+        return self._conn
+
+    def _import_json(self, conn: sqlite3.Connection):
+        """Al primo avvio copia i dati da levels.json, se il database è vuoto."""
+        src = self.import_json_path
+        if not src or not os.path.exists(src):
+            return
+        if conn.execute('SELECT 1 FROM levels LIMIT 1').fetchone():
+            return
+        data = store.load(src, {})
+        rows = []
+        for gid, g in data.items():
+            for uid, u in g.get('users', {}).items():
+                try:
+                    xp = int(u.get('xp', int(u.get('text_xp', 0)) + int(u.get('voice_xp', 0))))
+                    rows.append((int(gid), int(uid), xp, int(u.get('last_msg_xp_at', 0) or 0)))
+                except (TypeError, ValueError):
+                    continue
+        if not rows:
+            return
+        conn.execute('BEGIN')
+        conn.executemany('INSERT OR IGNORE INTO levels (guild_id, user_id, xp, last_msg_xp_at) VALUES (?, ?, ?, ?)', rows)
+        conn.execute('COMMIT')
+        logger.info(f'[Levels] Importati {len(rows)} utenti da {src} in {self.path}')
+
+    def _run(self, fn, *args):
+        with self._lock:
+            return fn(self._connect(), *args)
+
+    async def _call(self, fn, *args):
+        return await asyncio.to_thread(self._run, fn, *args)
+
+    # ------------------ operazioni (eseguite nel thread) ------------------
+    @staticmethod
+    def _get_user(conn, guild_id, user_id):
+        row = conn.execute('SELECT xp, last_msg_xp_at FROM levels WHERE guild_id = ? AND user_id = ?', (guild_id, user_id)).fetchone()
+        if row is None:
+            return {'xp': 0, 'last_msg_xp_at': 0}
+        return {'xp': int(row[0]), 'last_msg_xp_at': int(row[1])}
+
+    @staticmethod
+    def _apply_grants(conn, grants):
+        # Raggruppa per utente: un solo upsert per (guild, user) nel batch
+        merged: Dict[Tuple[int, int], List[int]] = {}
+        for gid, uid, amount, last_at in grants:
+            entry = merged.setdefault((int(gid), int(uid)), [0, 0])
+            entry[0] += int(amount)
+            if last_at is not None:
+                entry[1] = max(entry[1], int(last_at))
+        if not merged:
+            return []
+        results = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for (gid, uid), (amount, last_at) in merged.items():
+                row = conn.execute('SELECT xp FROM levels WHERE guild_id = ? AND user_id = ?', (gid, uid)).fetchone()
+                before = int(row[0]) if row else 0
+                conn.execute(
+                    'INSERT INTO levels (guild_id, user_id, xp, last_msg_xp_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (guild_id, user_id) DO UPDATE SET '
+                    'xp = xp + excluded.xp, last_msg_xp_at = MAX(last_msg_xp_at, excluded.last_msg_xp_at)',
+                    (gid, uid, amount, last_at)
+                )
+                results.append((gid, uid, before, before + amount))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return results
+
+    @staticmethod
+    def _set_xp(conn, guild_id, user_id, xp):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT xp FROM levels WHERE guild_id = ? AND user_id = ?', (guild_id, user_id)).fetchone()
+            conn.execute(
+                'INSERT INTO levels (guild_id, user_id, xp) VALUES (?, ?, ?) '
+                'ON CONFLICT (guild_id, user_id) DO UPDATE SET xp = excluded.xp',
+                (guild_id, user_id, int(xp))
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _set_many(conn, rows, mode):
+        results = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for gid, uid, value in rows:
+                row = conn.execute('SELECT xp FROM levels WHERE guild_id = ? AND user_id = ?', (gid, uid)).fetchone()
+                before = int(row[0]) if row else 0
+                after = merge_xp(before, int(value), mode)
+                conn.execute(
+                    'INSERT INTO levels (guild_id, user_id, xp) VALUES (?, ?, ?) '
+                    'ON CONFLICT (guild_id, user_id) DO UPDATE SET xp = excluded.xp',
+                    (gid, uid, after)
+                )
+                results.append((gid, uid, before, after))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return results
+
+    @staticmethod
+    def _top(conn, guild_id, limit, offset):
+        rows = conn.execute(
+            'SELECT user_id, xp FROM levels WHERE guild_id = ? ORDER BY xp DESC, user_id LIMIT ? OFFSET ?',
+            (guild_id, int(limit), int(offset))
+        ).fetchall()
+        return [(int(uid), int(xp)) for uid, xp in rows]
+
+    @staticmethod
+    def _rank_of(conn, guild_id, user_id):
+        row = conn.execute('SELECT xp FROM levels WHERE guild_id = ? AND user_id = ?', (guild_id, user_id)).fetchone()
+        if row is None:
+            return None
+        above = conn.execute('SELECT COUNT(*) FROM levels WHERE guild_id = ? AND xp > ?', (guild_id, row[0])).fetchone()[0]
+        return int(above) + 1
+
+    @staticmethod
+    def _count(conn, guild_id):
+        return int(conn.execute('SELECT COUNT(*) FROM levels WHERE guild_id = ?', (guild_id,)).fetchone()[0])
+
+    @staticmethod
+    def _guild_rows(conn, guild_id):
+        rows = conn.execute('SELECT user_id, xp FROM levels WHERE guild_id = ?', (guild_id,)).fetchall()
+        return [(int(uid), int(xp)) for uid, xp in rows]
+
+    @staticmethod
+    def _guild_ids(conn):
+        return [int(r[0]) for r in conn.execute('SELECT DISTINCT guild_id FROM levels').fetchall()]
+
+    # ------------------ interfaccia asincrona ------------------
+    async def get_user(self, guild_id: int, user_id: int) -> Dict[str, int]:
+        return await self._call(self._get_user, int(guild_id), int(user_id))
+
+    async def apply_grants(self, grants: Iterable[Grant]) -> List[GrantResult]:
+        return await self._call(self._apply_grants, list(grants))
+
+    async def set_xp(self, guild_id: int, user_id: int, xp: int) -> int:
+        return await self._call(self._set_xp, int(guild_id), int(user_id), int(xp))
+
+    async def set_many(self, rows: Iterable[XpRow], mode: str = 'overwrite') -> List[GrantResult]:
+        return await self._call(self._set_many, [(int(g), int(u), int(x)) for g, u, x in rows], mode)
+
+    async def top(self, guild_id: int, limit: int, offset: int = 0) -> List[Tuple[int, int]]:
+        return await self._call(self._top, int(guild_id), limit, offset)
+
+    async def rank_of(self, guild_id: int, user_id: int) -> Optional[int]:
+        return await self._call(self._rank_of, int(guild_id), int(user_id))
+
+    async def count(self, guild_id: int) -> int:
+        return await self._call(self._count, int(guild_id))
+
+    async def guild_rows(self, guild_id: int) -> List[Tuple[int, int]]:
+        return await self._call(self._guild_rows, int(guild_id))
+
+    async def guild_ids(self) -> List[int]:
+        return await self._call(self._guild_ids)
+
+    async def migrate_legacy(self) -> bool:
+        return False
+
+    async def close(self):
+        def _close():
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+        await asyncio.to_thread(_close)
+
+
+def create_levels_store(config: dict, json_path: str):
+    """Sceglie il backend da `config['storage']` (default: JSON)."""
+    storage = config.get('storage', {}) or {}
+    backend = str(storage.get('backend', 'json')).lower()
+    if backend == 'sqlite':
+        db_path = storage.get('sqlite_path') or 'levels.db'
+        if not os.path.isabs(db_path):
+            db_path = os.path.join(os.path.dirname(json_path), db_path)
+        return SqliteLevelsStore(db_path, import_json_path=json_path)
+    return JsonLevelsStore(json_path)
@@ -1,7 +1,6 @@
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
-import json
 import os
 import re
 import asyncio
@@ -10,30 +9,17 @@ import time
 
 from .console_logger import logger
 from .coralmc_client import CoralMCClient
+from .json_store import store
+from .message_pipeline import MessageContext, get_pipeline
+from .metrics import loop_timer
 
 LINKS_FILE = os.path.join(os.path.dirname(__file__), 'mc_links.json')
 
-def _load_links() -> Dict[str, Any]:
-    if not os.path.exists(LINKS_FILE):
-        return {}
-    try:
-        with open(LINKS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
-def _save_links(data: Dict[str, Any]):
-    try:
-        with open(LINKS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f'Errore salvataggio mc_links.json: {e}')
-
 class LoginCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.client = CoralMCClient()
-        self.links: Dict[str, Any] = _load_links()
+        self.links: Dict[str, Any] = store.load(LINKS_FILE, {})
         # Struttura: { user_id: { minecraft, last_level, last_check_ts } }
         # Aggiunge sezione impostazioni globale: __settings__ -> { suffix }
         if '__settings__' not in self.links or not isinstance(self.links['__settings__'], dict):
@@ -52,7 +38,7 @@ class LoginCog(commands.Cog):
 
     def _set_suffix(self, new_suffix: str):
         self.links.setdefault('__settings__', {})['suffix'] = new_suffix[:4]
-        _save_links(self.links)
+        store.put(LINKS_FILE, self.links)
 
     async def _safe_defer(self, interaction: discord.Interaction, ephemeral: bool = True):
         """Tenta il defer dell'interazione in modo sicuro evitando eccezioni 404 Unknown interaction.
@@ -105,6 +91,7 @@ class LoginCog(commands.Cog):
             return None, f'HTTPException: {e}'
 
     @tasks.loop(hours=6)
+    @loop_timer('login_auto_update_levels')
     async def auto_update_levels(self):
         await self.bot.wait_until_ready()
         # Aggiorna il livello e suffisso per ogni utente collegato
@@ -122,11 +109,15 @@ class LoginCog(commands.Cog):
                     member = guild.get_member(member_id)
                     if member:
                         await self._apply_nick(member, level)
-                _save_links(self.links)
+                store.put(LINKS_FILE, self.links)
             # Piccola pausa per non saturare l'API
             await asyncio.sleep(0.5)
 
-    def cog_unload(self):
+    async def cog_load(self):
+        get_pipeline(self.bot).register('login', self._message_stage, order=40)
+
+    async def cog_unload(self):
+        get_pipeline(self.bot).unregister('login')
         try:
             self.auto_update_levels.cancel()
         except Exception:
@@ -151,7 +142,7 @@ class LoginCog(commands.Cog):
             'last_level': level,
             'last_check_ts': time.time()
         }
-        _save_links(self.links)
+        store.put(LINKS_FILE, self.links)
         new_nick, err = await self._apply_nick(member, level)
         if not new_nick:
             await interaction.followup.send(f'⚠️ Collegato `{username}` (livello `{level}`) ma nickname non modificato: {err}.', ephemeral=True)
@@ -173,7 +164,7 @@ class LoginCog(commands.Cog):
             return
         data['last_level'] = level
         data['last_check_ts'] = time.time()
-        _save_links(self.links)
+        store.put(LINKS_FILE, self.links)
         new_nick, err = await self._apply_nick(interaction.user, level)
         if not new_nick:
             await interaction.followup.send(f'⚠️ Livello aggiornato a `{level}` ma nickname invariato: {err}.', ephemeral=True)
@@ -188,7 +179,7 @@ class LoginCog(commands.Cog):
         if not data:
             await interaction.followup.send('ℹ️ Nessun collegamento da rimuovere.', ephemeral=True)
             return
-        _save_links(self.links)
+        store.put(LINKS_FILE, self.links)
         # Rimuove suffisso (simbolo configurabile + cifra/e)
         current = interaction.user.display_name
         new_nick = re.sub(r'\s*[^\s\d]\d+$', '', current).strip()
@@ -259,12 +250,10 @@ class LoginCog(commands.Cog):
         embed.set_footer(text=f'Pagina {page}/{total_pages} • Totale {len(entries)} utenti')
         await interaction.followup.send(embed=embed, ephemeral=True)
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-        uid = str(message.author.id)
-        data = self.links.get(uid)
+    async def _message_stage(self, ctx: MessageContext):
+        """Stadio della pipeline messaggi: aggiorna il livello BedWars degli utenti collegati."""
+        message = ctx.message
+        data = self.links.get(ctx.author_key)
         if not data:
             return
         now = time.time()
@@ -274,8 +263,9 @@ class LoginCog(commands.Cog):
         username = data.get('minecraft')
         if not username:
             return
-        level = await self._fetch_level(username)
+        # Segna il controllo prima della richiesta: i messaggi concorrenti non la ripetono
         data['last_check_ts'] = now
+        level = await self._fetch_level(username)
         if level is None:
             return
         if level != data.get('last_level'):
@@ -284,7 +274,7 @@ class LoginCog(commands.Cog):
             member = message.guild.get_member(message.author.id) if message.guild else None
             if member:
                 await self._apply_nick(member, level)
-            _save_links(self.links)
+            store.put(LINKS_FILE, self.links)
 
 async def setup(bot: commands.Bot):
     # Evita doppia registrazione su reload
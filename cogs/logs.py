@@ -6,18 +6,19 @@ import os
 import asyncio
 from datetime import datetime, timezone, timedelta
 from .console_logger import logger
+from .json_store import store
 
 
 BASE_DIR = os.path.dirname(__file__)
 LOG_JSON = os.path.join(BASE_DIR, 'log.json')
+CONFIG_PATH = os.path.join(os.path.dirname(BASE_DIR), 'config.json')
 
 class LogCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.config = {}
         self.log_config = {}
-        with open('./config.json', 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+        self.config = store.load(CONFIG_PATH, {})
         self.log_config = {}
         if os.path.exists(LOG_JSON):
             try:
@@ -0,0 +1,186 @@
+"""Risoluzione in blocco dei membri per le classifiche.
+
+Le classifiche chiedono una pagina intera di id in una sola chiamata:
+
+- chi è già nella cache di discord.py si risolve con `get_member`
+- gli altri con la query dei membri via gateway (`query_members(user_ids=...)`),
+  a blocchi di 100 id: una sola richiesta per pagina invece di un
+  `fetch_member` REST per riga
+- chi non torna da una query riuscita (o riceve NotFound dal fallback) ha
+  lasciato il server: finisce in una cache negativa (con scadenza) e non si
+  richiede di nuovo a ogni pagina; gli errori transitori (timeout, HTTP 5xx,
+  rate limit) non vengono memorizzati
+- i nomi visualizzati dei membri risolti fuori cache restano in una cache con
+  scadenza, così le pagine successive non rifanno la query
+
+Se la query via gateway non è disponibile (timeout, intent mancanti) si ripiega
+sul vecchio `fetch_member` uno per uno. Le voci scadute si tolgono con `prune`,
+chiamato periodicamente dal cog livelli.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import discord
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("member_resolver")
+
+Key = Tuple[int, int]
+
+CHUNK_SIZE = 100
+NAME_TTL = 600
+MISSING_TTL = 1800
+QUERY_TIMEOUT = 10
+
+
+class MemberResolver:
+    def __init__(self, name_ttl: float = NAME_TTL, missing_ttl: float = MISSING_TTL, chunk_size: int = CHUNK_SIZE):
+        self.name_ttl = name_ttl
+        self.missing_ttl = missing_ttl
+        self.chunk_size = max(1, min(100, int(chunk_size)))
+        # (guild, utente) -> (nome visualizzato, scadenza)
+        self._names: Dict[Key, Tuple[str, float]] = {}
+        # (guild, utente) -> scadenza della voce "non più nel server"
+        self._missing: Dict[Key, float] = {}
+        # Statistiche
+        self.cache_hits = 0
+        self.queries = 0
+        self.fetches = 0
+        self.missing_hits = 0
+
+    # ------------------ Cache ------------------
+    def _is_missing(self, key: Key, now: float) -> bool:
+        expires = self._missing.get(key)
+        if expires is None:
+            return False
+        if expires <= now:
+            del self._missing[key]
+            return False
+        return True
+
+    def _cached_name(self, key: Key, now: float) -> Optional[str]:
+        entry = self._names.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._names[key]
+            return None
+        return entry[0]
+
+    def _remember(self, guild_id: int, member, now: float):
+        key = (guild_id, member.id)
+        self._missing.pop(key, None)
+        self._names[key] = (member.display_name, now + self.name_ttl)
+
+    def forget(self, guild_id: int, user_id: int):
+        """Dimentica quanto noto sull'utente (es. è rientrato o ha cambiato nome)."""
+        key = (int(guild_id), int(user_id))
+        self._missing.pop(key, None)
+        self._names.pop(key, None)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Rimuove le voci scadute; ritorna quante."""
+        now = time.time() if now is None else now
+        names = [k for k, (_, exp) in self._names.items() if exp <= now]
+        for k in names:
+            del self._names[k]
+        missing = [k for k, exp in self._missing.items() if exp <= now]
+        for k in missing:
+            del self._missing[k]
+        return len(names) + len(missing)
+
+    # ------------------ Risoluzione ------------------
+    async def resolve_many(self, guild, user_ids: Iterable[int]) -> Dict[int, Any]:
+        """{user_id: Member o None} per tutti gli id; None per chi ha lasciato il server.
+
+        I membri fuori dalla cache di discord.py ma con il nome in cache si
+        riportano come None in questo dizionario: per il testo delle classifiche
+        usare `names`.
+        """
+        now = time.time()
+        out: Dict[int, Any] = {}
+        unknown: List[int] = []
+        for uid in dict.fromkeys(int(u) for u in user_ids):
+            member = guild.get_member(uid)
+            if member is not None:
+                out[uid] = member
+                self.cache_hits += 1
+                continue
+            out[uid] = None
+            key = (guild.id, uid)
+            if self._is_missing(key, now):
+                self.missing_hits += 1
+            elif self._cached_name(key, now) is None:
+                unknown.append(uid)
+        for start in range(0, len(unknown), self.chunk_size):
+            chunk = unknown[start:start + self.chunk_size]
+            members, absent = await self._lookup(guild, chunk)
+            now = time.time()
+            for member in members:
+                out[member.id] = member
+                self._remember(guild.id, member, now)
+            for uid in absent:
+                self._missing[(guild.id, uid)] = now + self.missing_ttl
+        return out
+
+    async def _lookup(self, guild, chunk: List[int]) -> Tuple[List[Any], Set[int]]:
+        """(membri trovati, id di sicuro assenti dal server)."""
+        try:
+            self.queries += 1
+            members = await asyncio.wait_for(
+                guild.query_members(user_ids=chunk, limit=len(chunk), cache=True), QUERY_TIMEOUT
+            )
+            # Query riuscita: chi non c'è ha lasciato il server
+            returned = {m.id for m in members}
+            return members, {uid for uid in chunk if uid not in returned}
+        except Exception as e:
+            logger.debug(f'[MemberResolver] Query gateway non riuscita ({e}), uso fetch_member')
+        found = []
+        absent = set()
+        for uid in chunk:
+            self.fetches += 1
+            try:
+                found.append(await guild.fetch_member(uid))
+            except discord.NotFound:
+                absent.add(uid)
+            except Exception:
+                # Errore transitorio: nessuna voce in cache, si riprova alla prossima pagina
+                continue
+        return found, absent
+
+    async def names(self, guild, user_ids: Iterable[int], mention: bool = True) -> Dict[int, str]:
+        """Testo da mostrare per ogni id: menzione (o nome) se nel server, altrimenti l'id."""
+        ids = [int(u) for u in user_ids]
+        members = await self.resolve_many(guild, ids)
+        now = time.time()
+        out: Dict[int, str] = {}
+        for uid in ids:
+            member = members.get(uid)
+            if member is not None:
+                out[uid] = member.mention if mention else member.display_name
+                continue
+            name = self._cached_name((guild.id, uid), now)
+            if name is None:
+                out[uid] = str(uid)
+            else:
+                out[uid] = f'<@{uid}>' if mention else name
+        return out
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'names_cached': len(self._names),
+            'missing_cached': len(self._missing),
+            'cache_hits': self.cache_hits,
+            'missing_hits': self.missing_hits,
+            'queries': self.queries,
+            'fetches': self.fetches,
+        }
+
+
+# Condiviso da tutti i cog (il modulo non è un'estensione e non viene ricaricato)
+resolver = MemberResolver()
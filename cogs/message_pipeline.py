@@ -0,0 +1,175 @@
+"""Pipeline unica per i messaggi.
+
+Invece di quattro listener `on_message` indipendenti (moderazione, counting,
+livelli, login) il bot registra un solo listener che costruisce un
+`MessageContext` per messaggio (id già convertiti, contenuto in minuscolo,
+frozenset degli id dei ruoli dell'autore) ed esegue gli stadi registrati in
+ordine crescente di `order`. Uno stadio può fermare la catena con `ctx.stop()`
+(es. l'automod che elimina il messaggio impedisce l'accredito XP).
+
+Ordine usato dai cog:
+    10 moderazione, 20 counting, 30 livelli, 40 login
+
+Uso in un cog:
+    async def cog_load(self):
+        get_pipeline(self.bot).register('levels', self._message_stage, order=30)
+
+    async def cog_unload(self):
+        get_pipeline(self.bot).unregister('levels')
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+import discord
+
+from .config_snapshots import member_role_ids
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("message_pipeline")
+
+
+class MessageContext:
+    """Dati pre-calcolati di un messaggio, condivisi da tutti gli stadi."""
+
+    __slots__ = (
+        'message', 'author', 'guild', 'guild_id', 'channel_id', 'author_id',
+        'guild_key', 'channel_key', 'author_key', 'content', 'content_lower',
+        'role_ids', 'is_member', 'flags', 'stopped', 'stopped_by',
+    )
+
+    def __init__(self, message: discord.Message):
+        self.message = message
+        self.author = message.author
+        self.guild = message.guild
+        self.guild_id: Optional[int] = message.guild.id if message.guild else None
+        self.channel_id: int = message.channel.id
+        self.author_id: int = message.author.id
+        # Chiavi stringa come nei file JSON
+        self.guild_key: Optional[str] = str(self.guild_id) if self.guild_id is not None else None
+        self.channel_key = str(self.channel_id)
+        self.author_key = str(self.author_id)
+        self.content: str = message.content or ''
+        self.content_lower = self.content.lower()
+        self.is_member = isinstance(message.author, discord.Member)
+        self.role_ids: FrozenSet[int] = member_role_ids(message.author) if self.is_member else frozenset()
+        # Esenzioni e altri dati impostati dagli stadi (es. 'automod_exempt')
+        self.flags: Dict[str, Any] = {}
+        self.stopped = False
+        self.stopped_by: Optional[str] = None
+
+    def has_any_role(self, ids: Iterable[Any]) -> bool:
+        """True se l'autore ha almeno uno dei ruoli indicati (id int o stringa)."""
+        role_ids = self.role_ids
+        if not role_ids:
+            return False
+        for rid in ids:
+            try:
+                if int(rid) in role_ids:
+                    return True
+            except (TypeError, ValueError):
+                continue
+        return False
+
+    def stop(self, reason: Optional[str] = None):
+        """Interrompe la pipeline dopo lo stadio corrente."""
+        self.stopped = True
+        if reason:
+            self.flags['stop_reason'] = reason
+
+
+StageFunc = Callable[[MessageContext], Awaitable[Any]]
+
+
+class Stage:
+    __slots__ = ('name', 'func', 'order', 'calls', 'stops', 'errors', 'time_total', 'time_max')
+
+    def __init__(self, name: str, func: StageFunc, order: int):
+        self.name = name
+        self.func = func
+        self.order = order
+        self.calls = 0
+        self.stops = 0
+        self.errors = 0
+        self.time_total = 0.0
+        self.time_max = 0.0
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'order': self.order,
+            'calls': self.calls,
+            'stops': self.stops,
+            'errors': self.errors,
+            'avg_ms': round(self.time_total / self.calls * 1000, 3) if self.calls else 0.0,
+            'max_ms': round(self.time_max * 1000, 3),
+        }
+
+
+class MessagePipeline:
+    def __init__(self, bot):
+        self.bot = bot
+        self._stages: List[Stage] = []
+        self.messages = 0
+        self.time_total = 0.0
+        self.time_max = 0.0
+
+    def register(self, name: str, func: StageFunc, order: int = 50):
+        """Registra (o sostituisce, su reload del cog) lo stadio `name`."""
+        self._stages = [s for s in self._stages if s.name != name]
+        self._stages.append(Stage(name, func, order))
+        self._stages.sort(key=lambda s: s.order)
+
+    def unregister(self, name: str):
+        self._stages = [s for s in self._stages if s.name != name]
+
+    def stage_names(self) -> List[str]:
+        return [s.name for s in self._stages]
+
+    async def on_message(self, message: discord.Message):
+        if message.author.bot or not self._stages:
+            return
+        start = time.perf_counter()
+        ctx = MessageContext(message)
+        # Copia: un reload durante l'await non altera l'iterazione
+        for stage in tuple(self._stages):
+            t0 = time.perf_counter()
+            try:
+                await stage.func(ctx)
+            except Exception as e:
+                stage.errors += 1
+                logger.error(f'[Pipeline] Errore nello stadio {stage.name}: {e}')
+            elapsed = time.perf_counter() - t0
+            stage.calls += 1
+            stage.time_total += elapsed
+            if elapsed > stage.time_max:
+                stage.time_max = elapsed
+            if ctx.stopped:
+                stage.stops += 1
+                ctx.stopped_by = stage.name
+                break
+        elapsed = time.perf_counter() - start
+        self.messages += 1
+        self.time_total += elapsed
+        if elapsed > self.time_max:
+            self.time_max = elapsed
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'messages': self.messages,
+            'avg_ms': round(self.time_total / self.messages * 1000, 3) if self.messages else 0.0,
+            'max_ms': round(self.time_max * 1000, 3),
+            'stages': {s.name: s.describe() for s in self._stages},
+        }
+
+
+def get_pipeline(bot) -> MessagePipeline:
+    """Pipeline del bot; alla prima chiamata la crea e registra il listener."""
+    pipeline = getattr(bot, 'message_pipeline', None)
+    if pipeline is None:
+        pipeline = MessagePipeline(bot)
+        bot.message_pipeline = pipeline
+        bot.add_listener(pipeline.on_message, 'on_message')
+    return pipeline
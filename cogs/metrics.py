@@ -0,0 +1,421 @@
+"""Metriche del bot in formato testo Prometheus.
+
+Il registro vive qui (modulo di supporto, importato una sola volta); l'endpoint
+HTTP e le misure in background sono nel cog `monitoring`.
+
+Cosa viene misurato:
+- durata di ogni listener (override di `_run_event` in main.MyBot)
+- durata dei comandi slash per comando ed esito (`InstrumentedCommandTree`)
+- chiamate REST in uscita per route, con durata ed errori
+- durata delle iterazioni dei `tasks.loop` decorati con `loop_timer`
+- latenza del gateway e ritardo dell'event loop
+- eccezioni gestite (e quindi ingoiate) nei cogs: solo con Python 3.12+, tramite
+  `sys.monitoring`; prima della 3.12 si contano invece i record di log WARNING+
+  dei cogs (`logged_warnings_total`), che non sono la stessa cosa
+- stadi della pipeline messaggi, store JSON, lock per chiave e `describe()` dei
+  componenti dei cogs (buffer XP, sessioni vocali, indice classifiche, ...),
+  letti al momento dello scrape
+"""
+
+import bisect
+import functools
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import discord
+from discord import app_commands
+
+try:
+    from .console_logger import logger
+except Exception:
+    logger = logging.getLogger("metrics")
+
+COGS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _fmt(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple:
+        return tuple(labels.get(n, '') for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {_fmt(value)}')
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = float(value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {_fmt(value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # chiave -> [conteggi per bucket (non cumulativi) ..., somma, totale]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = [0] * len(self.buckets) + [0.0, 0]
+            self._values[key] = entry
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            entry[i] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        n = len(self.buckets)
+        for key, entry in sorted(self._values.items()):
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += entry[i]
+                le = _labels(self.labelnames, key, 'le="%s"' % _fmt(bound))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {entry[n + 1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_fmt(entry[n])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {entry[n + 1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self, prefix: str = 'alice_'):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        # Funzioni chiamate a ogni scrape per aggiornare i gauge derivati
+        self._collectors: Dict[str, Callable[[], None]] = {}
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        full = self.prefix + name
+        metric = self._metrics.get(full)
+        if metric is None:
+            metric = cls(full, help_text, tuple(labelnames), **kwargs)
+            self._metrics[full] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()) -> Gauge:
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def add_collector(self, name: str, func: Callable[[], None]):
+        """Registra (o sostituisce, su reload del cog) il collector `name`."""
+        self._collectors[name] = func
+
+    def render(self) -> str:
+        for func in list(self._collectors.values()):
+            try:
+                func()
+            except Exception as e:
+                logger.debug(f'[Metrics] Collector fallito: {e}')
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Registry()
+
+LISTENER_SECONDS = metrics.histogram('listener_duration_seconds', 'Durata dei listener degli eventi', ('event', 'listener'))
+LISTENER_ERRORS = metrics.counter('listener_errors_total', 'Eccezioni non gestite nei listener', ('event', 'listener'))
+COMMAND_SECONDS = metrics.histogram('command_duration_seconds', 'Durata dei comandi slash', ('command', 'status'))
+REST_SECONDS = metrics.histogram('rest_request_duration_seconds', 'Durata delle chiamate REST in uscita', ('method', 'route'))
+REST_ERRORS = metrics.counter('rest_errors_total', 'Chiamate REST fallite', ('method', 'route', 'status'))
+LOOP_SECONDS = metrics.histogram('loop_iteration_seconds', 'Durata delle iterazioni dei tasks.loop', ('loop',))
+LOOP_ERRORS = metrics.counter('loop_errors_total', 'Iterazioni dei tasks.loop terminate con eccezione', ('loop',))
+LOOP_LAG = metrics.histogram('event_loop_lag_seconds', "Ritardo dell'event loop", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+SWALLOWED = metrics.counter('swallowed_exceptions_total', 'Eccezioni gestite (catturate) nel codice dei cogs', ('cog', 'exception'))
+LOGGED_WARNINGS = metrics.counter('logged_warnings_total',
+                                  'Record di log WARNING o più gravi emessi dai cogs (senza sys.monitoring)',
+                                  ('cog', 'level'))
+
+
+# ---------------------------------------------------------------- listener
+def _listener_name(coro) -> str:
+    return getattr(coro, '__qualname__', None) or getattr(coro, '__name__', repr(coro))
+
+
+def timed_listener(coro, event_name: str):
+    """Avvolge un listener misurandone la durata (usato da MyBot._run_event)."""
+    name = _listener_name(coro)
+
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            await coro(*args, **kwargs)
+        except Exception:
+            LISTENER_ERRORS.inc(event=event_name, listener=name)
+            raise
+        finally:
+            LISTENER_SECONDS.observe(time.perf_counter() - start, event=event_name, listener=name)
+    return wrapper
+
+
+# ---------------------------------------------------------------- comandi
+class InstrumentedCommandTree(app_commands.CommandTree):
+    async def _call(self, interaction: discord.Interaction) -> None:
+        start = time.perf_counter()
+        try:
+            await super()._call(interaction)
+        finally:
+            command = interaction.command
+            name = command.qualified_name if command is not None else (interaction.data or {}).get('name', 'sconosciuto')
+            status = 'error' if interaction.command_failed else 'ok'
+            COMMAND_SECONDS.observe(time.perf_counter() - start, command=name, status=status)
+
+
+# ---------------------------------------------------------------- tasks.loop
+def loop_timer(name: str):
+    """Da mettere sotto `@tasks.loop(...)`: misura ogni iterazione del loop."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                LOOP_ERRORS.inc(loop=name)
+                raise
+            finally:
+                LOOP_SECONDS.observe(time.perf_counter() - start, loop=name)
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------------- REST
+def instrument_http(http) -> bool:
+    """Avvolge `HTTPClient.request` per contare durata ed errori per route."""
+    if getattr(http, '_metrics_wrapped', False):
+        return False
+    original = http.request
+
+    @functools.wraps(original)
+    async def request(route, **kwargs):
+        method = getattr(route, 'method', '?')
+        path = getattr(route, 'path', '?')
+        start = time.perf_counter()
+        try:
+            return await original(route, **kwargs)
+        except discord.HTTPException as e:
+            REST_ERRORS.inc(method=method, route=path, status=e.status)
+            raise
+        except Exception as e:
+            REST_ERRORS.inc(method=method, route=path, status=type(e).__name__)
+            raise
+        finally:
+            REST_SECONDS.observe(time.perf_counter() - start, method=method, route=path)
+
+    http.request = request
+    http._metrics_wrapped = True
+    return True
+
+
+# ---------------------------------------------------------------- eccezioni ingoiate
+def _cog_of(filename: str) -> Optional[str]:
+    if not filename or not filename.startswith(COGS_DIR):
+        return None
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+_monitoring_tool: Optional[int] = None
+
+
+def start_exception_monitoring() -> bool:
+    """Python 3.12+: conta ogni eccezione gestita dentro un file dei cogs."""
+    global _monitoring_tool
+    mon = getattr(sys, 'monitoring', None)
+    if mon is None or _monitoring_tool is not None:
+        return _monitoring_tool is not None
+    tool = next((t for t in (3, 4) if mon.get_tool(t) is None), None)
+    if tool is None:
+        return False
+
+    # EXCEPTION_HANDLED non si può disattivare per singolo punto (DISABLE non è
+    # ammesso): si filtra per file, con il risultato in cache
+    cogs_by_file: Dict[str, Optional[str]] = {}
+
+    def on_handled(code, offset, exc):
+        filename = code.co_filename
+        try:
+            cog = cogs_by_file[filename]
+        except KeyError:
+            cog = cogs_by_file[filename] = _cog_of(filename)
+        if cog is not None:
+            SWALLOWED.inc(cog=cog, exception=type(exc).__name__)
+
+    mon.use_tool_id(tool, 'alice-metrics')
+    mon.register_callback(tool, mon.events.EXCEPTION_HANDLED, on_handled)
+    mon.set_events(tool, mon.events.EXCEPTION_HANDLED)
+    _monitoring_tool = tool
+    return True
+
+
+def stop_exception_monitoring():
+    global _monitoring_tool
+    mon = getattr(sys, 'monitoring', None)
+    if mon is None or _monitoring_tool is None:
+        return
+    mon.set_events(_monitoring_tool, 0)
+    mon.register_callback(_monitoring_tool, mon.events.EXCEPTION_HANDLED, None)
+    mon.free_tool_id(_monitoring_tool)
+    _monitoring_tool = None
+
+
+class _ErrorLogCounter(logging.Handler):
+    """Conta i record WARNING+ emessi dal codice dei cogs."""
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+
+    def emit(self, record):
+        cog = _cog_of(record.pathname)
+        if cog is not None:
+            LOGGED_WARNINGS.inc(cog=cog, level=record.levelname.lower())
+
+
+error_log_counter = _ErrorLogCounter()
+
+
+# ---------------------------------------------------------------- collectors
+def bot_collector(bot):
+    def collect():
+        latency = bot.latency
+        if latency == latency and latency != float('inf'):  # NaN prima della connessione
+            metrics.gauge('gateway_latency_seconds', 'Latenza heartbeat del gateway').set(latency)
+        metrics.gauge('guilds', 'Guild servite').set(len(bot.guilds))
+        pipeline = getattr(bot, 'message_pipeline', None)
+        if pipeline is not None:
+            info = pipeline.describe()
+            calls = metrics.gauge('pipeline_stage_calls', 'Messaggi elaborati per stadio della pipeline', ('stage',))
+            stops = metrics.gauge('pipeline_stage_stops', 'Messaggi fermati dallo stadio', ('stage',))
+            avg = metrics.gauge('pipeline_stage_avg_seconds', 'Durata media dello stadio', ('stage',))
+            mx = metrics.gauge('pipeline_stage_max_seconds', 'Durata massima dello stadio', ('stage',))
+            for name, st in info['stages'].items():
+                calls.set(st['calls'], stage=name)
+                stops.set(st['stops'], stage=name)
+                avg.set(st['avg_ms'] / 1000, stage=name)
+                mx.set(st['max_ms'] / 1000, stage=name)
+    return collect
+
+
+def collect_store():
+    try:
+        from .json_store import store
+    except Exception:
+        return
+    stats = store.stats()
+    g = metrics.gauge('store', 'Statistiche dello store JSON write-behind', ('stat',))
+    for key, value in stats.items():
+        g.set(value, stat=key)
+
+
+def collect_locks():
+    try:
+        from .keyed_locks import lock_stats
+    except Exception:
+        return
+    contended = metrics.gauge('lock_contended', 'Acquisizioni con attesa per gruppo di lock', ('name',))
+    wait_max = metrics.gauge('lock_wait_max_seconds', 'Attesa massima per gruppo di lock', ('name',))
+    for name, info in lock_stats().items():
+        contended.set(info['contended'], name=name)
+        wait_max.set(info['wait_max_ms'] / 1000, name=name)
+
+
+def collect_members():
+    try:
+        from .member_resolver import resolver
+    except Exception:
+        return
+    g = metrics.gauge('member_resolver', 'Cache e richieste del risolutore membri delle classifiche', ('stat',))
+    for key, value in resolver.describe().items():
+        g.set(value, stat=key)
+
+
+def components_collector(bot):
+    """Valori numerici del `describe()` degli attributi di ogni cog (accrual, voice, announcer, ...)."""
+    def collect():
+        g = metrics.gauge('component', 'Statistiche dei componenti dei cogs', ('cog', 'component', 'stat'))
+        for cog_name, cog in list(bot.cogs.items()):
+            for attr, value in list(vars(cog).items()):
+                describe = getattr(value, 'describe', None)
+                if not callable(describe) or isinstance(value, type):
+                    continue
+                try:
+                    stats = describe()
+                except Exception:
+                    continue
+                if not isinstance(stats, dict):
+                    continue
+                for key, v in stats.items():
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        g.set(v, cog=cog_name, component=attr, stat=key)
+    return collect
@@ -16,6 +16,16 @@ except ImportError:
     except ImportError:
         import logging
         logger = logging.getLogger("moderation_fallback")
+try:
+    from .json_store import store
+    from .message_pipeline import MessageContext, get_pipeline
+    from .config_snapshots import CompiledConfig, ModerationSnapshot
+    from .offence_tracker import OffencePolicy, OffenceTracker
+except ImportError:
+    from cogs.json_store import store
+    from cogs.message_pipeline import MessageContext, get_pipeline
+    from cogs.config_snapshots import CompiledConfig, ModerationSnapshot
+    from cogs.offence_tracker import OffencePolicy, OffenceTracker
 
 class PagedBanListView(discord.ui.View):
     def __init__(self, author_id: int, embeds: list, *, timeout: float = 120):
@@ -90,13 +100,14 @@ CONFIG_PATH = os.path.join(PROJECT_ROOT, 'config.json')
 MOD_JSON = os.path.join(BASE_DIR, 'moderation.json')
 WARNS_JSON = os.path.join(BASE_DIR, 'warns.json')
 USER_WORDS_JSON = os.path.join(BASE_DIR, 'user_words.json')
+OFFENCES_JSON = os.path.join(BASE_DIR, 'offences.json')
 MOD_LOG_CHANNEL_ID = 1207365506630291457  # Canale log moderazione fisso richiesto
 
 class ModerationCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+        # config.json è condiviso con altri cog: si legge dallo store, mai dal disco
+        self.config = store.load(CONFIG_PATH, {})
         # Load moderation.json (fall back to root if migrating)
         if os.path.exists(MOD_JSON):
             with open(MOD_JSON, 'r', encoding='utf-8') as f:
@@ -113,34 +124,25 @@ class ModerationCog(commands.Cog):
             self.moderation_words = {}
 
         # Load warns
-        self.warns_data = {"next_id": 1, "warns": {}}
-        if os.path.exists(WARNS_JSON):
-            with open(WARNS_JSON, 'r', encoding='utf-8') as f:
-                self.warns_data = json.load(f)
-        elif os.path.exists('warns.json'):
+        if not store.exists(WARNS_JSON) and os.path.exists('warns.json'):
             with open('warns.json', 'r', encoding='utf-8') as f:
-                self.warns_data = json.load(f)
-            try:
-                with open(WARNS_JSON, 'w', encoding='utf-8') as f:
-                    json.dump(self.warns_data, f, indent=2, ensure_ascii=False)
-            except Exception:
-                pass
-
-        # Load user words
-        self.user_words = {}
-        if os.path.exists(USER_WORDS_JSON):
-            with open(USER_WORDS_JSON, 'r', encoding='utf-8') as f:
-                self.user_words = json.load(f)
-        elif os.path.exists('user_words.json'):
-            with open('user_words.json', 'r', encoding='utf-8') as f:
-                self.user_words = json.load(f)
-            try:
-                with open(USER_WORDS_JSON, 'w', encoding='utf-8') as f:
-                    json.dump(self.user_words, f, indent=2, ensure_ascii=False)
-            except Exception:
-                pass
+                store.put(WARNS_JSON, json.load(f))
+        self.warns_data = store.load(WARNS_JSON, {"next_id": 1, "warns": {}})
+
+        # Storico infrazioni (importa il vecchio user_words.json al primo avvio)
+        legacy_words = None
+        if not store.exists(OFFENCES_JSON):
+            for legacy_path in (USER_WORDS_JSON, 'user_words.json'):
+                if os.path.exists(legacy_path):
+                    with open(legacy_path, 'r', encoding='utf-8') as f:
+                        legacy_words = json.load(f)
+                    break
+        self.offences = OffenceTracker(OFFENCES_JSON, legacy_words)
 
         self.mod_log_channel_id = MOD_LOG_CHANNEL_ID
+        # Ruoli staff/esenti e parole vietate già convertiti per lo stadio automod
+        self.settings = CompiledConfig(ModerationSnapshot.from_config, self.config, self.moderation_words)
+        self.offence_policy = CompiledConfig(OffencePolicy.from_config, self._offences_config())
 
     def _get_mod_log_channel(self, guild: discord.Guild):
         if not guild:
@@ -185,22 +187,22 @@ class ModerationCog(commands.Cog):
             logger.error(f'Errore invio log moderazione ({action}): {e}')
 
     def save_warns(self):
-        with open(WARNS_JSON, 'w', encoding='utf-8') as f:
-            json.dump(self.warns_data, f, indent=2, ensure_ascii=False)
+        store.put(WARNS_JSON, self.warns_data)
 
-    def save_user_words(self):
-        with open(USER_WORDS_JSON, 'w', encoding='utf-8') as f:
-            json.dump(self.user_words, f, indent=2, ensure_ascii=False)
+    def _offences_config(self):
+        return self.config.get('moderation', {}).get('offences')
 
     def reload_mod(self):
         with open(MOD_JSON, 'r', encoding='utf-8') as f:
             self.moderation_words = json.load(f)
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+        self.config = store.reload(CONFIG_PATH, {})
+        self.settings.refresh(self.config, self.moderation_words)
+        self.offence_policy.refresh(self._offences_config())
 
     def reload_config(self):
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+        self.config = store.reload(CONFIG_PATH, {})
+        self.settings.refresh(self.config, self.moderation_words)
+        self.offence_policy.refresh(self._offences_config())
 
     def get_user_warns(self, user_id):
         return [w for w in self.warns_data["warns"].values() if w["user_id"] == str(user_id)]
@@ -230,88 +232,73 @@ class ModerationCog(commands.Cog):
         except discord.Forbidden:
             pass
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
+    async def cog_load(self):
+        get_pipeline(self.bot).register('moderation', self._message_stage, order=10)
+
+    async def cog_unload(self):
+        get_pipeline(self.bot).unregister('moderation')
+
+    async def _message_stage(self, ctx: MessageContext):
+        """Stadio automod della pipeline messaggi: se agisce, ferma gli stadi successivi."""
+        if ctx.guild_id is None:
             return
+        message = ctx.message
 
-        staff_role_id = self.config.get('moderation', {}).get('staff_role_id')
-        if staff_role_id and any(role.id == int(staff_role_id) for role in message.author.roles):
+        snap = self.settings.current
+        if snap.is_staff(ctx.role_ids) or snap.is_exempt(ctx.role_ids):
+            ctx.flags['automod_exempt'] = True
             return
 
-        no_automod = self.config.get('moderation', {}).get('no_automod')
-        if no_automod:
-            exempt_ids = []
-            if isinstance(no_automod, list):
-                for v in no_automod:
-                    try:
-                        exempt_ids.append(int(v))
-                    except Exception:
-                        continue
-            else:
-                for part in str(no_automod).split(','):
-                    s = part.strip()
-                    if s.isdigit():
-                        exempt_ids.append(int(s))
+        content = ctx.content_lower
 
-            if exempt_ids and any(role.id in exempt_ids for role in message.author.roles):
+        # Una sola passata sul testo normalizzato per tutte le parole vietate
+        match = snap.matcher.first(ctx.content) if snap.word_rules else None
+        if match is not None:
+            needle, word, duration, delta = snap.word_rules[match.rule]
+            if message.author.is_timed_out():
                 return
 
-        content = message.content.lower()
-        user_id_str = str(message.author.id)
-        user_words_list = self.user_words.get(user_id_str, [])
-
-        for duration, words in self.moderation_words.items():
-            if isinstance(words, list):
-                for word in words:
-                    if word.lower() in content:
-                        if message.author.is_timed_out():
-                            return
-
-                        if duration.endswith('h'):
-                            hours = int(duration[:-1])
-                            delta = datetime.timedelta(hours=hours)
-                        elif duration.endswith('d'):
-                            days = int(duration[:-1])
-                            delta = datetime.timedelta(days=days)
-                        elif duration.endswith('m'):
-                            minutes = int(duration[:-1])
-                            delta = datetime.timedelta(minutes=minutes)
-                        elif duration.endswith('s'):
-                            seconds = int(duration[:-1])
-                            delta = datetime.timedelta(seconds=seconds)
-                        else:
-                            delta = datetime.timedelta(days=20)
-
-                        try:
-                            await message.delete()
-                            if word.lower() in [w.lower() for w in user_words_list]:
-                                await message.author.timeout(delta, reason=f'Auto-mute per parola vietata ripetuta: {word}')
-                                await message.channel.send(f'{message.author.mention} è stato mutato automaticamente per {duration} a causa di una parola vietata ripetuta.')
-                                await self.send_dm(message.author, "mute", reason=f'Auto-mute per parola vietata ripetuta: {word}', staffer="Sistema", time=datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), duration=duration)
-                                logger.warning(f'Auto-mute ripetuto: {message.author.name}#{message.author.discriminator} ({message.author.id}) mutato per {duration} - parola: {word}')
-                                log_cog = self.bot.get_cog('LogCog')
-                                if log_cog:
-                                    await log_cog.log_automod_mute(message.author, duration, f'Auto-mute per parola vietata ripetuta: {word}')
-                            else:
-                                await self.send_dm(message.author, "word_warning", word=word)
-                                if user_id_str not in self.user_words:
-                                    self.user_words[user_id_str] = []
-                                self.user_words[user_id_str].append(word.lower())
-                                await message.channel.send(f'{message.author.mention} ha ricevuto un avviso per una parola vietata. Non ripeterla!')
-                                logger.info(f'Avviso parola vietata: {message.author.name}#{message.author.discriminator} ({message.author.id}) - parola: {word}')
-                                log_cog = self.bot.get_cog('LogCog')
-                                if log_cog:
-                                    await log_cog.log_automod_warn(message.author, word)
-                        except Exception as e:
-                            logger.error(f"Errore nell'automod parola vietata: {e}")
-                        self.save_user_words()
-                        return
+            ctx.stop('automod_word')
+            # Parola ripetuta entro la finestra → mute per la sua durata; la fascia di
+            # escalation raggiunta dal punteggio può allungarlo (o imporlo anche alla prima volta)
+            offence = self.offences.record(ctx.guild_key, ctx.author_key, needle, self.offence_policy.current)
+            mute_delta, mute_label = (delta, duration) if offence.repeat else (None, None)
+            by_tier = offence.tier is not None and (mute_delta is None or offence.tier.delta > mute_delta)
+            if by_tier:
+                mute_delta, mute_label = offence.tier.delta, offence.tier.label
+            try:
+                await message.delete()
+                if mute_delta is not None:
+                    # Il motivo dipende da cosa ha deciso il mute: la parola ripetuta o la fascia del punteggio
+                    if by_tier:
+                        reason = f'Auto-mute per infrazioni ripetute (punteggio {offence.score:.1f}): {word}'
+                        cause = 'troppe parole vietate in poco tempo'
+                    else:
+                        reason = f'Auto-mute per parola vietata ripetuta: {word}'
+                        cause = 'una parola vietata ripetuta'
+                    await message.author.timeout(mute_delta, reason=reason)
+                    await message.channel.send(f'{message.author.mention} è stato mutato automaticamente per {mute_label} a causa di {cause}.')
+                    await self.send_dm(message.author, "mute", reason=reason, staffer="Sistema", time=datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), duration=mute_label)
+                    logger.warning(f'Auto-mute ripetuto: {message.author.name}#{message.author.discriminator} ({message.author.id}) mutato per {mute_label} - parola: {word} (punteggio {offence.score:.1f})')
+                    log_cog = self.bot.get_cog('LogCog')
+                    if log_cog:
+                        await log_cog.log_automod_mute(message.author, mute_label, reason)
+                else:
+                    await self.send_dm(message.author, "word_warning", word=word)
+                    await message.channel.send(f'{message.author.mention} ha ricevuto un avviso per una parola vietata. Non ripeterla!')
+                    logger.info(f'Avviso parola vietata: {message.author.name}#{message.author.discriminator} ({message.author.id}) - parola: {word}')
+                    log_cog = self.bot.get_cog('LogCog')
+                    if log_cog:
+                        await log_cog.log_automod_warn(message.author, word)
+            except Exception as e:
+                logger.error(f"Errore nell'automod parola vietata: {e}")
+            return
 
         if 'discord.gg' in content:
             if message.author.is_timed_out():
                 return
 
+            ctx.stop('automod_link')
             try:
                 await message.delete()
                 await message.author.timeout(datetime.timedelta(days=1), reason="Spam Link")
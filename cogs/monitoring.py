@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from discord.ext import commands
+
+from .console_logger import logger
+from .metrics import (
+    LOOP_LAG,
+    bot_collector,
+    collect_locks, collect_members,
+    collect_store,
+    components_collector,
+    error_log_counter,
+    instrument_http,
+    metrics,
+    start_exception_monitoring,
+    stop_exception_monitoring,
+)
+
+LAG_INTERVAL = 0.5
+
+
+class MonitoringCog(commands.Cog):
+    """Endpoint /metrics (solo con METRICS_PORT impostata) e misure in background."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._runner = None
+        self._lag_task: Optional[asyncio.Task] = None
+        self._log_fallback = False
+
+    async def cog_load(self):
+        instrument_http(self.bot.http)
+        # Senza sys.monitoring (Python < 3.12) si contano solo i record WARNING+ dei cogs
+        if not start_exception_monitoring():
+            logging.getLogger('valiance_bot').addHandler(error_log_counter)
+            self._log_fallback = True
+        metrics.add_collector('bot', bot_collector(self.bot))
+        metrics.add_collector('store', collect_store)
+        metrics.add_collector('locks', collect_locks)
+        metrics.add_collector('members', collect_members)
+        metrics.add_collector('components', components_collector(self.bot))
+        self._lag_task = asyncio.create_task(self._measure_lag())
+        port = os.getenv('METRICS_PORT')
+        if port:
+            try:
+                await self._start_server(os.getenv('METRICS_HOST', '127.0.0.1'), int(port))
+            except ValueError:
+                logger.error(f'[Metrics] METRICS_PORT non valida: {port}')
+
+    async def cog_unload(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        stop_exception_monitoring()
+        if self._log_fallback:
+            logging.getLogger('valiance_bot').removeHandler(error_log_counter)
+            self._log_fallback = False
+        if self._runner is not None:
+            try:
+                await self._runner.cleanup()
+            except Exception:
+                pass
+            self._runner = None
+
+    async def _measure_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            LOOP_LAG.observe(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+    async def _start_server(self, host: str, port: int):
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port).start()
+        except Exception as e:
+            await runner.cleanup()
+            logger.error(f'[Metrics] Impossibile avviare endpoint su {host}:{port}: {e}')
+            return
+        self._runner = runner
+        logger.info(f'[Metrics] Endpoint attivo su http://{host}:{port}/metrics')
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(MonitoringCog(bot))
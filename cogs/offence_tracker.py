@@ -0,0 +1,176 @@
+"""Storico delle infrazioni automod per (guild, utente), con decadimento.
+
+Per ogni utente di una guild si tiene un record compatto
+`[punteggio, ultimo timestamp, {parola: ultimo timestamp}]`:
+
+- il punteggio cresce di 1 a ogni infrazione e si dimezza ogni `half_life`
+  (decadimento esponenziale calcolato al momento, O(1));
+- una parola conta come "ripetuta" solo se l'ultima volta è entro `window`;
+- le fasce di escalation (`tiers`) scattano quando il punteggio raggiunge la
+  loro soglia e impongono un mute di almeno quella durata.
+
+Il documento JSON è la struttura viva: ogni infrazione la modifica in posto e
+la segna come da salvare (write-behind di `json_store`). I record scaduti
+vengono rimossi da `prune`, al più una volta ogni `PRUNE_INTERVAL`, così il
+costo non cresce con la storia del server. I messaggi senza infrazioni non
+toccano il tracker.
+"""
+
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .config_snapshots import parse_duration
+from .json_store import store
+
+PRUNE_INTERVAL = 3600.0
+# Sotto questa soglia (e senza parole nella finestra) il record viene rimosso
+MIN_SCORE = 0.05
+
+DEFAULT_POLICY = {
+    "window": "30d",
+    "half_life": "7d",
+    "tiers": [
+        {"score": 3, "duration": "1h"},
+        {"score": 5, "duration": "1d"},
+    ],
+}
+
+
+class Tier(NamedTuple):
+    score: float
+    delta: datetime.timedelta
+    label: str
+
+
+@dataclass(frozen=True)
+class OffencePolicy:
+    window: float
+    half_life: float
+    # Dalla soglia più alta alla più bassa
+    tiers: Tuple[Tier, ...]
+
+    @classmethod
+    def from_config(cls, raw: Optional[Dict[str, Any]]) -> 'OffencePolicy':
+        raw = {**DEFAULT_POLICY, **(raw or {})}
+        window = parse_duration(raw.get('window')) or parse_duration(DEFAULT_POLICY['window'])
+        half_life = parse_duration(raw.get('half_life')) or parse_duration(DEFAULT_POLICY['half_life'])
+        tiers = []
+        for entry in raw.get('tiers') or []:
+            try:
+                delta = parse_duration(entry['duration'])
+                if delta is not None:
+                    tiers.append(Tier(float(entry['score']), delta, str(entry['duration'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        tiers.sort(key=lambda t: t.score, reverse=True)
+        return cls(window=window.total_seconds(), half_life=max(1.0, half_life.total_seconds()),
+                   tiers=tuple(tiers))
+
+    def tier_for(self, score: float) -> Optional[Tier]:
+        for tier in self.tiers:
+            if score >= tier.score:
+                return tier
+        return None
+
+
+class Offence(NamedTuple):
+    repeat: bool             # stessa parola già usata entro la finestra
+    score: float             # punteggio dopo questa infrazione
+    tier: Optional[Tier]     # fascia di escalation raggiunta
+
+
+class OffenceTracker:
+    def __init__(self, path: str, legacy: Optional[Dict[str, List[str]]] = None):
+        self.path = path
+        self.data: Dict[str, Any] = store.load(path, {})
+        self._last_prune = 0.0
+        self.recorded = 0
+        if legacy and not self.data:
+            self._migrate(legacy)
+
+    def _migrate(self, legacy: Dict[str, List[str]]):
+        """Importa il vecchio user_words.json (senza guild né date) come infrazioni di adesso."""
+        now = time.time()
+        users = {}
+        for uid, words in legacy.items():
+            if isinstance(words, list) and words:
+                users[str(uid)] = [0.0, now, {str(w).lower(): now for w in words}]
+        if users:
+            # Valgono per qualunque guild finché non scadono
+            self.data['*'] = users
+            store.put(self.path, self.data)
+
+    @staticmethod
+    def _decayed(rec: List[Any], now: float, policy: OffencePolicy) -> float:
+        elapsed = max(0.0, now - rec[1])
+        return rec[0] * 0.5 ** (elapsed / policy.half_life)
+
+    def _record_for(self, guild_key: str, user_key: str) -> Optional[List[Any]]:
+        rec = self.data.get(guild_key, {}).get(user_key)
+        if rec is None:
+            legacy = self.data.get('*', {}).pop(user_key, None)
+            if legacy is not None:
+                rec = self.data.setdefault(guild_key, {})[user_key] = legacy
+        return rec
+
+    def record(self, guild_key: str, user_key: str, term: str, policy: OffencePolicy,
+               now: Optional[float] = None) -> Offence:
+        now = time.time() if now is None else now
+        rec = self._record_for(guild_key, user_key)
+        if rec is None:
+            rec = self.data.setdefault(guild_key, {})[user_key] = [0.0, now, {}]
+        # Al centesimo: tre infrazioni ravvicinate fanno 3, non 2.99998
+        score = round(self._decayed(rec, now, policy) + 1.0, 2)
+        last = rec[2].get(term)
+        repeat = last is not None and now - last <= policy.window
+        rec[0] = score
+        rec[1] = now
+        rec[2][term] = now
+        self.recorded += 1
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self.prune(policy, now)
+        store.mark_dirty(self.path)
+        return Offence(repeat, score, policy.tier_for(score))
+
+    def score(self, guild_key: str, user_key: str, policy: OffencePolicy, now: Optional[float] = None) -> float:
+        rec = self.data.get(guild_key, {}).get(user_key)
+        return self._decayed(rec, time.time() if now is None else now, policy) if rec else 0.0
+
+    def forget(self, guild_key: str, user_key: str) -> bool:
+        removed = False
+        for key in (guild_key, '*'):
+            if self.data.get(key, {}).pop(user_key, None) is not None:
+                removed = True
+        if removed:
+            store.mark_dirty(self.path)
+        return removed
+
+    def prune(self, policy: OffencePolicy, now: Optional[float] = None) -> int:
+        """Toglie parole fuori finestra e record ormai decaduti; ritorna i record rimossi."""
+        now = time.time() if now is None else now
+        self._last_prune = now
+        removed = 0
+        for gkey in list(self.data):
+            users = self.data[gkey]
+            for ukey in list(users):
+                rec = users[ukey]
+                terms = rec[2]
+                for term in [t for t, ts in terms.items() if now - ts > policy.window]:
+                    del terms[term]
+                if not terms and self._decayed(rec, now, policy) < MIN_SCORE:
+                    del users[ukey]
+                    removed += 1
+            if not users:
+                del self.data[gkey]
+        if removed:
+            store.mark_dirty(self.path)
+        return removed
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'guilds': len(self.data),
+            'users': sum(len(u) for u in self.data.values()),
+            'recorded': self.recorded,
+        }
@@ -0,0 +1,197 @@
+"""Rendering delle rank card fuori dall'event loop.
+
+- sfondo già ridimensionato e font TrueType in cache (per percorso e misura)
+- avatar scaricati in modo asincrono tramite la sessione HTTP di discord.py,
+  ritagliati a cerchio una volta sola e tenuti in una LRU per hash dell'avatar
+- disegno e codifica in un pool di thread dedicato, con un tetto di render
+  simultanei (`rank_card.max_concurrent`)
+- formato di uscita configurabile (`rank_card.format`): png, png-optimized, webp
+
+Pillow è opzionale: senza, `available()` è False e il cog non allega la card.
+"""
+
+import asyncio
+import functools
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except Exception:  # Pillow non installato
+    Image = ImageDraw = ImageFont = None
+
+try:
+    from .console_logger import logger
+except Exception:
+    import logging
+    logger = logging.getLogger("rank_card")
+
+AVATAR_SIZE = 180
+AVATAR_CACHE_SIZE = 256
+FORMATS = {
+    'png': ('png', {'format': 'PNG'}),
+    'png-optimized': ('png', {'format': 'PNG', 'optimize': True}),
+    'webp': ('webp', {'format': 'WEBP', 'quality': 85, 'method': 4}),
+}
+
+
+def available() -> bool:
+    return Image is not None
+
+
+@dataclass
+class CardData:
+    name: str
+    level: int
+    cur_xp: int
+    needed: int
+    avatar: Any = None
+
+
+@functools.lru_cache(maxsize=8)
+def _background(path: Optional[str], width: int, height: int):
+    if path and os.path.isfile(path):
+        return Image.open(path).convert('RGBA').resize((width, height))
+    return Image.new('RGBA', (width, height), (30, 30, 30, 255))
+
+
+@functools.lru_cache(maxsize=16)
+def _font(path: Optional[str], size: int):
+    try:
+        if path and os.path.isfile(path):
+            return ImageFont.truetype(path, size)
+    except Exception:
+        pass
+    return ImageFont.load_default()
+
+
+@functools.lru_cache(maxsize=1)
+def _avatar_mask():
+    mask = Image.new('L', (AVATAR_SIZE, AVATAR_SIZE), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, AVATAR_SIZE, AVATAR_SIZE), fill=255)
+    return mask
+
+
+def _decode_avatar(raw: bytes):
+    return Image.open(BytesIO(raw)).convert('RGBA').resize((AVATAR_SIZE, AVATAR_SIZE))
+
+
+def _render(cfg: Dict[str, Any], data: CardData, fmt: str) -> bytes:
+    """Disegna la card e la codifica (gira nel pool di thread)."""
+    width = int(cfg.get('width', 934))
+    height = int(cfg.get('height', 282))
+    bar_color = cfg.get('bar_color', '#14ff72')
+    bar_bg = cfg.get('bar_bg', '#1f1f1f')
+    text_color = cfg.get('text_color', '#ffffff')
+    font_path = cfg.get('font_path')
+
+    base = _background(cfg.get('background'), width, height).copy()
+    draw = ImageDraw.Draw(base)
+    font_large = _font(font_path, 46)
+    font_small = _font(font_path, 28)
+    # Testo utente e livello
+    draw.text((30, 30), data.name[:25], fill=text_color, font=font_large)
+    draw.text((30, 90), f"Level {data.level}", fill=text_color, font=font_small)
+    # Progress bar
+    bar_x, bar_y = 30, height - 90
+    bar_w, bar_h = width - 60, 40
+    draw.rounded_rectangle((bar_x, bar_y, bar_x + bar_w, bar_y + bar_h), radius=20, fill=bar_bg)
+    pct = 0 if data.needed == 0 else min(1.0, data.cur_xp / data.needed)
+    fill_w = int(bar_w * pct)
+    if fill_w > 0:
+        draw.rounded_rectangle((bar_x, bar_y, bar_x + fill_w, bar_y + bar_h), radius=20, fill=bar_color)
+    remaining = max(0, data.needed - data.cur_xp)
+    prog_text = f"{data.cur_xp}/{data.needed} XP • Mancano {remaining}"
+    # textsize non esiste più da Pillow 10: si misura con textbbox
+    left, top, right, bottom = draw.textbbox((0, 0), prog_text, font=font_small)
+    tw, th = right - left, bottom - top
+    draw.text((bar_x + (bar_w - tw) // 2, bar_y + (bar_h - th) // 2 - top), prog_text, fill=text_color, font=font_small)
+    # Avatar cerchio
+    if data.avatar is not None:
+        base.paste(data.avatar, (width - 210, 30), _avatar_mask())
+
+    _, save_args = FORMATS.get(fmt, FORMATS['png'])
+    out = BytesIO()
+    base.save(out, **save_args)
+    return out.getvalue()
+
+
+class RankCardRenderer:
+    def __init__(self, max_concurrent: int = 2, avatar_cache_size: int = AVATAR_CACHE_SIZE):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='rankcard')
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._avatars: 'OrderedDict[str, Any]' = OrderedDict()
+        self._avatar_cache_size = avatar_cache_size
+        self._fetching: Dict[str, asyncio.Future] = {}
+        # Statistiche
+        self.rendered = 0
+        self.avatar_hits = 0
+        self.avatar_misses = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def avatar(self, asset) -> Optional[Any]:
+        """Avatar decodificato e ridimensionato, dalla LRU o scaricato in modo asincrono."""
+        if asset is None:
+            return None
+        key = getattr(asset, 'key', None) or str(asset)
+        cached = self._avatars.get(key)
+        if cached is not None:
+            self._avatars.move_to_end(key)
+            self.avatar_hits += 1
+            return cached
+        # Più level-up dello stesso utente insieme: un solo download
+        pending = self._fetching.get(key)
+        if pending is not None:
+            self.avatar_hits += 1
+            return await asyncio.shield(pending)
+        self.avatar_misses += 1
+        task = asyncio.ensure_future(self._fetch_avatar(asset))
+        self._fetching[key] = task
+        try:
+            img = await asyncio.shield(task)
+        finally:
+            self._fetching.pop(key, None)
+        if img is not None:
+            self._avatars[key] = img
+            while len(self._avatars) > self._avatar_cache_size:
+                self._avatars.popitem(last=False)
+        return img
+
+    async def _fetch_avatar(self, asset) -> Optional[Any]:
+        try:
+            raw = await asset.replace(size=256, static_format='png').read()
+            return await self._run(_decode_avatar, raw)
+        except Exception as e:
+            logger.debug(f'[RankCard] Avatar non disponibile: {e}')
+            return None
+
+    async def render(self, cfg: Dict[str, Any], data: CardData, avatar_asset=None) -> Tuple[bytes, str]:
+        """Ritorna (byte dell'immagine, estensione del file)."""
+        fmt = str(cfg.get('format', 'png')).lower()
+        ext = FORMATS.get(fmt, FORMATS['png'])[0]
+        if data.avatar is None and avatar_asset is not None:
+            data.avatar = await self.avatar(avatar_asset)
+        async with self._semaphore:
+            payload = await self._run(_render, cfg, data, fmt)
+        self.rendered += 1
+        return payload, ext
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'rendered': self.rendered,
+            'avatars_cached': len(self._avatars),
+            'avatar_hits': self.avatar_hits,
+            'avatar_misses': self.avatar_misses,
+            'max_concurrent': self.max_concurrent,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
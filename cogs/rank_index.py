@@ -0,0 +1,207 @@
+"""Indice delle posizioni XP per guild, aggiornato a ogni variazione di XP.
+
+Per ogni guild si tiene una lista ordinata di (-xp, user_id): la posizione di
+un utente, una pagina di classifica e gli utenti attorno a qualcuno si
+ottengono con bisezione e slicing, senza riordinare tutti gli utenti.
+L'ordine coincide con quello del backend SQLite (xp DESC, user_id) e la
+posizione è "1 + utenti con più XP", come `rank_of` dei backend.
+
+`IndexedLevelsStore` avvolge un backend dei livelli: inoltra tutte le chiamate
+e tiene aggiornato l'indice con i risultati di `apply_grants`, `set_xp` e
+`set_many`. L'indice di una guild si costruisce dai dati salvati al primo
+utilizzo (o all'avvio con `warm`).
+"""
+
+import asyncio
+import bisect
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from sortedcontainers import SortedList
+except ImportError:  # pragma: no cover - dipendenza opzionale
+    SortedList = None
+
+Entry = Tuple[int, int]
+
+
+class _BisectList:
+    """Ripiego senza sortedcontainers: lista ordinata con bisect (inserimento O(n))."""
+
+    def __init__(self, items: Iterable[Entry] = ()):
+        self._items = sorted(items)
+
+    def add(self, item: Entry):
+        bisect.insort(self._items, item)
+
+    def remove(self, item: Entry):
+        i = bisect.bisect_left(self._items, item)
+        if i < len(self._items) and self._items[i] == item:
+            del self._items[i]
+        else:
+            raise ValueError(item)
+
+    def bisect_left(self, item) -> int:
+        return bisect.bisect_left(self._items, item)
+
+    def index(self, item: Entry) -> int:
+        i = bisect.bisect_left(self._items, item)
+        if i < len(self._items) and self._items[i] == item:
+            return i
+        raise ValueError(item)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def _sorted_list(items: Iterable[Entry] = ()):
+    return SortedList(items) if SortedList is not None else _BisectList(items)
+
+
+class GuildRankIndex:
+    def __init__(self, rows: Iterable[Tuple[int, int]] = ()):
+        self.xp: Dict[int, int] = {int(uid): int(xp) for uid, xp in rows}
+        self.order = _sorted_list((-xp, uid) for uid, xp in self.xp.items())
+
+    def __len__(self) -> int:
+        return len(self.xp)
+
+    def update(self, user_id: int, xp: int):
+        xp = int(xp)
+        old = self.xp.get(user_id)
+        if old == xp:
+            return
+        if old is not None:
+            self.order.remove((-old, user_id))
+        self.xp[user_id] = xp
+        self.order.add((-xp, user_id))
+
+    def remove(self, user_id: int):
+        old = self.xp.pop(user_id, None)
+        if old is not None:
+            self.order.remove((-old, user_id))
+
+    def rank_of(self, user_id: int) -> Optional[int]:
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return None
+        # (-xp,) precede ogni (-xp, uid): conta solo chi ha più XP
+        return self.order.bisect_left((-xp,)) + 1
+
+    def page(self, offset: int, limit: int) -> List[Entry]:
+        offset = max(0, int(offset))
+        return [(uid, -neg) for neg, uid in self.order[offset:offset + max(0, int(limit))]]
+
+    def around(self, user_id: int, radius: int = 5) -> Tuple[int, List[Entry]]:
+        """(posizione del primo elemento, righe) attorno all'utente; (0, []) se non è in classifica."""
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return 0, []
+        pos = self.order.index((-xp, user_id))
+        start = max(0, pos - radius)
+        return start + 1, self.page(start, 2 * radius + 1)
+
+
+class RankIndex:
+    def __init__(self):
+        self.guilds: Dict[int, GuildRankIndex] = {}
+        # Aggiornamenti arrivati mentre l'indice della guild si sta costruendo
+        self._building: Dict[int, List[Entry]] = {}
+        self._build_locks: Dict[int, asyncio.Lock] = {}
+        self.builds = 0
+
+    def apply(self, guild_id: int, user_id: int, xp: int):
+        idx = self.guilds.get(guild_id)
+        if idx is not None:
+            idx.update(user_id, xp)
+        elif guild_id in self._building:
+            self._building[guild_id].append((user_id, xp))
+
+    async def get(self, guild_id: int, xp_store) -> GuildRankIndex:
+        idx = self.guilds.get(guild_id)
+        if idx is not None:
+            return idx
+        lock = self._build_locks.setdefault(guild_id, asyncio.Lock())
+        async with lock:
+            idx = self.guilds.get(guild_id)
+            if idx is None:
+                self._building[guild_id] = []
+                try:
+                    rows = await xp_store.guild_rows(guild_id)
+                    idx = GuildRankIndex(rows)
+                    for uid, xp in self._building[guild_id]:
+                        idx.update(uid, xp)
+                    self.guilds[guild_id] = idx
+                    self.builds += 1
+                finally:
+                    self._building.pop(guild_id, None)
+        return idx
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'guilds': len(self.guilds),
+            'users': sum(len(g) for g in self.guilds.values()),
+            'builds': self.builds,
+            'backend': 'sortedcontainers' if SortedList is not None else 'bisect',
+        }
+
+
+class IndexedLevelsStore:
+    """Backend dei livelli con classifica e posizioni servite dall'indice in memoria."""
+
+    def __init__(self, inner, index: Optional[RankIndex] = None):
+        self.inner = inner
+        self.index = index or RankIndex()
+        self.backend = inner.backend
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def describe(self) -> Dict[str, Any]:
+        return self.index.describe()
+
+    async def apply_grants(self, grants):
+        results = await self.inner.apply_grants(grants)
+        for gid, uid, _, after in results:
+            self.index.apply(gid, uid, after)
+        return results
+
+    async def set_xp(self, guild_id: int, user_id: int, xp: int) -> int:
+        before = await self.inner.set_xp(guild_id, user_id, xp)
+        self.index.apply(int(guild_id), int(user_id), int(xp))
+        return before
+
+    async def set_many(self, rows, mode: str = 'overwrite'):
+        results = await self.inner.set_many(rows, mode)
+        for gid, uid, _, after in results:
+            self.index.apply(int(gid), int(uid), after)
+        return results
+
+    async def top(self, guild_id: int, limit: int, offset: int = 0) -> List[Entry]:
+        return (await self.index.get(int(guild_id), self.inner)).page(offset, limit)
+
+    async def rank_of(self, guild_id: int, user_id: int) -> Optional[int]:
+        return (await self.index.get(int(guild_id), self.inner)).rank_of(int(user_id))
+
+    async def count(self, guild_id: int) -> int:
+        return len(await self.index.get(int(guild_id), self.inner))
+
+    async def around(self, guild_id: int, user_id: int, radius: int = 5) -> Tuple[int, List[Entry]]:
+        return (await self.index.get(int(guild_id), self.inner)).around(int(user_id), radius)
+
+    async def migrate_legacy(self) -> bool:
+        changed = await self.inner.migrate_legacy()
+        if changed:
+            # Gli XP sono cambiati in blocco: gli indici si ricostruiscono al prossimo uso
+            self.index.guilds.clear()
+        return changed
+
+    async def warm(self) -> int:
+        """Costruisce subito gli indici di tutte le guild salvate."""
+        built = 0
+        for gid in await self.inner.guild_ids():
+            await self.index.get(gid, self.inner)
+            built += 1
+        return built
@@ -0,0 +1,126 @@
+"""Valutatore aritmetico limitato per il counting (al posto di eval).
+
+Accetta solo numeri (interi o decimali), + - * / // % ** e parentesi. Il
+testo che non può essere un'espressione viene scartato con una regex prima
+di qualunque parsing; l'albero sintattico ha al più `MAX_NODES` nodi, ogni
+valore intermedio al più `MAX_DIGITS` cifre e gli esponenti sono interi
+entro `MAX_EXPONENT`, con la dimensione della potenza stimata prima di
+calcolarla. Così nessun messaggio (es. `9**9**9`) può bloccare il loop.
+
+I conti si fanno con gli interi, passando a `Fraction` solo con "/" o i
+decimali (niente errori di arrotondamento), e il risultato si tronca a intero
+come faceva `int(eval(...))`. I risultati, anche
+i rifiuti, restano in una cache LRU per testo.
+"""
+
+import ast
+import operator
+import re
+from fractions import Fraction
+from functools import lru_cache
+from typing import Optional, Union
+
+MAX_LENGTH = 200
+MAX_NODES = 64
+MAX_DIGITS = 40
+MAX_EXPONENT = 128
+CACHE_SIZE = 4096
+
+# Solo cifre, spazi, punti, parentesi e operatori, con almeno una cifra
+_CHARSET = re.compile(r'[0-9\s.+\-*/%()]+')
+_DIGIT = re.compile(r'[0-9]')
+
+_LIMIT = 10 ** MAX_DIGITS
+_LIMIT_BITS = _LIMIT.bit_length()
+
+Number = Union[int, Fraction]
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+
+class Rejected(Exception):
+    """Espressione non valida o oltre i limiti."""
+
+
+def looks_like_math(text: str) -> bool:
+    """Controllo veloce, senza parsing: può essere un'espressione aritmetica?"""
+    return (len(text) <= MAX_LENGTH and _CHARSET.fullmatch(text) is not None
+            and _DIGIT.search(text) is not None)
+
+
+def _check(value: Number) -> Number:
+    if type(value) is int:
+        if -_LIMIT < value < _LIMIT:
+            return value
+    elif abs(value.numerator) < _LIMIT and value.denominator < _LIMIT:
+        return value.numerator if value.denominator == 1 else value
+    raise Rejected('troppe cifre')
+
+
+def _power(base: Number, exp: Number) -> Number:
+    if type(exp) is not int or abs(exp) > MAX_EXPONENT:
+        raise Rejected('esponente non valido')
+    base = Fraction(base)
+    e = abs(exp)
+    # Stima delle cifre del risultato prima di calcolarlo
+    size = max(abs(base.numerator).bit_length(), base.denominator.bit_length())
+    if size > 1 and (size - 1) * e > _LIMIT_BITS:
+        raise Rejected('potenza troppo grande')
+    if base == 0 and exp < 0:
+        raise Rejected('divisione per zero')
+    return _check(base ** exp)
+
+
+def _eval(node: ast.AST, budget: list) -> Number:
+    # Nodi visitati contati durante la valutazione (niente secondo giro sull'albero)
+    budget[0] -= 1
+    if budget[0] < 0:
+        raise Rejected('espressione troppo lunga')
+    if isinstance(node, ast.BinOp):
+        left = _eval(node.left, budget)
+        right = _eval(node.right, budget)
+        op = type(node.op)
+        if op is ast.Pow:
+            return _power(left, right)
+        try:
+            if op is ast.Div:
+                return _check(Fraction(left) / right)
+            func = _BINARY.get(op)
+            if func is None:
+                raise Rejected('operatore non ammesso')
+            return _check(func(left, right))
+        except ZeroDivisionError:
+            raise Rejected('divisione per zero')
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _eval(node.operand, budget)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        # Il testo del letterale, non il float, per i decimali esatti
+        return _check(Fraction(repr(node.value)) if isinstance(node.value, float) else node.value)
+    raise Rejected('elemento non ammesso')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def evaluate(text: str) -> Optional[int]:
+    """Valore intero dell'espressione in `text`, o None se non è un'espressione ammessa."""
+    text = text.strip()
+    if not looks_like_math(text):
+        return None
+    try:
+        tree = ast.parse(text, mode='eval')
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return None
+    try:
+        return int(_eval(tree.body, [MAX_NODES]))
+    except (Rejected, RecursionError):
+        return None
+
+
+def cache_info():
+    return evaluate.cache_info()
@@ -0,0 +1,59 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from typing import Optional
+
+from bot_utils import owner_only
+
+
+class SyncCog(commands.Cog):
+    """Sync manuale dei comandi slash (scavalca la cache delle impronte)."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @app_commands.command(name='sync', description='Forza la sincronizzazione dei comandi slash (solo owner)')
+    @app_commands.describe(scope='Cosa sincronizzare', force='Sincronizza anche se i comandi risultano invariati')
+    @app_commands.choices(scope=[
+        app_commands.Choice(name='Questa guild', value='guild'),
+        app_commands.Choice(name='Globale', value='global'),
+        app_commands.Choice(name='Globale + tutte le guild', value='all'),
+    ])
+    @owner_only()
+    async def sync_cmd(self, interaction: discord.Interaction, scope: Optional[app_commands.Choice[str]] = None, force: bool = True):
+        syncer = getattr(self.bot, 'command_syncer', None)
+        if syncer is None:
+            await interaction.response.send_message('❌ Sync dei comandi non disponibile.', ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        value = scope.value if scope else 'guild'
+        lines = []
+        try:
+            if value in ('global', 'all'):
+                n = await syncer.sync(force=force)
+                lines.append('🌍 Globale: ' + ('invariato, saltato' if n is None else f'{n} comandi'))
+            if value == 'guild':
+                if interaction.guild is None:
+                    await interaction.followup.send('❌ Usa questo comando in un server oppure scegli "Globale".', ephemeral=True)
+                    return
+                done, skipped = await syncer.sync_guilds([interaction.guild], force=force)
+                lines.append(f'⚡ Guild: {"sincronizzata" if done else "invariata, saltata"}')
+            elif value == 'all':
+                done, skipped = await syncer.sync_guilds(self.bot.guilds, force=force)
+                lines.append(f'⚡ Guild sincronizzate: {done} • invariate: {skipped}')
+        except Exception as e:
+            await interaction.followup.send(f'❌ Errore durante il sync: {e}', ephemeral=True)
+            return
+        await interaction.followup.send('\n'.join(lines), ephemeral=True)
+
+    @sync_cmd.error
+    async def sync_cmd_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            try:
+                await interaction.response.send_message('⛔ Solo il proprietario del bot può usare questo comando.', ephemeral=True)
+            except Exception:
+                pass
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(SyncCog(bot))
@@ -42,11 +42,13 @@ Se vuoi cambiare colori/emoji/banner per l'embed del pannello modifica i campi `
 import discord
 from discord.ext import commands
 from discord import app_commands, ui
-import json
 import os
 from datetime import datetime
 from typing import Optional, Dict, Any
 
+from .json_store import store
+from .config_snapshots import CompiledConfig, TicketsSnapshot, member_role_ids
+
 BASE_DIR = os.path.dirname(__file__)
 TICKETS_FILE = os.path.join(BASE_DIR, '..', 'tickets.json')
 CONFIG_FILE = os.path.join(BASE_DIR, '..', 'config_tickets.json')
@@ -120,41 +122,23 @@ def load_or_create_config() -> Dict[str, Any]:
     """Load config from CONFIG_FILE or create defaults.
     Merges user config with defaults safely.
     """
-    if not os.path.exists(CONFIG_FILE):
-        save_json(CONFIG_FILE, DEFAULT_AUTO_CONFIG)
-        return DEFAULT_AUTO_CONFIG.copy()
+    if not store.exists(CONFIG_FILE):
+        store.put(CONFIG_FILE, DEFAULT_AUTO_CONFIG.copy())
+        return store.load(CONFIG_FILE)
     try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = store.load(CONFIG_FILE, None)
         if not isinstance(data, dict):
             raise ValueError('config malformed')
         merged = {**DEFAULT_AUTO_CONFIG, **data}
         # ensure panels is valid list
         if 'panels' not in merged or not isinstance(merged['panels'], list):
             merged['panels'] = DEFAULT_AUTO_CONFIG['panels']
-        save_json(CONFIG_FILE, merged)
+        if merged != data:
+            store.put(CONFIG_FILE, merged)
         return merged
     except Exception:
-        save_json(CONFIG_FILE, DEFAULT_AUTO_CONFIG)
-        return DEFAULT_AUTO_CONFIG.copy()
-
-
-def load_json(path: str, default: Any):
-    try:
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return default
-
-
-def save_json(path: str, data: Any) -> None:
-    try:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception:
-        pass
+        store.put(CONFIG_FILE, DEFAULT_AUTO_CONFIG.copy())
+        return store.load(CONFIG_FILE)
 
 
 def ensure_transcripts_dir() -> None:
@@ -351,8 +335,9 @@ class Tickets(commands.Cog):
     """Cog che gestisce il sistema tickets (slash + comandi classici)"""
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.tickets = load_json(TICKETS_FILE, {})
+        self.tickets = store.load(TICKETS_FILE, {})
         self.config = load_or_create_config()
+        self.settings = CompiledConfig(TicketsSnapshot.from_config, self.config)
         ensure_transcripts_dir()
 
         # register slash group
@@ -368,17 +353,12 @@ class Tickets(commands.Cog):
             pass
 
     def save_tickets(self) -> None:
-        save_json(TICKETS_FILE, self.tickets)
+        store.put(TICKETS_FILE, self.tickets)
 
     def _is_staff(self, member: discord.Member) -> bool:
-        staff_role_id = self.config.get("staff_role_id")
-        staff_role = None
-        try:
-            if staff_role_id:
-                staff_role = member.guild.get_role(int(staff_role_id))
-        except Exception:
-            staff_role = None
-        return bool(member.guild_permissions.administrator or (staff_role and staff_role in member.roles))
+        if member.guild_permissions.administrator:
+            return True
+        return not self.settings.current.staff_role_ids.isdisjoint(member_role_ids(member))
 
     async def _resolve_ticket_category(self, guild: discord.Guild, panel: Optional[dict] = None) -> Optional[discord.CategoryChannel]:
         category_id = self.config.get("category_id")
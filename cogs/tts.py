@@ -13,6 +13,8 @@ from discord.ext import commands, tasks
 from discord import app_commands, ui
 from dotenv import load_dotenv
 
+from .metrics import loop_timer
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("tts")
 
@@ -138,6 +140,7 @@ class TTSCog(commands.Cog):
             json.dump(self.tts_config, f, indent=2, ensure_ascii=False)
 
     @tasks.loop(minutes=2)
+    @loop_timer('tts_update_voice_cache')
     async def update_voice_cache(self):
         try:
             self.voice_manager.fetch_voices()
@@ -10,6 +10,7 @@ try:
 except Exception:
     import logging
     logger = logging.getLogger("verify")
+from .json_store import store
 
 # Path config (root)
 BASE_DIR = os.path.dirname(__file__)
@@ -17,14 +18,10 @@ PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, '..'))
 CONFIG_PATH = os.path.join(PROJECT_ROOT, 'config.json')
 
 def load_config():
-    if not os.path.exists(CONFIG_PATH):
-        return {}
-    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return store.load(CONFIG_PATH, {})
 
 def save_config(cfg: dict):
-    with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-        json.dump(cfg, f, indent=2, ensure_ascii=False)
+    store.put(CONFIG_PATH, cfg)
 
 class VerifyView(ui.View):
     def __init__(self, role_id: int | None, *, button_label: str = 'Verificati', button_style: int = discord.ButtonStyle.success):
@@ -0,0 +1,196 @@
+"""Sessioni vocali tenute in memoria, aggiornate da `on_voice_state_update`.
+
+Per ogni membro in vocale si ricorda da quando è "idoneo" (non bot, non in un
+canale escluso, non mutato/silenziato se la config lo esclude, senza ruoli
+esclusi) e quanti secondi idonei ha accumulato. Ogni cambio di stato chiude il
+tratto in corso; `collect` trasforma i minuti interi accumulati in accrediti
+XP da applicare in un solo batch, tenendo il resto per il giro successivo.
+
+Lo stato si salva in uno snapshot JSON (via json_store): dopo un riavvio le
+sessioni dei membri ancora nello stesso canale riprendono con i secondi già
+accumulati; il tempo a bot spento non viene accreditato, e nemmeno quello
+passato con l'XP vocale disattivato. La config si riapplica con `configure`.
+"""
+
+import random
+import time
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .config_snapshots import member_role_ids
+from .json_store import store
+
+Key = Tuple[int, int]
+Grant = Tuple[int, int, int, Optional[int]]
+
+
+def _int_set(values) -> FrozenSet[int]:
+    out = set()
+    for v in values or []:
+        try:
+            out.add(int(v))
+        except (TypeError, ValueError):
+            continue
+    return frozenset(out)
+
+
+class VoiceSession:
+    __slots__ = ('guild_id', 'user_id', 'channel_id', 'member', 'eligible', 'since', 'seconds')
+
+    def __init__(self, guild_id: int, user_id: int, channel_id: int, member: Any = None):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.member = member
+        self.eligible = False
+        # Inizio del tratto in corso (epoch) e secondi idonei non ancora accreditati
+        self.since = 0.0
+        self.seconds = 0.0
+
+    def settle(self, now: float):
+        if self.eligible and now > self.since:
+            self.seconds += now - self.since
+        self.since = now
+
+
+class VoiceSessionTracker:
+    def __init__(self, vcfg: Dict[str, Any], multiplier: Callable[[FrozenSet[int], dict], float],
+                 snapshot_path: Optional[str] = None):
+        self.multiplier = multiplier
+        self.snapshot_path = snapshot_path
+        self.sessions: Dict[Key, VoiceSession] = {}
+        self.transitions = 0
+        self.configure(vcfg)
+
+    def configure(self, vcfg: Dict[str, Any]):
+        """Rilegge la config voice_xp (insiemi di id calcolati una volta sola)."""
+        self.vcfg = vcfg
+        self.enabled = bool(vcfg.get('enabled', True))
+        self.excluded_channels = _int_set(vcfg.get('exclude_afk_channel_ids', []))
+        self.excluded_roles = _int_set(vcfg.get('excluded_role_ids', []))
+        self.exclude_muted = bool(vcfg.get('exclude_muted', True))
+        self.exclude_deaf = bool(vcfg.get('exclude_deaf', True))
+        self.per_min = (int(vcfg.get('per_min_min', 2)), int(vcfg.get('per_min_max', 5)))
+        self.multiplier_roles = vcfg.get('multiplier_roles', {})
+
+    def is_eligible(self, member, state) -> bool:
+        if state is None or state.channel is None or getattr(member, 'bot', False):
+            return False
+        if state.channel.id in self.excluded_channels:
+            return False
+        if self.exclude_muted and (state.self_mute or state.mute):
+            return False
+        if self.exclude_deaf and (state.self_deaf or state.deaf):
+            return False
+        if self.excluded_roles and not self.excluded_roles.isdisjoint(_role_ids(member)):
+            return False
+        return True
+
+    # ------------------ Transizioni ------------------
+    def update(self, member, after, now: Optional[float] = None):
+        """Applica il nuovo stato vocale del membro (join, leave, move, mute, deaf)."""
+        now = time.time() if now is None else now
+        key = (member.guild.id, member.id)
+        session = self.sessions.get(key)
+        self.transitions += 1
+        if after is None or after.channel is None or getattr(member, 'bot', False):
+            if session is not None:
+                session.settle(now)
+                session.eligible = False
+                # Resta in tabella finché i secondi non vengono raccolti
+                session.channel_id = 0
+            return
+        if session is None:
+            session = self.sessions[key] = VoiceSession(key[0], key[1], after.channel.id, member)
+        session.settle(now)
+        session.channel_id = after.channel.id
+        session.member = member
+        session.eligible = self.is_eligible(member, after)
+
+    def bootstrap(self, guilds: Iterable[Any], now: Optional[float] = None) -> int:
+        """Scansione unica all'avvio: apre le sessioni di chi è già in vocale."""
+        now = time.time() if now is None else now
+        opened = 0
+        for guild in guilds:
+            for vc in getattr(guild, 'voice_channels', []):
+                for member in vc.members:
+                    key = (guild.id, member.id)
+                    if key in self.sessions and self.sessions[key].channel_id == vc.id:
+                        continue
+                    self.update(member, member.voice, now)
+                    opened += 1
+        return opened
+
+    # ------------------ Accredito ------------------
+    def collect(self, now: Optional[float] = None) -> Tuple[List[Grant], Dict[Key, Any]]:
+        """Converte i minuti interi idonei in accrediti; rimuove le sessioni chiuse e vuote."""
+        now = time.time() if now is None else now
+        grants: List[Grant] = []
+        members: Dict[Key, Any] = {}
+        lo, hi = self.per_min
+        closed = []
+        for key, session in self.sessions.items():
+            session.settle(now)
+            if not self.enabled:
+                # XP vocale disattivato: il tempo non si accumula per quando verrà riattivato
+                session.seconds = 0.0
+            minutes = int(session.seconds // 60)
+            if minutes > 0:
+                session.seconds -= minutes * 60
+                member = session.member
+                mult = self.multiplier(member_role_ids(member), self.multiplier_roles) if member is not None else 1.0
+                amount = int(sum(random.randint(lo, hi) for _ in range(minutes)) * mult)
+                if amount > 0:
+                    grants.append((key[0], key[1], amount, None))
+                    members[key] = member
+            if session.channel_id == 0:
+                closed.append(key)
+            elif session.member is not None and session.channel_id:
+                # I ruoli possono essere cambiati: si rivaluta l'idoneità per il prossimo tratto
+                session.eligible = self.is_eligible(session.member, getattr(session.member, 'voice', None))
+        for key in closed:
+            # I secondi sotto il minuto di una sessione chiusa vanno persi, come prima
+            del self.sessions[key]
+        return grants, members
+
+    # ------------------ Snapshot ------------------
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'saved_at': time.time(),
+            'sessions': [
+                {'g': s.guild_id, 'u': s.user_id, 'c': s.channel_id, 'seconds': round(s.seconds, 1)}
+                for s in self.sessions.values() if s.channel_id
+            ],
+        }
+
+    def save(self):
+        if self.snapshot_path:
+            store.put(self.snapshot_path, self.snapshot(), indent=None)
+
+    def restore(self, guilds: Iterable[Any], now: Optional[float] = None) -> int:
+        """Riprende le sessioni dello snapshot per chi è ancora nello stesso canale."""
+        if not self.snapshot_path:
+            return 0
+        data = store.load(self.snapshot_path, {})
+        by_id = {g.id: g for g in guilds}
+        now = time.time() if now is None else now
+        restored = 0
+        for row in data.get('sessions', []):
+            try:
+                guild = by_id.get(int(row['g']))
+                member = guild.get_member(int(row['u'])) if guild is not None else None
+                state = getattr(member, 'voice', None)
+                if state is None or state.channel is None or state.channel.id != int(row['c']):
+                    continue
+                self.update(member, state, now)
+                self.sessions[(guild.id, member.id)].seconds += float(row.get('seconds', 0))
+                restored += 1
+            except Exception:
+                continue
+        return restored
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'sessions': len(self.sessions),
+            'eligible': sum(1 for s in self.sessions.values() if s.eligible),
+            'transitions': self.transitions,
+        }
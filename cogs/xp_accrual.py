@@ -0,0 +1,128 @@
+"""Buffer in memoria per gli XP dei messaggi, applicati a blocchi.
+
+Ogni messaggio che supera i filtri passa da `XpAccrual.offer`: il cooldown si
+controlla in memoria e l'XP finisce in un buffer per (guild, utente). Il tick
+periodico (`flush`) applica tutto il buffer con un solo `apply_grants`, calcola
+i passaggi di livello dell'intero blocco e li restituisce per gli annunci.
+
+L'ultimo accredito di un utente si legge dal backend solo la prima volta che lo
+si incontra (o dopo che la voce è scaduta ed è stata rimossa dalla memoria).
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Key = Tuple[int, int]
+# (guild_id, user_id, livello_nuovo, membro o None)
+LevelUp = Tuple[int, int, int, Any]
+
+
+class _Pending:
+    __slots__ = ('amount', 'last_at', 'member')
+
+    def __init__(self):
+        self.amount = 0
+        self.last_at = 0
+        self.member = None
+
+
+class XpAccrual:
+    def __init__(self, xp_store, curve_for: Callable[[int], Any]):
+        self.xp_store = xp_store
+        self.curve_for = curve_for
+        # Ultimo accredito testuale noto per (guild, utente)
+        self._last: Dict[Key, int] = {}
+        self._pending: Dict[Key, _Pending] = {}
+        # Statistiche
+        self.offered = 0
+        self.accepted = 0
+        self.flushes = 0
+        self.grants_applied = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def offer(self, guild_id: int, user_id: int, now: int, cooldown: int, amount: Callable[[], int],
+                    member: Any = None) -> bool:
+        """Accoda l'XP se il cooldown è scaduto. `amount` si calcola solo se accettato."""
+        self.offered += 1
+        key = (guild_id, user_id)
+        last = self._last.get(key)
+        if last is None:
+            u = await self.xp_store.get_user(guild_id, user_id)
+            # Un altro messaggio potrebbe aver già popolato la voce durante l'attesa
+            last = self._last.setdefault(key, u['last_msg_xp_at'])
+        if last and now - last < cooldown:
+            return False
+        self._last[key] = now
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = _Pending()
+        entry.amount += int(amount())
+        entry.last_at = now
+        if member is not None:
+            entry.member = member
+        self.accepted += 1
+        return True
+
+    def discard(self, guild_id: int, user_id: int) -> int:
+        """Scarta l'XP in attesa dell'utente (es. dopo un /level setxp); ritorna quanto scartato."""
+        entry = self._pending.pop((guild_id, user_id), None)
+        return entry.amount if entry else 0
+
+    def pending_xp(self, guild_id: int, user_id: int) -> int:
+        entry = self._pending.get((guild_id, user_id))
+        return entry.amount if entry else 0
+
+    async def flush(self, now: Optional[int] = None, cooldown: int = 0) -> List[LevelUp]:
+        """Applica il buffer in blocco e ritorna i level-up del blocco."""
+        if now is not None and cooldown > 0:
+            # Le voci con cooldown scaduto si possono rileggere dal backend se servono
+            expired = [k for k, ts in self._last.items() if now - ts >= cooldown and k not in self._pending]
+            for k in expired:
+                del self._last[k]
+        if not self._pending:
+            return []
+        batch, self._pending = self._pending, {}
+        grants = [(gid, uid, e.amount, e.last_at) for (gid, uid), e in batch.items()]
+        try:
+            results = await self.xp_store.apply_grants(grants)
+        except Exception:
+            # Rimette in coda il blocco (sommando a quanto arrivato nel frattempo)
+            for key, e in batch.items():
+                cur = self._pending.get(key)
+                if cur is None:
+                    self._pending[key] = e
+                else:
+                    cur.amount += e.amount
+                    cur.last_at = max(cur.last_at, e.last_at)
+                    cur.member = cur.member or e.member
+            raise
+        self.flushes += 1
+        self.grants_applied += len(grants)
+        return self.level_ups(results, {k: e.member for k, e in batch.items()})
+
+    def level_ups(self, results, members: Dict[Key, Any]) -> List[LevelUp]:
+        """Passaggi di livello per i risultati di `apply_grants`, calcolati per guild in blocco."""
+        by_guild: Dict[int, List[Tuple[int, int, int]]] = {}
+        for gid, uid, before, after in results:
+            if after > before:
+                by_guild.setdefault(gid, []).append((uid, before, after))
+        ups = []
+        for gid, rows in by_guild.items():
+            curve = self.curve_for(gid)
+            old_levels = curve.levels_for(before for _, before, _ in rows)
+            new_levels = curve.levels_for(after for _, _, after in rows)
+            for (uid, _, _), old, new in zip(rows, old_levels, new_levels):
+                if new > old:
+                    ups.append((gid, uid, new, members.get((gid, uid))))
+        return ups
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'tracked_cooldowns': len(self._last),
+            'offered': self.offered,
+            'accepted': self.accepted,
+            'flushes': self.flushes,
+            'grants_applied': self.grants_applied,
+        }
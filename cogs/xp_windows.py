@@ -0,0 +1,187 @@
+"""Statistiche XP a finestre mobili (giorno, settimana, mese) per guild.
+
+Per ogni utente si tiene un anello di `DAYS` contatori giornalieri in un
+`array` compatto più il giorno (UTC) dell'ultimo accredito. Un accredito
+azzera gli slot dei giorni saltati (al più `DAYS`) e somma nello slot di
+oggi: O(1) per accredito e memoria fissa per utente. Gli utenti senza XP
+negli ultimi `DAYS` giorni vengono rimossi da `prune`.
+
+`WindowedLevelsStore` avvolge il backend dei livelli (come `IndexedLevelsStore`)
+e registra gli XP guadagnati con ogni `apply_grants`; `/level setxp` non conta
+come XP guadagnato. Le classifiche di un periodo si ricalcolano al più ogni
+`RANK_TTL` secondi per guild.
+"""
+
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .json_store import store
+
+DAYS = 31
+PERIODS = {'day': 1, 'week': 7, 'month': 30}
+RANK_TTL = 15.0
+
+Entry = Tuple[int, int]
+
+
+def day_of(ts: Optional[float] = None) -> int:
+    return int((time.time() if ts is None else ts) // 86400)
+
+
+class _UserWindow:
+    __slots__ = ('last_day', 'counts')
+
+    def __init__(self, last_day: int, counts: Optional[array] = None):
+        self.last_day = last_day
+        self.counts = counts if counts is not None else array('L', [0]) * DAYS
+
+    def add(self, day: int, amount: int):
+        if day > self.last_day:
+            # Azzera gli slot dei giorni passati senza accrediti (e quello di oggi)
+            for d in range(max(self.last_day + 1, day - DAYS + 1), day + 1):
+                self.counts[d % DAYS] = 0
+            self.last_day = day
+        elif day <= self.last_day - DAYS:
+            return
+        self.counts[day % DAYS] += amount
+
+    def total(self, today: int, days: int) -> int:
+        first = max(today - days + 1, self.last_day - DAYS + 1)
+        counts = self.counts
+        return sum(counts[d % DAYS] for d in range(first, min(today, self.last_day) + 1))
+
+
+class XpWindows:
+    def __init__(self, snapshot_path: Optional[str] = None):
+        self.snapshot_path = snapshot_path
+        self.guilds: Dict[int, Dict[int, _UserWindow]] = {}
+        # Versione per guild: le classifiche in cache valgono finché non cambia
+        self._versions: Dict[int, int] = {}
+        self._rankings: Dict[Tuple[int, str], Tuple[int, int, float, List[Entry]]] = {}
+        self.dirty = False
+        self.grants = 0
+
+    def add(self, guild_id: int, user_id: int, amount: int, ts: Optional[float] = None):
+        if amount <= 0:
+            return
+        users = self.guilds.get(guild_id)
+        if users is None:
+            users = self.guilds[guild_id] = {}
+        day = day_of(ts)
+        window = users.get(user_id)
+        if window is None:
+            window = users[user_id] = _UserWindow(day)
+        window.add(day, int(amount))
+        self._versions[guild_id] = self._versions.get(guild_id, 0) + 1
+        self.dirty = True
+        self.grants += 1
+
+    def gained(self, guild_id: int, user_id: int, period: str, today: Optional[int] = None) -> int:
+        window = self.guilds.get(guild_id, {}).get(user_id)
+        if window is None:
+            return 0
+        return window.total(day_of() if today is None else today, PERIODS[period])
+
+    def ranking(self, guild_id: int, period: str, now: Optional[float] = None) -> List[Entry]:
+        """[(user_id, xp del periodo)] ordinata come le classifiche totali (xp DESC, user_id)."""
+        now = time.time() if now is None else now
+        today = day_of(now)
+        version = self._versions.get(guild_id, 0)
+        key = (guild_id, period)
+        cached = self._rankings.get(key)
+        if cached is not None and cached[1] == today and (cached[0] == version or now - cached[2] < RANK_TTL):
+            return cached[3]
+        days = PERIODS[period]
+        rows = []
+        for uid, window in self.guilds.get(guild_id, {}).items():
+            xp = window.total(today, days)
+            if xp > 0:
+                rows.append((uid, xp))
+        rows.sort(key=lambda r: (-r[1], r[0]))
+        self._rankings[key] = (version, today, now, rows)
+        return rows
+
+    def top(self, guild_id: int, period: str, limit: int, offset: int = 0) -> List[Entry]:
+        offset = max(0, int(offset))
+        return self.ranking(guild_id, period)[offset:offset + max(0, int(limit))]
+
+    def count(self, guild_id: int, period: str) -> int:
+        return len(self.ranking(guild_id, period))
+
+    def prune(self, today: Optional[int] = None) -> int:
+        """Rimuove chi non ha accrediti negli ultimi DAYS giorni; ritorna quanti."""
+        today = day_of() if today is None else today
+        removed = 0
+        for gid in list(self.guilds):
+            users = self.guilds[gid]
+            stale = [uid for uid, w in users.items() if w.last_day <= today - DAYS]
+            for uid in stale:
+                del users[uid]
+            removed += len(stale)
+            if not users:
+                del self.guilds[gid]
+                self._versions.pop(gid, None)
+        if removed:
+            self._rankings.clear()
+            self.dirty = True
+        return removed
+
+    # ------------------ Snapshot ------------------
+    def snapshot(self) -> Dict[str, Dict[str, list]]:
+        return {
+            str(gid): {str(uid): [w.last_day, w.counts.tolist()] for uid, w in users.items()}
+            for gid, users in self.guilds.items()
+        }
+
+    def save(self, force: bool = False):
+        if self.snapshot_path and (self.dirty or force):
+            self.prune()
+            store.put(self.snapshot_path, self.snapshot(), indent=None)
+            self.dirty = False
+
+    def restore(self) -> int:
+        if not self.snapshot_path:
+            return 0
+        restored = 0
+        for gid, users in store.load(self.snapshot_path, {}).items():
+            for uid, (last_day, counts) in users.items():
+                try:
+                    if len(counts) != DAYS:
+                        continue
+                    self.guilds.setdefault(int(gid), {})[int(uid)] = _UserWindow(int(last_day), array('L', counts))
+                    restored += 1
+                except Exception:
+                    continue
+        self.prune()
+        self.dirty = False
+        return restored
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            'guilds': len(self.guilds),
+            'users': sum(len(u) for u in self.guilds.values()),
+            'grants': self.grants,
+            'cached_rankings': len(self._rankings),
+        }
+
+
+class WindowedLevelsStore:
+    """Backend dei livelli che registra gli XP guadagnati nelle finestre mobili."""
+
+    def __init__(self, inner, windows: XpWindows):
+        self.inner = inner
+        self.windows = windows
+        self.backend = inner.backend
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    async def apply_grants(self, grants):
+        results = await self.inner.apply_grants(grants)
+        now = time.time()
+        add = self.windows.add
+        for gid, uid, before, after in results:
+            if after > before:
+                add(gid, uid, after - before, now)
+        return results
@@ -0,0 +1,74 @@
+"""Sync dei comandi slash solo quando le definizioni cambiano.
+
+Per ogni scope (globale o singola guild) si calcola un'impronta SHA-256 del
+payload che `tree.sync()` invierebbe a Discord. L'impronta dell'ultimo sync
+riuscito è salvata in `command_sync.json`: se coincide, il sync viene saltato
+e non si fa nessuna chiamata REST. Con `force=True` (comando /sync) si
+sincronizza comunque.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+from cogs.json_store import store
+
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'command_sync.json')
+
+
+class CommandSyncer:
+    def __init__(self, bot, path: str = STATE_PATH):
+        self.bot = bot
+        self.path = path
+        self.state: Dict[str, str] = store.load(path, {})
+        self.synced = 0
+        self.skipped = 0
+
+    def _key(self, guild: Optional[discord.abc.Snowflake]) -> str:
+        scope = 'global' if guild is None else f'guild:{guild.id}'
+        return f'{self.bot.application_id}:{scope}'
+
+    def fingerprint(self, guild: Optional[discord.abc.Snowflake] = None) -> str:
+        tree = self.bot.tree
+        payload = [cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)]
+        payload.sort(key=lambda c: (c.get('type', 1), c.get('name', '')))
+        raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    async def sync(self, guild: Optional[discord.abc.Snowflake] = None, *, force: bool = False) -> Optional[int]:
+        """Sincronizza lo scope se è cambiato. Ritorna i comandi sincronizzati, None se saltato."""
+        key = self._key(guild)
+        digest = self.fingerprint(guild)
+        if not force and self.state.get(key) == digest:
+            self.skipped += 1
+            return None
+        synced = await self.bot.tree.sync(guild=guild)
+        # Salva l'impronta solo dopo un sync riuscito
+        self.state[key] = digest
+        store.put(self.path, self.state)
+        self.synced += 1
+        return len(synced)
+
+    async def sync_guilds(self, guilds: Iterable[discord.Guild], *, force: bool = False) -> Tuple[int, int]:
+        """Copia i comandi globali in ogni guild e sincronizza quelle cambiate. Ritorna (sincronizzate, saltate)."""
+        done = skipped = 0
+        for g in guilds:
+            try:
+                self.bot.tree.copy_global_to(guild=g)
+                result = await self.sync(g, force=force)
+                if result is None:
+                    skipped += 1
+                else:
+                    done += 1
+                    print(f"⚡ Comandi sincronizzati velocemente per la guild: {g.name} ({g.id})")
+            except Exception as e:
+                print(f"⚠️ Guild sync fallita per {g.id}: {e}")
+        return done, skipped
+
+    def forget(self, guild: Optional[discord.abc.Snowflake] = None):
+        """Dimentica l'impronta dello scope: il prossimo sync verrà eseguito."""
+        if self.state.pop(self._key(guild), None) is not None:
+            store.put(self.path, self.state)
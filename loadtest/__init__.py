@@ -0,0 +1,10 @@
+"""Replay offline di eventi sintetici o registrati attraverso i listener reali dei cogs.
+
+Uso:
+    python -m loadtest --events 20000 --members 500
+    python -m loadtest --record eventi.jsonl --events 50000
+    python -m loadtest --replay eventi.jsonl --backend sqlite --json report.json
+
+Non serve nessuna connessione: guild, membri, canali e messaggi sono finti
+(`loadtest.fakes`) e le chiamate REST vengono solo contate.
+"""
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from .runner import Sandbox, format_report, run
+from .workload import World, generate, load_events, save_events
+from .fakes import FakeHTTP
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description='Replay offline di eventi Discord sui cogs')
+    parser.add_argument('--events', type=int, default=20000, help='Eventi da generare (ignorato con --replay)')
+    parser.add_argument('--guilds', type=int, default=1)
+    parser.add_argument('--members', type=int, default=500, help='Membri per guild')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=32, help='Eventi in volo contemporaneamente')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json', help='Backend XP dei livelli')
+    parser.add_argument('--http-latency-ms', type=float, default=0.0, help='Latenza simulata per ogni chiamata REST')
+    parser.add_argument('--voice-every', type=int, default=2000, help='Un tick voice_loop ogni N eventi (0 = mai)')
+    parser.add_argument('--record', metavar='FILE', help='Salva il flusso generato in JSONL ed esce')
+    parser.add_argument('--replay', metavar='FILE', help='Riproduce un flusso JSONL registrato')
+    parser.add_argument('--json', metavar='FILE', help='Scrive il report anche in JSON')
+    parser.add_argument('--keep', action='store_true', help='Non cancellare la sandbox su disco')
+    parser.add_argument('--verbose', action='store_true', help='Lascia attivi i log dei cogs su console')
+    args = parser.parse_args(argv)
+
+    if args.record:
+        world = World(FakeHTTP(), guilds=args.guilds, members=args.members, seed=args.seed)
+        n = save_events(args.record, generate(world, args.events, seed=args.seed, voice_every=args.voice_every))
+        print(f'{n} eventi salvati in {args.record}')
+        return 0
+
+    if args.replay:
+        events = load_events(args.replay)
+    else:
+        # Il mondo va costruito con gli stessi parametri anche dentro run()
+        world = World(FakeHTTP(), guilds=args.guilds, members=args.members, seed=args.seed)
+        events = list(generate(world, args.events, seed=args.seed, voice_every=args.voice_every))
+
+    with Sandbox(keep=args.keep) as sandbox:
+        report = asyncio.run(run(
+            events, guilds=args.guilds, members=args.members, seed=args.seed, backend=args.backend,
+            concurrency=args.concurrency, http_latency_ms=args.http_latency_ms, verbose=args.verbose,
+            sandbox=sandbox,
+        ))
+        if args.keep:
+            print(f'Sandbox: {sandbox.root}')
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Benchmark del matcher automod contro il vecchio ciclo `parola in testo`.
+
+    python -m loadtest.automod_bench [--terms 5000] [--messages 2000] [--seed S]
+
+Genera una lista di parole vietate sintetica (divisa in fasce di durata come
+moderation_words.json) e un flusso di messaggi di chat, in parte con parole
+vietate scritte in chiaro, flesse o attaccate ad altre parole (`parola+i`,
+`parola+dio`, ultima lettera ripetuta, prefissi) e in parte offuscate
+(leetspeak, separatori, caratteri cirillici). Misura la compilazione dell'automa, il costo per
+messaggio dei due metodi e controlla che ogni parola trovata dal vecchio
+ciclo venga trovata anche dal matcher.
+
+Controlla anche un insieme di falsi positivi che non devono mai scattare:
+numeri che in leetspeak formerebbero una parola vietata (come `8008` o `455`
+nel counting) e parole vietate spezzate a cavallo di due parole normali.
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+
+from cogs.automod_matcher import AutomodMatcher, normalize
+from cogs.config_snapshots import ModerationSnapshot
+
+BUCKETS = ('10m', '1h', '1d', '7d')
+
+CHAT = (
+    'ciao a tutti come va oggi', 'qualcuno gioca stasera a qualcosa', 'ho finito i compiti finalmente',
+    'che bel server questo', 'domani si esce? fatemi sapere', 'lol ahahah non ci credo',
+    'il nuovo aggiornamento è uscito, provatelo', 'buonanotte gente a domani',
+)
+
+LEET = {'a': '4', 'e': '3', 'i': '1', 'o': '0', 's': '$'}
+CYRILLIC = {'a': 'а', 'e': 'е', 'o': 'о', 'c': 'с', 'p': 'р'}
+# Lettere che hanno una cifra leet: le parole fatte solo di queste diventano numeri
+DIGITS = {'o': '0', 'i': '1', 'e': '3', 'a': '4', 's': '5', 'g': '6', 't': '7', 'b': '8'}
+
+
+def make_terms(rng: random.Random, count: int):
+    terms = set()
+    while len(terms) < count:
+        terms.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10))))
+    words = {b: [] for b in BUCKETS}
+    for term in sorted(terms):
+        words[rng.choice(BUCKETS)].append(term)
+    return words
+
+
+def variant(rng: random.Random, term: str) -> str:
+    """La parola dentro una parola più lunga, come nei messaggi veri."""
+    kind = rng.randrange(4)
+    if kind == 0:
+        return term + rng.choice(('i', 'e', 'a'))
+    if kind == 1:
+        return term + 'dio'
+    if kind == 2:
+        return term + term[-1] * rng.randint(2, 4)
+    return rng.choice(('super', 'stra', 'mega')) + term
+
+
+def obfuscate(rng: random.Random, term: str) -> str:
+    kind = rng.randrange(3)
+    if kind == 0:
+        return ''.join(LEET.get(ch, ch) for ch in term)
+    if kind == 1:
+        return rng.choice(('.', ' ', '-', '_')).join(term)
+    return ''.join(CYRILLIC.get(ch, ch) for ch in term)
+
+
+def make_digit_terms(rng: random.Random, count: int):
+    terms = set()
+    while len(terms) < count:
+        terms.add(''.join(rng.choice(tuple(DIGITS)) for _ in range(rng.randint(3, 6))))
+    return sorted(terms)
+
+
+def make_false_positives(rng: random.Random, terms, digit_terms, count: int):
+    """Messaggi innocui che un confronto senza confini di parola farebbe scattare."""
+    out = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.4:
+            # Numero del counting, da solo o con le cifre separate
+            digits = ''.join(DIGITS[ch] for ch in rng.choice(digit_terms))
+            out.append(digits if rng.random() < 0.5 else ' '.join(digits))
+        else:
+            # Parola vietata divisa tra la fine di una parola e l'inizio della successiva
+            term = rng.choice(terms)
+            cut = rng.randint(1, len(term) - 1)
+            head = rng.choice(('ciao', 'bello', 'mangia', 'uno')) + term[:cut]
+            tail = term[cut:] + rng.choice(('ndo', 'rio', 'tti', 'one'))
+            out.append(f'{rng.choice(CHAT)} {head} {tail}')
+    return out
+
+
+def make_messages(rng: random.Random, terms, count: int):
+    out = []
+    for _ in range(count):
+        text = rng.choice(CHAT)
+        roll = rng.random()
+        if roll < 0.05:
+            text += ' ' + rng.choice(terms).upper()
+        elif roll < 0.10:
+            text += ' ' + variant(rng, rng.choice(terms))
+        elif roll < 0.15:
+            text += ' ' + obfuscate(rng, rng.choice(terms))
+        out.append(text)
+    return out
+
+
+def old_first(rules, content_lower: str):
+    for needle, word, duration, delta in rules:
+        if needle in content_lower:
+            return word
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.automod_bench',
+                                     description='Benchmark del matcher delle parole vietate')
+    parser.add_argument('--terms', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--false-positives', type=int, default=1000, help='Messaggi innocui da controllare')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    words = make_terms(rng, args.terms)
+    all_terms = [t for b in BUCKETS for t in words[b]]
+    digit_terms = make_digit_terms(rng, 50)
+    words[BUCKETS[0]].extend(digit_terms)
+    messages = make_messages(rng, all_terms, args.messages)
+    innocent = make_false_positives(rng, all_terms, digit_terms, args.false_positives)
+
+    t0 = time.perf_counter()
+    snap = ModerationSnapshot.from_config({}, words)
+    build_ms = (time.perf_counter() - t0) * 1000
+    matcher = snap.matcher
+    print(f'parole: {len(matcher)} • stati automa: {matcher.states} • compilazione snapshot: {build_ms:.1f} ms')
+
+    t0 = time.perf_counter()
+    old_hits = [old_first(snap.word_rules, m.lower()) for m in messages]
+    old_us = (time.perf_counter() - t0) / len(messages) * 1e6
+
+    t0 = time.perf_counter()
+    new_hits = [matcher.first(m) for m in messages]
+    new_us = (time.perf_counter() - t0) / len(messages) * 1e6
+
+    t0 = time.perf_counter()
+    for m in messages:
+        normalize(m)
+    norm_us = (time.perf_counter() - t0) / len(messages) * 1e6
+
+    missed = sum(1 for old, new in zip(old_hits, new_hits) if old is not None and new is None)
+    differs = sum(1 for old, new in zip(old_hits, new_hits)
+                  if old is not None and new is not None and old != new.term)
+    print(f'{"µs/msg":<22}{"medio":>10}')
+    print(f'{"ciclo parola in testo":<22}{old_us:10.1f}')
+    print(f'{"matcher (totale)":<22}{new_us:10.1f}')
+    print(f'{"  di cui normalize":<22}{norm_us:10.1f}')
+    print(f'trovati: vecchio {sum(h is not None for h in old_hits)} • matcher {sum(h is not None for h in new_hits)} '
+          f'• persi dal matcher {missed} • regola diversa {differs}')
+    for m, old, new in zip(messages, old_hits, new_hits):
+        if old is not None and new is None:
+            print(f'  perso: {m!r} (vecchio ciclo: {old})')
+
+    # Un messaggio che contiene già una parola vietata per caso non è innocuo
+    generated = len(innocent)
+    innocent = [m for m in innocent if old_first(snap.word_rules, m.lower()) is None]
+    false_hits = [(m, matcher.first(m)) for m in innocent]
+    false_hits = [(m, hit) for m, hit in false_hits if hit is not None]
+    print(f'falsi positivi: matcher {len(false_hits)}/{len(innocent)} '
+          f'(scartati {generated - len(innocent)} con una parola vietata in chiaro)')
+    for m, hit in false_hits[:10]:
+        print(f'  {m!r} → {hit.term}')
+    return 1 if missed or false_hits else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
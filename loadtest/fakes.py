@@ -0,0 +1,462 @@
+"""Oggetti Discord finti per il replay offline.
+
+`FakeMember` e `FakeTextChannel` ereditano dalle classi di discord.py, così i
+controlli `isinstance` dei cogs e le property derivate (roles, top_role,
+guild_permissions, mention, is_timed_out...) funzionano come in produzione.
+Tutte le chiamate che in produzione andrebbero in REST passano da `FakeHTTP`,
+che le conta per route e può simulare una latenza.
+"""
+
+import asyncio
+import itertools
+from collections import Counter, OrderedDict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import discord
+from discord.ext import commands
+
+_ids = itertools.count(1_100_000_000_000_000_000)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+def _not_found(what: str) -> discord.NotFound:
+    return discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), {'message': f'Unknown {what}', 'code': 10000})
+
+
+class FakeHTTP:
+    """Registra le chiamate REST che i cogs farebbero."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def request(self, method: str, route: str):
+        self.calls[f'{method} {route}'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+
+class FakeAsset:
+    __slots__ = ('url',)
+
+    def __init__(self, url: str):
+        self.url = url
+
+    async def read(self) -> bytes:
+        return b''
+
+    def __str__(self):
+        return self.url
+
+
+class FakeRole:
+    def __init__(self, guild: 'FakeGuild', role_id: int, name: str, position: int, permissions: Optional[discord.Permissions] = None):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self.position = position
+        self.permissions = permissions or discord.Permissions.none()
+
+    @property
+    def mention(self) -> str:
+        return f'<@&{self.id}>'
+
+    def is_default(self) -> bool:
+        return self.id == self.guild.id
+
+    def __lt__(self, other):
+        return (self.position, self.id) < (other.position, other.id)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class _UserData:
+    """Sostituisce `Member._user`: le property di Member leggono da qui."""
+
+    def __init__(self, user_id: int, name: str, bot: bool):
+        self.id = user_id
+        self.name = name
+        self.discriminator = '0'
+        self.global_name = None
+        self.bot = bot
+        self.system = False
+        self.avatar = None
+        self.default_avatar = FakeAsset(f'https://cdn.discordapp.com/embed/avatars/{user_id % 6}.png')
+
+    @property
+    def display_avatar(self):
+        return self.default_avatar
+
+
+class FakeMember(discord.Member):
+    def __init__(self, http: FakeHTTP, guild: 'FakeGuild', user_id: int, name: str, role_ids=(), bot: bool = False):
+        self._http = http
+        self._user = _UserData(user_id, name, bot)
+        self._state = None
+        self.guild = guild
+        self._roles = discord.utils.SnowflakeList(list(role_ids))
+        self.nick = None
+        self.joined_at = discord.utils.utcnow()
+        self.premium_since = None
+        self.timed_out_until = None
+        self.pending = False
+        self.activities = ()
+        self.client_status = None
+        self._permissions = None
+        self._avatar = None
+        self._banner = None
+        self._flags = 0
+        self._avatar_decoration_data = None
+
+    def clone(self) -> 'FakeMember':
+        """Copia superficiale, per gli eventi before/after."""
+        m = FakeMember(self._http, self.guild, self.id, self.name, list(self._roles), self.bot)
+        m.nick = self.nick
+        m.timed_out_until = self.timed_out_until
+        m.premium_since = self.premium_since
+        return m
+
+    def __repr__(self):
+        return f'<FakeMember id={self.id} name={self.name!r}>'
+
+    async def send(self, content=None, **kwargs):
+        await self._http.request('POST', '/users/@me/channels')
+        await self._http.request('POST', '/channels/{dm_id}/messages')
+
+    async def edit(self, **fields):
+        await self._http.request('PATCH', '/guilds/{guild_id}/members/{user_id}')
+        if 'nick' in fields:
+            self.nick = fields['nick']
+        if 'timed_out_until' in fields:
+            self.timed_out_until = fields['timed_out_until']
+
+    async def add_roles(self, *roles, reason=None, atomic=True):
+        for role in roles:
+            await self._http.request('PUT', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}')
+            if role.id not in self._roles:
+                self._roles.add(role.id)
+
+    async def remove_roles(self, *roles, reason=None, atomic=True):
+        for role in roles:
+            await self._http.request('DELETE', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}')
+            self._roles.remove(role.id)
+
+
+class FakeVoiceState:
+    def __init__(self, channel, self_mute=False, mute=False, self_deaf=False, deaf=False):
+        self.channel = channel
+        self.self_mute = self_mute
+        self.mute = mute
+        self.self_deaf = self_deaf
+        self.deaf = deaf
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild: 'FakeGuild', channel_id: int, name: str):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.members: List[FakeMember] = []
+
+    @property
+    def mention(self) -> str:
+        return f'<#{self.id}>'
+
+
+class FakeTextChannel(discord.TextChannel):
+    # Quanti messaggi inviati dal bot restano recuperabili con fetch_message
+    HISTORY = 200
+
+    def __init__(self, http: FakeHTTP, guild: 'FakeGuild', channel_id: int, name: str):
+        self._http = http
+        self._state = None
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category_id = None
+        self.topic = None
+        self.position = 0
+        self.nsfw = False
+        self.slowmode_delay = 0
+        self._overwrites = []
+        self._type = discord.ChannelType.text.value
+        self.last_message_id = None
+        self._history: 'OrderedDict[int, FakeMessage]' = OrderedDict()
+
+    def __repr__(self):
+        return f'<FakeTextChannel id={self.id} name={self.name!r}>'
+
+    def remember(self, message: 'FakeMessage'):
+        self._history[message.id] = message
+        while len(self._history) > self.HISTORY:
+            self._history.popitem(last=False)
+
+    async def send(self, content=None, *, embed=None, embeds=None, file=None, files=None, view=None, **kwargs):
+        await self._http.request('POST', '/channels/{channel_id}/messages')
+        msg = FakeMessage(self._http, self.guild, self, self.guild.me, content or '')
+        if embed is not None:
+            msg.embeds = [embed]
+        self.remember(msg)
+        return msg
+
+    async def fetch_message(self, message_id: int):
+        await self._http.request('GET', '/channels/{channel_id}/messages/{message_id}')
+        msg = self._history.get(message_id)
+        if msg is None:
+            raise _not_found('Message')
+        return msg
+
+
+class FakeMessage:
+    def __init__(self, http: FakeHTTP, guild: Optional['FakeGuild'], channel, author, content: str, message_id: Optional[int] = None):
+        self._http = http
+        self.id = message_id or next_id()
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds: List[discord.Embed] = []
+        self.attachments = []
+        self.mentions = []
+        self.created_at = discord.utils.utcnow()
+
+    @property
+    def jump_url(self) -> str:
+        return f'https://discord.com/channels/{self.guild.id if self.guild else "@me"}/{self.channel.id}/{self.id}'
+
+    async def delete(self, *, delay=None):
+        await self._http.request('DELETE', '/channels/{channel_id}/messages/{message_id}')
+
+    async def add_reaction(self, emoji):
+        await self._http.request('PUT', '/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me')
+
+    async def edit(self, **fields):
+        await self._http.request('PATCH', '/channels/{channel_id}/messages/{message_id}')
+        if 'embed' in fields and fields['embed'] is not None:
+            self.embeds = [fields['embed']]
+        if 'content' in fields:
+            self.content = fields['content'] or ''
+        return self
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeGuild:
+    def __init__(self, http: FakeHTTP, guild_id: int, name: str):
+        self._http = http
+        self.id = guild_id
+        self.name = name
+        self.icon = None
+        self.owner_id = 0
+        self.default_role = FakeRole(self, guild_id, '@everyone', 0)
+        self._roles: Dict[int, FakeRole] = {guild_id: self.default_role}
+        self._members: Dict[int, FakeMember] = {}
+        self._channels: Dict[int, object] = {}
+        self._voice_states: Dict[int, FakeVoiceState] = {}
+        self.me: Optional[FakeMember] = None
+
+    def __repr__(self):
+        return f'<FakeGuild id={self.id} name={self.name!r}>'
+
+    # --- costruzione ---
+    def add_role(self, name: str, position: int, permissions: Optional[discord.Permissions] = None) -> FakeRole:
+        role = FakeRole(self, next_id(), name, position, permissions)
+        self._roles[role.id] = role
+        return role
+
+    def add_member(self, name: str, role_ids=(), bot: bool = False) -> FakeMember:
+        member = FakeMember(self._http, self, next_id(), name, role_ids, bot)
+        self._members[member.id] = member
+        return member
+
+    def add_text_channel(self, name: str) -> FakeTextChannel:
+        ch = FakeTextChannel(self._http, self, next_id(), name)
+        self._channels[ch.id] = ch
+        return ch
+
+    def add_voice_channel(self, name: str) -> FakeVoiceChannel:
+        ch = FakeVoiceChannel(self, next_id(), name)
+        self._channels[ch.id] = ch
+        return ch
+
+    def join_voice(self, member: FakeMember, channel: FakeVoiceChannel, **flags):
+        self.leave_voice(member)
+        channel.members.append(member)
+        self._voice_states[member.id] = FakeVoiceState(channel, **flags)
+
+    def leave_voice(self, member: FakeMember):
+        state = self._voice_states.pop(member.id, None)
+        if state is not None:
+            try:
+                state.channel.members.remove(member)
+            except ValueError:
+                pass
+
+    # --- API usata dai cogs ---
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    @property
+    def member_count(self) -> int:
+        return len(self._members)
+
+    @property
+    def roles(self) -> List[FakeRole]:
+        return sorted(self._roles.values())
+
+    @property
+    def owner(self) -> Optional[FakeMember]:
+        return self._members.get(self.owner_id)
+
+    @property
+    def text_channels(self) -> List[FakeTextChannel]:
+        return [c for c in self._channels.values() if isinstance(c, FakeTextChannel)]
+
+    @property
+    def voice_channels(self) -> List[FakeVoiceChannel]:
+        return [c for c in self._channels.values() if isinstance(c, FakeVoiceChannel)]
+
+    @property
+    def channels(self):
+        return list(self._channels.values())
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self._members.get(user_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+    def get_channel(self, channel_id: int):
+        return self._channels.get(channel_id)
+
+    def get_emoji(self, emoji_id):
+        return None
+
+    def _voice_state_for(self, user_id: int) -> Optional[FakeVoiceState]:
+        return self._voice_states.get(user_id)
+
+    async def fetch_channel(self, channel_id: int):
+        await self._http.request('GET', '/channels/{channel_id}')
+        ch = self._channels.get(channel_id)
+        if ch is None:
+            raise _not_found('Channel')
+        return ch
+
+    async def fetch_member(self, user_id: int):
+        await self._http.request('GET', '/guilds/{guild_id}/members/{user_id}')
+        m = self._members.get(user_id)
+        if m is None:
+            raise _not_found('Member')
+        return m
+
+    async def audit_logs(self, *, action=None, limit=100, **kwargs):
+        await self._http.request('GET', '/guilds/{guild_id}/audit-logs')
+        return
+        yield  # generatore asincrono vuoto
+
+
+class FakeInteractionResponse:
+    def __init__(self, http: FakeHTTP):
+        self._http = http
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        await self._http.request('POST', '/interactions/{interaction_id}/{token}/callback')
+        self._done = True
+
+    async def defer(self, **kwargs):
+        await self._http.request('POST', '/interactions/{interaction_id}/{token}/callback')
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        await self._http.request('POST', '/interactions/{interaction_id}/{token}/callback')
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, http: FakeHTTP):
+        self._http = http
+
+    async def send(self, content=None, **kwargs):
+        await self._http.request('POST', '/webhooks/{application_id}/{token}')
+
+
+class FakeInteraction:
+    def __init__(self, http: FakeHTTP, client, guild: FakeGuild, channel, user: FakeMember):
+        self.id = next_id()
+        self.client = client
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.user = user
+        self.response = FakeInteractionResponse(http)
+        self.followup = FakeFollowup(http)
+
+
+class ReplayBot(commands.Bot):
+    """Bot reale di discord.py, mai connesso: guild e canali arrivano dal mondo finto."""
+
+    def __init__(self, http: FakeHTTP):
+        super().__init__(command_prefix='!', intents=discord.Intents.all(), help_command=None)
+        self.fake_http = http
+        self._fake_guilds: Dict[int, FakeGuild] = {}
+        self._fake_user = _UserData(next_id(), 'ReplayBot', True)
+
+    def add_fake_guild(self, guild: FakeGuild):
+        self._fake_guilds[guild.id] = guild
+
+    @property
+    def guilds(self):
+        return list(self._fake_guilds.values())
+
+    @property
+    def user(self):
+        return self._fake_user
+
+    @property
+    def latency(self) -> float:
+        return 0.0
+
+    def is_ready(self) -> bool:
+        return True
+
+    async def wait_until_ready(self):
+        return None
+
+    def get_guild(self, guild_id: int):
+        return self._fake_guilds.get(guild_id)
+
+    def get_channel(self, channel_id: int):
+        for g in self._fake_guilds.values():
+            ch = g.get_channel(channel_id)
+            if ch is not None:
+                return ch
+        return None
+
+    async def fetch_channel(self, channel_id: int):
+        await self.fake_http.request('GET', '/channels/{channel_id}')
+        ch = self.get_channel(channel_id)
+        if ch is None:
+            raise _not_found('Channel')
+        return ch
+
+    async def application_info(self):
+        raise _not_found('Application')
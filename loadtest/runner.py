@@ -0,0 +1,333 @@
+"""Esecuzione del replay: sandbox su disco, caricamento dei cogs reali, report.
+
+I cogs scrivono su percorsi relativi al proprio file o alla working directory,
+quindi il runner copia `cogs/` e `bot_utils.py` in una cartella temporanea, ci
+si sposta dentro e importa i cogs da lì: i dati del bot vero non vengono mai
+toccati.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import discord
+
+from .fakes import FakeHTTP, FakeInteraction, FakeMessage, ReplayBot
+from .workload import BAD_WORDS, World
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cogs caricati per il replay (quelli con listener sul percorso caldo)
+EXTENSIONS = ('moderation', 'counting', 'levels', 'login', 'logs', 'giveaway')
+
+
+def _proc_io() -> Dict[str, int]:
+    """Contatori I/O del processo (Linux); vuoto se /proc non è disponibile."""
+    out = {}
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                out[key.strip()] = int(value)
+    except Exception:
+        pass
+    return out
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class Sandbox:
+    """Copia del codice dei cogs in una cartella temporanea usata come working directory."""
+
+    def __init__(self, keep: bool = False):
+        self.keep = keep
+        self.root = tempfile.mkdtemp(prefix='alice-loadtest-')
+        # levels.py salva in ../../data rispetto a cogs/: resta dentro root
+        self.workdir = os.path.join(self.root, 'bot')
+        self._old_cwd = None
+
+    def __enter__(self):
+        ignore = shutil.ignore_patterns('__pycache__', '*.json', '*.db', '*.db-*')
+        shutil.copytree(os.path.join(REPO_ROOT, 'cogs'), os.path.join(self.workdir, 'cogs'), ignore=ignore)
+        shutil.copy2(os.path.join(REPO_ROOT, 'bot_utils.py'), self.workdir)
+        assets = os.path.join(REPO_ROOT, 'assets')
+        if os.path.isdir(assets):
+            shutil.copytree(assets, os.path.join(self.workdir, 'assets'))
+        self._old_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        sys.path.insert(0, self.workdir)
+        return self
+
+    def write_json(self, relpath: str, data):
+        path = os.path.join(self.workdir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def __exit__(self, *exc):
+        if self._old_cwd:
+            os.chdir(self._old_cwd)
+        try:
+            sys.path.remove(self.workdir)
+        except ValueError:
+            pass
+        if not self.keep:
+            shutil.rmtree(self.root, ignore_errors=True)
+        return False
+
+
+def seed_files(sandbox: Sandbox, world: World, backend: str):
+    """Configurazioni minime perché ogni cog percorra il suo ramo reale."""
+    ch0 = world.channels[0]
+    staff_ids = [str(r['staff'].id) for r in world.roles]
+    sandbox.write_json('config.json', {
+        'moderation': {'staff_role_id': staff_ids[0], 'no_automod': staff_ids[1:]},
+    })
+    sandbox.write_json('cogs/moderation.json', {
+        '1h': BAD_WORDS,
+        'dm_messages': {
+            'mute': {'title': 'Mute', 'description': '{mention} mutato per {duration}: {reason}'},
+            'word_warning': {'title': 'Avviso', 'description': 'Parola vietata: {word}'},
+        },
+    })
+    sandbox.write_json('cogs/log.json', {
+        'message_log_channel_id': ch0['logs'].id,
+        'moderation_log_channel_id': ch0['logs'].id,
+        'message_delete_message': {'title': 'Messaggio eliminato', 'description': '{mention} in {channel}', 'author_header': True},
+        'nick_message': {'title': 'Nickname', 'description': '{mention}: {new_nick}'},
+        'role_change_message': {'title': 'Ruoli', 'description': '{mention}'},
+        'mute_message': {'title': 'Mute', 'description': '{mention} ({duration})'},
+        'unmute_message': {'title': 'Unmute', 'description': '{mention}'},
+    })
+    counting = {}
+    for g, chans in zip(world.guilds, world.channels):
+        counting[str(g.id)] = {'channels': {str(chans['counting'].id): {
+            'last': 0, 'last_user': None, 'recovery': True, 'allow_chat': True}}}
+    sandbox.write_json('counting.json', counting)
+    sandbox.write_json('counting_config.json', {'timeout_minutes': 1, 'success_emoji': '✅', 'error_emoji': '❌', 'special_numbers': {}})
+    roles0 = world.roles[0]
+    sandbox.write_json('cogs/levels.json', {
+        'enabled': True,
+        'text_xp': {'min': 5, 'max': 15, 'cooldown_seconds': 60, 'excluded_channel_ids': [],
+                    'excluded_role_ids': [str(roles0['no_xp'].id)], 'multiplier_roles': {str(roles0['vip'].id): 1.5}},
+        'voice_xp': {'enabled': True, 'per_min_min': 2, 'per_min_max': 5, 'exclude_muted': True, 'exclude_deaf': True,
+                     'exclude_afk_channel_ids': [], 'excluded_role_ids': [], 'multiplier_roles': {}},
+        'announce_channel_id': str(ch0['levelup'].id),
+        'leaderboard': {'page_size': 10},
+        'storage': {'backend': backend, 'sqlite_path': 'levels.db'},
+        'rank_card': {'width': 934, 'height': 282, 'background': 'assets/rankcard/rank_black.png', 'bar_color': '#14ff72',
+                      'bar_bg': '#1f1f1f', 'text_color': '#ffffff', 'font_path': 'assets/rankcard/Roboto-Bold.ttf'},
+    })
+
+
+class Replayer:
+    def __init__(self, bot: ReplayBot, world: World, http: FakeHTTP):
+        self.bot = bot
+        self.world = world
+        self.http = http
+        self.giveaway_views = {}
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def setup_giveaways(self):
+        from cogs.giveaway import GiveawayView
+        cog = self.bot.get_cog('GiveawayCog')
+        if cog is None:
+            return
+        for gi, g in enumerate(self.world.guilds):
+            ch = self.world.channels[gi]['giveaway']
+            msg = await ch.send('giveaway')
+            cog.save_giveaway(msg.id, {
+                'message_id': msg.id, 'channel_id': ch.id, 'guild_id': g.id, 'host': g.owner_id,
+                'prize': 'Nitro', 'status': 'active', 'entrants': [], 'winners_count': 1,
+                'expire_epoch': int(time.time()) + 86400,
+            })
+            msg.embeds = [cog._build_embed(g, cog.load_giveaway(msg.id))]
+            self.giveaway_views[gi] = GiveawayView(cog, message_id=msg.id)
+
+    async def _listeners(self, event: str, *args):
+        handlers = self.bot.extra_events.get(f'on_{event}', [])
+        results = await asyncio.gather(*(h(*args) for h in handlers), return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception):
+                self.errors[event] += 1
+
+    async def dispatch(self, ev: dict):
+        kind = ev['t']
+        if kind == 'voice_tick':
+            levels = self.bot.get_cog('LevelsCog')
+            if levels is not None:
+                await levels.voice_loop.coro(levels)
+            return
+        gi = ev['g']
+        g = self.world.guilds[gi]
+        member = self.world.members[gi][ev['u']]
+        if kind in ('message', 'message_delete'):
+            ch = self.world.channels[gi][ev['c']]
+            msg = FakeMessage(self.http, g, ch, member, ev.get('text', ''))
+            await self._listeners(kind, msg)
+        elif kind == 'member_update':
+            before = member.clone()
+            change = ev.get('change')
+            if change == 'nick':
+                member.nick = None if member.nick else f'{member.name}-nick'
+            elif change == 'roles':
+                vip = self.world.roles[gi]['vip'].id
+                if vip in member._roles:
+                    member._roles.remove(vip)
+                else:
+                    member._roles.add(vip)
+            elif change == 'timeout':
+                member.timed_out_until = None if member.is_timed_out() else discord.utils.utcnow() + datetime.timedelta(minutes=5)
+            await self._listeners('member_update', before, member)
+        elif kind == 'giveaway_click':
+            view = self.giveaway_views.get(gi)
+            if view is None:
+                return
+            inter = FakeInteraction(self.http, self.bot, g, self.world.channels[gi]['giveaway'], member)
+            try:
+                await view.join_leave.callback(inter)
+            except Exception:
+                self.errors[kind] += 1
+
+
+async def run(events, *, guilds: int, members: int, seed: int, backend: str = 'json', concurrency: int = 32,
+              http_latency_ms: float = 0.0, verbose: bool = False, sandbox: Sandbox) -> dict:
+    http = FakeHTTP(http_latency_ms / 1000.0)
+    world = World(http, guilds=guilds, members=members, seed=seed)
+    seed_files(sandbox, world, backend)
+
+    bot = ReplayBot(http)
+    for g in world.guilds:
+        bot.add_fake_guild(g)
+    load_ms = {}
+    for ext in EXTENSIONS:
+        t0 = time.perf_counter()
+        await bot.load_extension(f'cogs.{ext}')
+        load_ms[ext] = (time.perf_counter() - t0) * 1000
+    if not verbose:
+        # I log su console costano e coprono il report: restano quelli su file
+        from cogs.console_logger import console_handler
+        if console_handler is not None:
+            console_handler.setLevel(logging.ERROR)
+
+    from cogs.json_store import store
+    replayer = Replayer(bot, world, http)
+    await replayer.setup_giveaways()
+    await store.flush()
+
+    events = list(events)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    sem = asyncio.Semaphore(max(1, concurrency))
+    http_before = http.total
+    io_before = _proc_io()
+    store_before = store.stats()
+
+    async def one(ev):
+        async with sem:
+            t0 = time.perf_counter()
+            await replayer.dispatch(ev)
+            latencies[ev['t']].append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(ev) for ev in events))
+    wall = time.perf_counter() - start
+
+    # Flush finale del write-behind (fa parte del costo su disco)
+    t0 = time.perf_counter()
+    await store.flush()
+    flush_ms = (time.perf_counter() - t0) * 1000
+    pipeline = bot.message_pipeline.describe() if getattr(bot, 'message_pipeline', None) else {}
+    for ext in reversed(EXTENSIONS):
+        try:
+            await bot.unload_extension(f'cogs.{ext}')
+        except Exception:
+            pass
+    io_after = _proc_io()
+    store_after = store.stats()
+
+    all_lat = sorted(x for values in latencies.values() for x in values)
+    by_type = {}
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        by_type[kind] = {
+            'count': len(values),
+            'p50_ms': round(_percentile(values, 50) * 1000, 3),
+            'p99_ms': round(_percentile(values, 99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3),
+            'errors': replayer.errors.get(kind, 0),
+        }
+    return {
+        'events': len(events),
+        'wall_s': round(wall, 3),
+        'events_per_s': round(len(events) / wall, 1) if wall else 0.0,
+        'p50_ms': round(_percentile(all_lat, 50) * 1000, 3),
+        'p99_ms': round(_percentile(all_lat, 99) * 1000, 3),
+        'by_type': by_type,
+        'listener_errors': dict(replayer.errors),
+        'pipeline': pipeline,
+        'rest_calls': http.total - http_before,
+        'rest_by_route': dict(http.calls.most_common()),
+        'disk': {
+            'store_bytes_written': store_after['bytes_written'] - store_before['bytes_written'],
+            'store_files_written': store_after['files_written'] - store_before['files_written'],
+            'proc_wchar': io_after.get('wchar', 0) - io_before.get('wchar', 0),
+            'proc_write_bytes': io_after.get('write_bytes', 0) - io_before.get('write_bytes', 0),
+            'sandbox_size': _dir_size(sandbox.root),
+        },
+        'final_flush_ms': round(flush_ms, 2),
+        'cog_load_ms': {k: round(v, 1) for k, v in load_ms.items()},
+        'backend': backend,
+        'concurrency': concurrency,
+        'http_latency_ms': http_latency_ms,
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Eventi: {report['events']} in {report['wall_s']} s → {report['events_per_s']} eventi/s "
+        f"(concorrenza {report['concurrency']}, backend {report['backend']}, latenza REST {report['http_latency_ms']} ms)",
+        f"Latenza handler: p50 {report['p50_ms']} ms • p99 {report['p99_ms']} ms",
+        '',
+        f"{'tipo':<16}{'n':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errori':>8}",
+    ]
+    for kind, s in report['by_type'].items():
+        lines.append(f"{kind:<16}{s['count']:>8}{s['p50_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}{s['errors']:>8}")
+    stages = report.get('pipeline', {}).get('stages', {})
+    if stages:
+        lines += ['', f"{'stadio pipeline':<16}{'chiamate':>10}{'stop':>8}{'errori':>8}{'media ms':>10}{'max ms':>10}"]
+        for name, st in stages.items():
+            lines.append(f"{name:<16}{st['calls']:>10}{st['stops']:>8}{st['errors']:>8}{st['avg_ms']:>10}{st['max_ms']:>10}")
+    d = report['disk']
+    lines += [
+        '',
+        f"Disco: store {d['store_bytes_written']} byte in {d['store_files_written']} file • "
+        f"wchar {d['proc_wchar']} • write_bytes {d['proc_write_bytes']} • sandbox {d['sandbox_size']} byte",
+        f"Flush finale: {report['final_flush_ms']} ms",
+        f"Chiamate REST simulate: {report['rest_calls']}",
+    ]
+    for route, n in list(report['rest_by_route'].items())[:10]:
+        lines.append(f"   {n:>8}  {route}")
+    return '\n'.join(lines)
@@ -0,0 +1,189 @@
+"""Fuzz e micro-benchmark del valutatore aritmetico del counting.
+
+    python -m loadtest.safe_eval_bench [--fuzz N] [--seed S] [--budget-ms MS]
+
+Il fuzz genera espressioni casuali (valide, enormi, annidate, testo misto)
+e controlla che ogni chiamata termini entro `--budget-ms` e che, quando il
+valutatore accetta un'espressione piccola, il risultato coincida con
+`int(eval(...))`. Le misure si fanno con il GC disattivato; un input oltre il
+budget viene rivalutato (senza cache) `RETIME_RUNS` volte e conta come lento
+solo se lo è la mediana, così una pausa del sistema non basta a fallire.
+
+Il benchmark misura il costo per messaggio su chat normale, numeri,
+espressioni e input ostili, a cache fredda e calda.
+"""
+
+import argparse
+import gc
+import random
+import statistics
+import sys
+import time
+
+from cogs import safe_eval
+from cogs.safe_eval import evaluate
+
+OPS = ('+', '-', '*', '/', '//', '%', '**')
+RETIME_RUNS = 7
+
+HOSTILE = [
+    '9**9**9', '9**9**9**9', '(9**9)**(9**9)', '2**100000', '10**10**10', '-(9**99999)',
+    '(' * 150 + '1' + ')' * 40, '1' * 199 + '+1', '1+' * 99 + '1', '9' * 150 + '**2',
+    '((((((((((2**64)**64)**64)**64))))))', '1/0', '5%0', '0**-1', '2**0.5', '1e999',
+    '__import__("os").system("x")', '[1]*10**9', '"a"*10**9', '().__class__',
+]
+
+CHAT = [
+    'ciao a tutti', 'qualcuno gioca stasera?', 'lol', 'ahahah 😂', 'ok', 'https://example.com/a?b=1',
+    'gg', '<@123456789012345678> guarda qui', 'ho fatto 100 punti', 'chi c\'è?',
+]
+
+
+def random_expr(rng: random.Random, depth: int = 0) -> str:
+    if depth > 3 or rng.random() < 0.35:
+        n = rng.choice((rng.randint(0, 20), rng.randint(0, 10 ** rng.randint(1, 12))))
+        return str(n) if rng.random() < 0.9 else f'{n}.{rng.randint(0, 99)}'
+    left = random_expr(rng, depth + 1)
+    right = random_expr(rng, depth + 1)
+    expr = f'{left} {rng.choice(OPS)} {right}'
+    if rng.random() < 0.3:
+        expr = f'({expr})'
+    if rng.random() < 0.1:
+        expr = '-' + expr
+    return expr
+
+
+def mutate(rng: random.Random, text: str) -> str:
+    chars = list(text)
+    for _ in range(rng.randint(1, 4)):
+        pos = rng.randint(0, len(chars))
+        chars.insert(pos, rng.choice('0123456789+-*/%()*. ea_'))
+    return ''.join(chars)
+
+
+def reference(text: str):
+    """Risultato del vecchio eval, solo per espressioni già accettate (e quindi piccole)."""
+    try:
+        return int(eval(text, {'__builtins__': None}, {}))
+    except Exception:
+        return None
+
+
+def retime(text: str, runs: int = RETIME_RUNS) -> float:
+    """Mediana in ms di `runs` valutazioni senza cache."""
+    uncached = evaluate.__wrapped__
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        uncached(text)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def fuzz(count: int, seed: int, budget_ms: float) -> int:
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _fuzz(count, seed, budget_ms)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _fuzz(count: int, seed: int, budget_ms: float) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    accepted = 0
+    slowest = (0.0, '')
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.6:
+            text = random_expr(rng)
+        elif kind < 0.8:
+            text = mutate(rng, random_expr(rng))
+        elif kind < 0.9:
+            text = rng.choice(HOSTILE)
+        else:
+            text = mutate(rng, rng.choice(CHAT))
+        start = time.perf_counter()
+        try:
+            result = evaluate(text)
+        except Exception as e:
+            print(f'ECCEZIONE {type(e).__name__}: {text!r}')
+            failures += 1
+            continue
+        elapsed = (time.perf_counter() - start) * 1000
+        if elapsed > budget_ms:
+            # Una sola misura alta può essere rumore: decide la mediana
+            elapsed = retime(text)
+            if elapsed > budget_ms:
+                print(f'LENTO {elapsed:.2f} ms (mediana di {RETIME_RUNS}): {text!r}')
+                failures += 1
+        if elapsed > slowest[0]:
+            slowest = (elapsed, text)
+        if result is None:
+            continue
+        accepted += 1
+        expected = reference(text)
+        # Con "/" il vecchio eval passava dai float: confronta solo dove è esatto
+        if expected != result and '/' not in text and '.' not in text:
+            print(f'DIVERSO {text!r}: {result} invece di {expected}')
+            failures += 1
+    print(f'fuzz: {count} input, {accepted} accettati, {failures} problemi, '
+          f'più lento {slowest[0]:.3f} ms ({slowest[1][:40]!r})')
+    return failures
+
+
+def bench_case(name: str, texts, rounds: int, compare: bool = True):
+    evaluate.cache_clear()
+    start = time.perf_counter()
+    for t in texts:
+        evaluate(t)
+    cold = (time.perf_counter() - start) / len(texts) * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t in texts:
+            evaluate(t)
+    warm = (time.perf_counter() - start) / (len(texts) * rounds) * 1e6
+    # Il vecchio percorso, solo sugli input che non lo bloccherebbero
+    safe = [t for t in texts if evaluate(t) is not None or not safe_eval.looks_like_math(t.strip())]
+    old = None
+    if compare and safe:
+        start = time.perf_counter()
+        for t in safe:
+            try:
+                int(eval(t, {'__builtins__': None}, {}))
+            except Exception:
+                pass
+        old = (time.perf_counter() - start) / len(safe) * 1e6
+    old_text = f'{old:10.2f}' if old is not None else '         -'
+    print(f'{name:<12}{cold:10.2f}{warm:10.2f}{old_text}')
+
+
+def bench(rounds: int, seed: int):
+    rng = random.Random(seed)
+    exprs = list({random_expr(rng) for _ in range(500)})
+    print(f'{"µs/msg":<12}{"fredda":>10}{"calda":>10}{"eval":>10}')
+    bench_case('chat', [mutate(rng, rng.choice(CHAT)) for _ in range(500)], rounds)
+    bench_case('espressioni', exprs, rounds)
+    bench_case('ostili', HOSTILE, rounds, compare=False)
+    print(f'cache: {safe_eval.cache_info()}')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.safe_eval_bench',
+                                     description='Fuzz e benchmark del valutatore del counting')
+    parser.add_argument('--fuzz', type=int, default=20000, help='Input casuali da provare')
+    parser.add_argument('--rounds', type=int, default=20, help='Ripetizioni a cache calda')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--budget-ms', type=float, default=5.0, help='Tempo massimo per valutazione (mediana se superato)')
+    args = parser.parse_args(argv)
+
+    failures = fuzz(args.fuzz, args.seed, args.budget_ms)
+    print()
+    bench(args.rounds, args.seed)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Mondo finto e flussi di eventi (generati o registrati su file JSONL).
+
+Gli eventi sono dict serializzabili che fanno riferimento a guild, canali e
+membri per indice, così un flusso registrato si può riprodurre su un mondo
+costruito con gli stessi parametri:
+
+    {"t": "message", "g": 0, "c": "general-1", "u": 42, "text": "ciao"}
+    {"t": "message_delete", "g": 0, "c": "general-0", "u": 7, "text": "..."}
+    {"t": "member_update", "g": 0, "u": 13, "change": "nick" | "roles" | "timeout"}
+    {"t": "giveaway_click", "g": 0, "u": 99}
+    {"t": "voice_tick"}
+"""
+
+import json
+import random
+from typing import Dict, Iterator, List
+
+import discord
+
+from .fakes import FakeGuild, FakeHTTP, FakeMember, next_id
+
+BAD_WORDS = ['parolaccia', 'insulto', 'spamword']
+WORDS = (
+    'ciao come va oggi partita bedwars server evento giveaway livello ruolo '
+    'chi gioca stasera grande bravo grazie vero dai andiamo nuovo video live'
+).split()
+
+# Peso relativo dei tipi di evento
+DEFAULT_MIX = {
+    'message': 80,
+    'counting': 6,
+    'message_delete': 4,
+    'member_update': 4,
+    'giveaway_click': 6,
+}
+
+
+class World:
+    def __init__(self, http: FakeHTTP, guilds: int = 1, members: int = 500, text_channels: int = 4, seed: int = 1):
+        rng = random.Random(seed)
+        self.http = http
+        self.guilds: List[FakeGuild] = []
+        self.members: List[List[FakeMember]] = []
+        self.channels: List[Dict[str, object]] = []
+        self.roles: List[Dict[str, object]] = []
+        for gi in range(guilds):
+            g = FakeGuild(http, next_id(), f'guild-{gi}')
+            staff = g.add_role('Staff', 10, discord.Permissions(manage_messages=True, moderate_members=True))
+            vip = g.add_role('VIP', 5)
+            no_xp = g.add_role('NoXP', 3)
+            bot_role = g.add_role('Bot', 50, discord.Permissions(administrator=True))
+            g.me = g.add_member('ReplayBot', [bot_role.id], bot=True)
+            chans = {f'general-{i}': g.add_text_channel(f'general-{i}') for i in range(text_channels)}
+            for name in ('counting', 'logs', 'levelup', 'giveaway'):
+                chans[name] = g.add_text_channel(name)
+            voice = [g.add_voice_channel(f'voice-{i}') for i in range(2)]
+            mems = []
+            for ui in range(members):
+                roles = []
+                r = rng.random()
+                if r < 0.03:
+                    roles.append(staff.id)
+                elif r < 0.15:
+                    roles.append(vip.id)
+                elif r < 0.18:
+                    roles.append(no_xp.id)
+                mems.append(g.add_member(f'user-{gi}-{ui}', roles))
+            g.owner_id = mems[0].id if mems else g.me.id
+            # Circa il 5% dei membri in vocale, qualcuno mutato
+            for m in rng.sample(mems, k=max(1, len(mems) // 20)) if mems else []:
+                g.join_voice(m, rng.choice(voice), self_mute=rng.random() < 0.2)
+            self.guilds.append(g)
+            self.members.append(mems)
+            self.channels.append(chans)
+            self.roles.append({'staff': staff, 'vip': vip, 'no_xp': no_xp})
+
+
+def generate(world: World, count: int, seed: int = 1, mix: Dict[str, int] = None, voice_every: int = 2000,
+             bad_word_rate: float = 0.01, invite_rate: float = 0.004) -> Iterator[dict]:
+    """Flusso sintetico deterministico (stesso seed, stessi eventi)."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    # Stato del counting per guild: (ultimo numero, ultimo autore)
+    counting = [(0, None) for _ in world.guilds]
+    general = [[c for c in chans if c.startswith('general-')] for chans in world.channels]
+
+    for n in range(count):
+        if voice_every and n and n % voice_every == 0:
+            yield {'t': 'voice_tick'}
+        gi = rng.randrange(len(world.guilds))
+        nm = len(world.members[gi])
+        ui = rng.randrange(nm)
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'message':
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+            r = rng.random()
+            if r < bad_word_rate:
+                text += ' ' + rng.choice(BAD_WORDS)
+            elif r < bad_word_rate + invite_rate:
+                text += ' discord.gg/abc' + str(rng.randint(0, 999))
+            yield {'t': 'message', 'g': gi, 'c': rng.choice(general[gi]), 'u': ui, 'text': text}
+        elif kind == 'counting':
+            last, last_user = counting[gi]
+            if rng.random() < 0.93:
+                # Conteggio corretto da un utente diverso dal precedente
+                while nm > 1 and ui == last_user:
+                    ui = rng.randrange(nm)
+                counting[gi] = (last + 1, ui)
+                text = str(last + 1)
+            else:
+                counting[gi] = (0, None)
+                text = str(last + rng.randint(2, 5))
+            yield {'t': 'message', 'g': gi, 'c': 'counting', 'u': ui, 'text': text}
+        elif kind == 'message_delete':
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+            yield {'t': 'message_delete', 'g': gi, 'c': rng.choice(general[gi]), 'u': ui, 'text': text}
+        elif kind == 'member_update':
+            yield {'t': 'member_update', 'g': gi, 'u': ui, 'change': rng.choice(('nick', 'roles', 'timeout'))}
+        elif kind == 'giveaway_click':
+            yield {'t': 'giveaway_click', 'g': gi, 'u': ui}
+
+
+def save_events(path: str, events) -> int:
+    n = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for ev in events:
+            f.write(json.dumps(ev, ensure_ascii=False) + '\n')
+            n += 1
+    return n
+
+
+def load_events(path: str) -> List[dict]:
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
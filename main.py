@@ -3,6 +3,12 @@ from discord.ext import commands
 import os
 from dotenv import load_dotenv
 
+from cog_loader import CogLoader
+from command_sync import CommandSyncer
+from cogs.json_store import store
+from cogs.console_logger import bind_event_context
+from cogs.metrics import InstrumentedCommandTree, timed_listener
+
 load_dotenv()
 
 intents = discord.Intents.default()
@@ -15,71 +21,60 @@ intents.guild_scheduled_events = True
 intents.presences = True
 
 class MyBot(commands.Bot):
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        # Ogni listener passa da qui (nel proprio task): contesto per i log e durata per /metrics
+        bind_event_context(event_name, args)
+        await super()._run_event(timed_listener(coro, event_name), event_name, *args, **kwargs)
+
     async def setup_hook(self):
-        # Carica dinamicamente solo i cogs che hanno una funzione setup
-        initial_extensions = []
-        try:
-            cogs_dir = os.path.join(os.path.dirname(__file__), 'cogs')
-            for fname in os.listdir(cogs_dir):
-                if not fname.endswith('.py'):
-                    continue
-                if fname.startswith('_'):
-                    continue
-                name = fname[:-3]
-                # escludi moduli helper non-cog
-                if name in { 'console_logger', '__init__' }:
-                    continue
-                fpath = os.path.join(cogs_dir, fname)
-                try:
-                    with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                        src = f.read()
-                    if 'async def setup' in src or 'def setup(' in src:
-                        initial_extensions.append(f'cogs.{name}')
-                except Exception:
-                    continue
-        except Exception as e:
-            print(f"⚠️ Scansione cogs fallita: {e}")
+        # Carica i cogs indicati in cogs_manifest.json (in parallelo, con tempi per cog)
+        self.cog_loader = CogLoader(self)
+        await self.cog_loader.load_initial()
 
-        for ext in initial_extensions:
-            try:
-                await self.load_extension(ext)
-                print(f"✅ Estensione caricata: {ext}")
-            except Exception as e:
-                print(f"❌ Errore nel caricare {ext}: {e}")
+        # Sync dei comandi solo se le definizioni sono cambiate dall'ultimo avvio
+        self.command_syncer = CommandSyncer(self)
+        # Con cogs lazy il sync globale avviene in on_ready, ad albero completo
+        if not self.cog_loader.lazy:
+            await self._sync_global()
 
-        # Riepilogo cogs caricati
+    async def _sync_global(self):
         try:
-            loaded = [e for e in initial_extensions if e in self.extensions]
-            print(f"📦 Totale cogs caricati: {len(loaded)}")
-            if loaded:
-                print("➡️  " + ", ".join(loaded))
+            synced = await self.command_syncer.sync()
+            if synced is None:
+                print("🌍 Comandi globali invariati: sync saltato")
+            else:
+                print(f"🌍 Comandi globali sincronizzati: {synced}")
         except Exception as e:
-            print(f"⚠️ Impossibile mostrare riepilogo cogs: {e}")
+            print(f"❌ Errore nella sincronizzazione globale: {e}")
 
-        # SYNC GLOBALE DEI COMANDI
+    async def close(self):
+        # Salva i documenti JSON ancora in memoria prima di chiudere
         try:
-            synced = await self.tree.sync()
-            print(f"🌍 Comandi globali sincronizzati: {len(synced)}")
+            await store.close()
         except Exception as e:
-            print(f"❌ Errore nella sincronizzazione globale: {e}")
+            print(f"⚠️ Salvataggio dati allo shutdown fallito: {e}")
+        await super().close()
 
     async def on_ready(self):
         print(f"🤖 Logged in as {self.user} ({self.user.id})")
         print("Bot pronto!")
+        # Cogs lazy: caricati una sola volta, dopo la connessione
+        try:
+            await self.cog_loader.load_lazy()
+        except Exception as e:
+            print(f"⚠️ Caricamento cogs lazy fallito: {e}")
+        # on_ready scatta anche ai reconnect: senza modifiche non parte nessuna chiamata REST
+        await self._sync_global()
         # Fast guild sync to make slash commands appear immediately in joined guilds
         try:
-            for g in self.guilds:
-                try:
-                    self.tree.copy_global_to(guild=g)
-                    await self.tree.sync(guild=g)
-                    print(f"⚡ Comandi sincronizzati velocemente per la guild: {g.name} ({g.id})")
-                except Exception as e:
-                    print(f"⚠️ Guild sync fallita per {g.id}: {e}")
+            synced, skipped = await self.command_syncer.sync_guilds(self.guilds)
+            if skipped:
+                print(f"⚡ Guild con comandi invariati (sync saltato): {skipped}")
         except Exception as e:
             print(f"⚠️ Fast guild sync errore: {e}")
 
 
-bot = MyBot(command_prefix='!', intents=intents)
+bot = MyBot(command_prefix='!', intents=intents, tree_cls=InstrumentedCommandTree)
 
 
 if __name__ == '__main__':